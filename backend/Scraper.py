@@ -5,268 +5,777 @@ IMPORTANTE: Rispetta sempre i termini di servizio dei siti.
 Usa rate limiting e considera ScraperAPI per uso commerciale.
 """
 
-import requests
-from bs4 import BeautifulSoup
-import time
-import random
-from typing import List, Dict, Optional
+import argparse
+import asyncio
+import json
 import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlencode
 
-class PropertyScraper:
-    """Scraper per portali immobiliari italiani"""
-    
-    def __init__(self, use_scraper_api: bool = False):
+import httpx
+from bs4 import BeautifulSoup
+from lxml import etree
+
+import cassette
+import metrics
+from httpcache import HTTPCache
+from ratelimit import HostRateLimiter, backoff_delay
+
+# Limiti di default (sovrascrivibili da env o dal costruttore)
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+SCRAPER_MAX_CONNECTIONS = int(os.getenv("SCRAPER_MAX_CONNECTIONS", "10"))
+SCRAPER_TIMEOUT_SECONDS = float(os.getenv("SCRAPER_TIMEOUT_SECONDS", "30"))
+
+# Cache HTTP su disco ("" per disattivarla)
+SCRAPER_CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR", "http_cache")
+SCRAPER_CACHE_MAX_MB = int(os.getenv("SCRAPER_CACHE_MAX_MB", "200"))
+SCRAPER_CACHE_TTL_SECONDS = float(os.getenv("SCRAPER_CACHE_TTL_SECONDS", "900"))
+
+# Parser delle pagine di risultati: "lxml" (veloce) o "bs4"
+SCRAPER_PARSER = os.getenv("SCRAPER_PARSER", "lxml")
+
+# Richieste/secondo per host (si adatta alle risposte del sito) e burst massimo
+SCRAPER_RATE = float(os.getenv("SCRAPER_RATE", "0.5"))
+SCRAPER_BURST = int(os.getenv("SCRAPER_BURST", "2"))
+SCRAPER_MAX_RATE = float(os.getenv("SCRAPER_MAX_RATE", "2"))
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+
+def build_idealista_url(
+    city: str,
+    max_price: Optional[int],
+    min_surface: int = 50,
+    condition: str = "da_ristrutturare",
+    page: int = 1
+) -> str:
+    """URL di una pagina di risultati Idealista (la pagina N è /lista-N.htm, max_price None = senza budget)"""
+    city_slug = city.lower().replace(" ", "-")
+    base_url = f"https://www.idealista.it/vendita-case/{city_slug}/"
+    if page > 1:
+        base_url += f"lista-{page}.htm"
+
+    params = {'superficieMinima': min_surface}
+    if max_price is not None:
+        params['prezzoMassimo'] = max_price
+
+    # Aggiungi filtro ristrutturazione se richiesto
+    if condition == "da_ristrutturare":
+        params['stato'] = 'da-ristrutturare'
+
+    return f"{base_url}?{urlencode(params)}"
+
+
+# Pattern ed espressioni XPath compilati una volta sola
+SURFACE_RE = re.compile(r'(\d+)\s*(?:m²|mq)')
+ROOMS_RE = re.compile(r'(\d+)\s*(?:locali|vani)')
+NON_DIGITS_RE = re.compile(r'\D+')
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+HTML_PARSER = etree.HTMLParser(remove_comments=True, remove_pis=True)
+ARTICLES_XPATH = etree.XPath(f"//article[{_has_class('item')}]")
+TITLE_XPATH = etree.XPath(f"(.//*[{_has_class('item-link')}])[1]")
+PRICE_XPATH = etree.XPath(f"(.//*[{_has_class('item-price')}])[1]")
+DETAILS_XPATH = etree.XPath(f"(.//*[{_has_class('item-detail')}])[1]")
+NEXT_PAGE_XPATH = etree.XPath(f"//*[{_has_class('pagination')}]//li[{_has_class('next')}]/a[@href]")
+
+
+def _build_property(title: str, price_text: str, details_text: str, link: str, city: str, condition: str) -> Dict:
+    """Dict dell'annuncio a partire dai testi estratti (comune a tutti i parser)"""
+    price = int(NON_DIGITS_RE.sub('', price_text))
+
+    # Cerca metri quadri
+    surface = 80  # Default
+    if 'm²' in details_text or 'mq' in details_text:
+        match = SURFACE_RE.search(details_text)
+        if match:
+            surface = int(match.group(1))
+
+    # Cerca numero locali
+    rooms = 3  # Default
+    if 'locali' in details_text or 'vani' in details_text:
+        match = ROOMS_RE.search(details_text)
+        if match:
+            rooms = int(match.group(1))
+
+    # URL annuncio
+    if link and not link.startswith('http'):
+        link = f"https://www.idealista.it{link}"
+
+    return {
+        "title": title,
+        "price": price,
+        "surface": surface,
+        "rooms": rooms,
+        "bathrooms": 1,  # Default
+        "floor": None,
+        "condition": condition,
+        "address": title,  # Approssimativo
+        "zone": _zone_from_title(title, city),
+        "url": link,
+        "description": details_text,
+        "price_per_sqm": round(price / surface) if surface else 0,
+        "source": "idealista"
+    }
+
+
+def _zone_from_title(title: str, city: str) -> str:
+    """Zona dal titolo ("Attico in Via Toledo, 94, Vomero, Napoli" → "Vomero"), altrimenti la città"""
+    parts = [part.strip() for part in title.split(',')]
+    if len(parts) >= 3 and parts[-1].lower() == city.lower() and not parts[-2].isdigit():
+        return parts[-2]
+    return city
+
+
+def _text(element) -> str:
+    """Come get_text(strip=True) di BeautifulSoup"""
+    return ''.join(chunk.strip() for chunk in element.itertext())
+
+
+def parse_idealista_lxml(html: str, city: str, condition: str) -> List[Dict]:
+    """Parser veloce: albero lxml e XPath precompilati"""
+    if not html or not html.strip():
+        return []
+    root = etree.fromstring(html, HTML_PARSER)
+    if root is None:
+        return []
+
+    properties = []
+
+    # Selettori (potrebbero cambiare - verificare regolarmente)
+    for article in ARTICLES_XPATH(root):
+        try:
+            title_elems = TITLE_XPATH(article)
+            price_elems = PRICE_XPATH(article)
+            if not title_elems or not price_elems:
+                continue
+            details_elems = DETAILS_XPATH(article)
+
+            title_elem = title_elems[0]
+            properties.append(_build_property(
+                _text(title_elem),
+                _text(price_elems[0]),
+                _text(details_elems[0]) if details_elems else "",
+                title_elem.get('href', ''),
+                city,
+                condition
+            ))
+
+        except Exception as e:
+            print(f"⚠️ Error parsing property: {e}")
+            continue
+
+    return properties
+
+
+def parse_idealista_bs4(html: str, city: str, condition: str) -> List[Dict]:
+    """Parser BeautifulSoup (più lento, utile come riferimento nei benchmark)"""
+    soup = BeautifulSoup(html, 'lxml')
+
+    properties = []
+
+    # Selettori CSS (potrebbero cambiare - verificare regolarmente)
+    # Nota: Questi sono approssimativi, verifica sul sito reale
+    for article in soup.select('article.item'):
+        try:
+            # Estrai dati (adatta i selettori al sito reale)
+            title_elem = article.select_one('.item-link')
+            price_elem = article.select_one('.item-price')
+            details_elem = article.select_one('.item-detail')
+
+            if not title_elem or not price_elem:
+                continue
+
+            properties.append(_build_property(
+                title_elem.get_text(strip=True),
+                price_elem.get_text(strip=True),
+                details_elem.get_text(strip=True) if details_elem else "",
+                title_elem.get('href', ''),
+                city,
+                condition
+            ))
+
+        except Exception as e:
+            print(f"⚠️ Error parsing property: {e}")
+            continue
+
+    return properties
+
+
+PARSERS = {
+    "lxml": parse_idealista_lxml,
+    "bs4": parse_idealista_bs4,
+}
+
+
+def parse_idealista_page(html: str, city: str, condition: str, parser: str = SCRAPER_PARSER) -> List[Dict]:
+    """Estrae gli annunci da una pagina di risultati Idealista"""
+    return PARSERS[parser](html, city, condition)
+
+
+def has_next_page(html: str) -> bool:
+    """True se la paginazione della pagina ha un link alla pagina successiva"""
+    if not html or not html.strip():
+        return False
+    root = etree.fromstring(html, HTML_PARSER)
+    return root is not None and bool(NEXT_PAGE_XPATH(root))
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+    """Cursore "pagina:offset" → (pagina, annunci già letti in quella pagina)"""
+    if not cursor:
+        return 1, 0
+    page, _, offset = cursor.partition(":")
+    return max(int(page), 1), max(int(offset or 0), 0)
+
+
+class AsyncPropertyScraper:
+    """
+    Engine di scraping asyncio con un unico client HTTP (pool keep-alive).
+
+    Le pagine di risultati e le città vengono scaricate in parallelo, ma mai
+    più di `concurrency` richieste alla volta; il ritmo verso ogni portale è
+    deciso dal rate limiter per host, condiviso da tutte le richieste.
+    """
+
+    def __init__(
+        self,
+        use_scraper_api: bool = False,
+        concurrency: int = SCRAPER_CONCURRENCY,
+        max_connections: int = SCRAPER_MAX_CONNECTIONS,
+        timeout: float = SCRAPER_TIMEOUT_SECONDS,
+        limiter: Optional[HostRateLimiter] = None,
+        cache: Optional[HTTPCache] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
         self.use_scraper_api = use_scraper_api
         self.scraper_api_key = os.getenv("SCRAPER_API_KEY", "")
-        
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
-    
-    def _make_request(self, url: str, max_retries: int = 3) -> Optional[str]:
-        """Fa richiesta HTTP con retry e rate limiting"""
-        
+        self.limiter = limiter or HostRateLimiter(rate=SCRAPER_RATE, burst=SCRAPER_BURST, max_rate=SCRAPER_MAX_RATE)
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(concurrency)
+        if transport is None:
+            # Pool keep-alive, con sopra la cassetta se SCRAPER_CASSETTE/CASSETTE_MODE lo chiedono
+            transport = cassette.from_env(httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            ), "scraper")
+        self._client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=transport
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _get(self, url: str, headers: Optional[dict] = None) -> httpx.Response:
+        if self.use_scraper_api and self.scraper_api_key:
+            # Usa ScraperAPI per evitare blocchi
+            params = {
+                'api_key': self.scraper_api_key,
+                'url': url,
+                'country_code': 'it'
+            }
+            if headers:
+                params['keep_headers'] = 'true'  # inoltra gli header condizionali al sito
+            return await self._client.get('http://api.scraperapi.com/', params=params, headers=headers, timeout=60)
+        # Richiesta diretta
+        return await self._client.get(url, headers=headers)
+
+    async def fetch(self, url: str, max_retries: int = 3) -> Optional[str]:
+        """
+        Scarica una pagina con retry e rate limiting (None se fallisce).
+
+        Con la cache HTTP attiva una pagina fresca non tocca la rete; una
+        scaduta viene rivalidata con una GET condizionale.
+        """
+        start = time.perf_counter()
+        body, outcome = await self._fetch(url, max_retries)
+        metrics.SCRAPER_FETCH_SECONDS.observe(time.perf_counter() - start, host=self.limiter.host(url), status=outcome)
+        return body
+
+    async def _fetch(self, url: str, max_retries: int) -> Tuple[Optional[str], str]:
+        """Come fetch, ma ritorna anche l'esito per le metriche ("cache", "200", "304", "404", "failed", ...)"""
+        cached = await asyncio.to_thread(self.cache.lookup, url) if self.cache else None
+        if cached and cached["fresh"]:
+            return cached["body"], "cache"
+        conditional = HTTPCache.conditional_headers(cached)
+
         for attempt in range(max_retries):
-            try:
-                if self.use_scraper_api and self.scraper_api_key:
-                    # Usa ScraperAPI per evitare blocchi
-                    params = {
-                        'api_key': self.scraper_api_key,
-                        'url': url,
-                        'country_code': 'it'
-                    }
-                    response = requests.get(
-                        'http://api.scraperapi.com/',
-                        params=params,
-                        timeout=60
-                    )
-                else:
-                    # Richiesta diretta
-                    response = requests.get(
-                        url,
-                        headers=self.headers,
-                        timeout=30
-                    )
-                
-                if response.status_code == 200:
-                    # Rate limiting: attendi tra richieste
-                    time.sleep(random.uniform(2, 4))
-                    return response.text
-                
-                elif response.status_code == 429:  # Too Many Requests
-                    wait_time = 10 * (attempt + 1)
-                    print(f"⚠️ Rate limit hit, waiting {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                
+            # Il token va preso prima dello slot: chi aspetta il turno non occupa connessioni
+            await self.limiter.acquire(url)
+
+            async with self._semaphore:
+                try:
+                    response = await self._get(url, conditional)
+                except httpx.HTTPError as e:
+                    self.limiter.record(url, None)
+                    metrics.SCRAPER_RESPONSES.inc(host=self.limiter.host(url), status="error")
+                    print(f"❌ Error: {e}, attempt {attempt+1}/{max_retries}")
+                    response = None
+
+            if response is not None:
+                status = response.status_code
+                self.limiter.record(url, status, response.headers.get("Retry-After"))
+                metrics.SCRAPER_RESPONSES.inc(host=self.limiter.host(url), status=str(status))
+
+                if status == 200:
+                    if self.cache:
+                        await asyncio.to_thread(self.cache.store, url, response.headers, response.text)
+                    return response.text, "200"
+
+                if status == 304 and cached:
+                    await asyncio.to_thread(self.cache.revalidate, url, response.headers)
+                    return cached["body"], "304"
+
+                if status == 429:  # Too Many Requests: il limiter rispetta Retry-After
+                    print(f"⚠️ Rate limit hit su {self.limiter.host(url)}, attempt {attempt+1}/{max_retries}")
+                elif status < 500:
+                    print(f"❌ Status {status}, pagina non disponibile")
+                    return None, str(status)
                 else:
-                    print(f"❌ Status {response.status_code}, attempt {attempt+1}/{max_retries}")
-                    time.sleep(2)
-                    continue
-            
-            except Exception as e:
-                print(f"❌ Error: {e}, attempt {attempt+1}/{max_retries}")
-                time.sleep(2)
-        
-        return None
-    
-    def scrape_idealista(
+                    print(f"❌ Status {status}, attempt {attempt+1}/{max_retries}")
+
+            if attempt < max_retries - 1:
+                await asyncio.sleep(backoff_delay(attempt))
+
+        return None, "failed"
+
+    async def scrape_city(
         self,
         city: str,
         max_price: int,
         min_surface: int = 50,
         property_type: str = "appartamenti",
-        condition: str = "da_ristrutturare"
+        condition: str = "da_ristrutturare",
+        pages: int = 1,
+        max_results: Optional[int] = 10
     ) -> List[Dict]:
         """
-        Scraping Idealista
-        
+        Scraping Idealista di `pages` pagine di risultati in parallelo
+
         NOTA: Questo è un esempio educativo. Per uso commerciale:
         1. Contatta Idealista per API ufficiali
         2. Usa ScraperAPI/Bright Data
         3. Rispetta robots.txt e rate limits
         """
-        
-        # Normalizza nome città
-        city_slug = city.lower().replace(" ", "-")
-        
-        # Costruisci URL Idealista
-        base_url = f"https://www.idealista.it/vendita-case/{city_slug}/"
-        
-        params = {
-            'prezzoMassimo': max_price,
-            'superficieMinima': min_surface,
-        }
-        
-        # Aggiungi filtro ristrutturazione se richiesto
-        if condition == "da_ristrutturare":
-            params['stato'] = 'da-ristrutturare'
-        
-        url = f"{base_url}?{urlencode(params)}"
-        
-        print(f"🔍 Scraping: {url}")
-        
-        html = self._make_request(url)
-        
-        if not html:
-            print("❌ Scraping fallito")
-            return self._get_mock_data(city, max_price)
-        
-        soup = BeautifulSoup(html, 'lxml')
-        
+        urls = [build_idealista_url(city, max_price, min_surface, condition, page) for page in range(1, pages + 1)]
+        for url in urls:
+            print(f"🔍 Scraping: {url}")
+
+        pages_html = await asyncio.gather(*(self.fetch(url) for url in urls))
+
         properties = []
-        
-        # Selettori CSS (potrebbero cambiare - verificare regolarmente)
-        # Nota: Questi sono approssimativi, verifica sul sito reale
-        articles = soup.select('article.item')
-        
-        for article in articles[:10]:  # Limita a 10 risultati
-            try:
-                # Estrai dati (adatta i selettori al sito reale)
-                title_elem = article.select_one('.item-link')
-                price_elem = article.select_one('.item-price')
-                details_elem = article.select_one('.item-detail')
-                
-                if not title_elem or not price_elem:
-                    continue
-                
-                title = title_elem.get_text(strip=True)
-                
-                # Parse prezzo
-                price_text = price_elem.get_text(strip=True)
-                price = int(''.join(filter(str.isdigit, price_text)))
-                
-                # Parse dettagli (superficie, locali, etc)
-                details_text = details_elem.get_text(strip=True) if details_elem else ""
-                
-                # Cerca metri quadri
-                surface = 80  # Default
-                if 'm²' in details_text or 'mq' in details_text:
-                    import re
-                    match = re.search(r'(\d+)\s*(?:m²|mq)', details_text)
-                    if match:
-                        surface = int(match.group(1))
-                
-                # Cerca numero locali
-                rooms = 3  # Default
-                if 'locali' in details_text or 'vani' in details_text:
-                    import re
-                    match = re.search(r'(\d+)\s*(?:locali|vani)', details_text)
-                    if match:
-                        rooms = int(match.group(1))
-                
-                # URL annuncio
-                link = title_elem.get('href', '')
-                if link and not link.startswith('http'):
-                    link = f"https://www.idealista.it{link}"
-                
-                property_data = {
-                    "title": title,
-                    "price": price,
-                    "surface": surface,
-                    "rooms": rooms,
-                    "bathrooms": 1,  # Default
-                    "floor": None,
-                    "condition": condition,
-                    "address": title,  # Approssimativo
-                    "zone": city,
-                    "url": link,
-                    "description": details_text,
-                    "price_per_sqm": round(price / surface) if surface else 0,
-                    "source": "idealista"
-                }
-                
-                properties.append(property_data)
-            
-            except Exception as e:
-                print(f"⚠️ Error parsing property: {e}")
+        seen = set()
+        for html in pages_html:
+            if not html:
                 continue
-        
+            for prop in parse_idealista_page(html, city, condition):
+                if prop["url"] in seen:
+                    continue
+                seen.add(prop["url"])
+                properties.append(prop)
+
+        if max_results is not None:
+            properties = properties[:max_results]
+
         if properties:
-            print(f"✅ Trovati {len(properties)} immobili")
+            print(f"✅ {city}: trovati {len(properties)} immobili")
             return properties
+
+        print(f"⚠️ {city}: nessun immobile trovato, uso dati mock")
+        return get_mock_data(city, max_price)
+
+    async def scrape_cities(self, cities: List[str], **kwargs) -> Dict[str, List[Dict]]:
+        """Scraping di più città in parallelo (stessi filtri per tutte)"""
+        results = await asyncio.gather(*(self.scrape_city(city, **kwargs) for city in cities))
+        return dict(zip(cities, results))
+
+    def crawl_city(
+        self,
+        city: str,
+        max_price: int,
+        min_surface: int = 50,
+        condition: str = "da_ristrutturare",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        max_pages: Optional[int] = None
+    ) -> "CityCrawl":
+        """
+        Async iterator sugli annunci di una città seguendo la paginazione.
+
+            crawl = scraper.crawl_city("Napoli", 200000, limit=100)
+            async for prop in crawl:
+                ...
+            crawl.cursor  # per riprendere da qui in un secondo momento
+        """
+        return CityCrawl(self, city, max_price, min_surface, condition, limit, cursor, max_pages)
+
+
+class CityCrawl:
+    """
+    Crawl a pagine di una città: gli annunci vengono prodotti man mano che le
+    pagine sono analizzate. In memoria c'è al più la pagina corrente più la
+    successiva (scaricata in anticipo mentre si consuma la corrente), qualunque
+    sia la dimensione del crawl.
+    """
+
+    def __init__(
+        self,
+        scraper: AsyncPropertyScraper,
+        city: str,
+        max_price: int,
+        min_surface: int = 50,
+        condition: str = "da_ristrutturare",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        max_pages: Optional[int] = None
+    ):
+        self.scraper = scraper
+        self.city = city
+        self.max_price = max_price
+        self.min_surface = min_surface
+        self.condition = condition
+        self.limit = limit
+        self.max_pages = max_pages
+        self.page, self.offset = parse_cursor(cursor)
+        self.pages_read = 0
+        self.yielded = 0
+        self.finished = False
+        self._buffer: List[Dict] = []
+        self._has_next = True
+        self._loaded = False
+        self._prefetch: Optional[asyncio.Task] = None
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Dove riprendere il crawl (None se non c'è altro da leggere)"""
+        if self.finished:
+            return None
+        return f"{self.page}:{self.offset}"
+
+    def _url(self, page: int) -> str:
+        return build_idealista_url(self.city, self.max_price, self.min_surface, self.condition, page)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict:
+        if self.limit is not None and self.yielded >= self.limit:
+            await self.aclose(finished=False)
+            raise StopAsyncIteration
+
+        while not self._buffer:
+            if not await self._next_page():
+                await self.aclose()
+                raise StopAsyncIteration
+
+        self.offset += 1
+        self.yielded += 1
+        return self._buffer.pop(0)
+
+    async def _next_page(self) -> bool:
+        if self._loaded:
+            # Pagina corrente esaurita: si passa alla successiva
+            if not self._has_next or (self.max_pages is not None and self.pages_read >= self.max_pages):
+                return False
+            self.page += 1
+            self.offset = 0
+
+        if self._prefetch is not None:
+            html = await self._prefetch
+            self._prefetch = None
         else:
-            print("⚠️ Nessun immobile trovato, uso dati mock")
-            return self._get_mock_data(city, max_price)
+            print(f"🔍 Scraping: {self._url(self.page)}")
+            html = await self.scraper.fetch(self._url(self.page))
+
+        self._loaded = True
+        self.pages_read += 1
+        if not html:
+            self._has_next = False
+            return False
+
+        self._has_next = has_next_page(html)
+        if self._has_next and (self.max_pages is None or self.pages_read < self.max_pages):
+            self._prefetch = asyncio.ensure_future(self.scraper.fetch(self._url(self.page + 1)))
+
+        self._buffer = parse_idealista_page(html, self.city, self.condition)[self.offset:]
+        return True
+
+    async def aclose(self, finished: bool = True):
+        """Interrompe il crawl (annulla l'eventuale pagina in prefetch)"""
+        self.finished = self.finished or finished
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+            self._prefetch = None
+
+
+class ScraperRunner:
+    """
+    Tiene un AsyncPropertyScraper su un event loop dedicato in background.
+
+    Il client HTTP (e il suo pool) resta legato a quel loop: i worker
+    sincroni usano `run(...)`, gli endpoint async `await arun(...)` senza
+    bloccare l'event loop di FastAPI.
+    """
+
+    def __init__(self, **scraper_kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="bighouse-scraper", daemon=True)
+        self._thread.start()
+        self.scraper: AsyncPropertyScraper = self._submit(self._create, scraper_kwargs).result()
+
+    @staticmethod
+    async def _create(scraper_kwargs: dict) -> AsyncPropertyScraper:
+        return AsyncPropertyScraper(**scraper_kwargs)
+
+    def _submit(self, fn: Callable, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), self._loop)
+
+    def run(self, method: str, *args, **kwargs) -> Any:
+        """Esegue un metodo dello scraper e attende il risultato (da thread sincroni)"""
+        return self._submit(getattr(self.scraper, method), *args, **kwargs).result()
+
+    async def arun(self, method: str, *args, **kwargs) -> Any:
+        """Come `run`, ma da codice async"""
+        return await asyncio.wrap_future(self._submit(getattr(self.scraper, method), *args, **kwargs))
+
+    def iterate(self, method: str, *args, **kwargs) -> Iterator[Any]:
+        """Consuma da un thread sincrono un async iterator dello scraper (es. crawl_city)"""
+        iterator = self._submit(self._create_iterator, method, args, kwargs).result()
+        try:
+            while True:
+                try:
+                    yield self._submit(iterator.__anext__).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._submit(iterator.aclose, False).result()
+
+    async def _create_iterator(self, method: str, args: tuple, kwargs: dict):
+        return getattr(self.scraper, method)(*args, **kwargs)
+
+    def close(self):
+        self._submit(self.scraper.aclose).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class PropertyScraper:
+    """Scraper per portali immobiliari italiani (interfaccia sincrona)"""
+
+    def __init__(self, use_scraper_api: bool = False, use_cache: bool = True):
+        self.use_scraper_api = use_scraper_api
+        self.cache = create_http_cache() if use_cache else None
+
+    def scrape_idealista(
+        self,
+        city: str,
+        max_price: int,
+        min_surface: int = 50,
+        property_type: str = "appartamenti",
+        condition: str = "da_ristrutturare",
+        pages: int = 1
+    ) -> List[Dict]:
+        """Scraping Idealista (vedi AsyncPropertyScraper.scrape_city)"""
+
+        async def scrape():
+            async with AsyncPropertyScraper(use_scraper_api=self.use_scraper_api, cache=self.cache) as scraper:
+                return await scraper.scrape_city(city, max_price, min_surface, property_type, condition, pages)
+
+        return asyncio.run(scrape())
+
+    def iter_idealista(
+        self,
+        city: str,
+        max_price: int,
+        min_surface: int = 50,
+        condition: str = "da_ristrutturare",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """Generatore sugli annunci seguendo la paginazione (vedi AsyncPropertyScraper.crawl_city)"""
+        loop = asyncio.new_event_loop()
+        scraper = AsyncPropertyScraper(use_scraper_api=self.use_scraper_api, cache=self.cache)
+        crawl = scraper.crawl_city(city, max_price, min_surface, condition, limit, cursor)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(crawl.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(crawl.aclose(finished=False))
+            loop.run_until_complete(scraper.aclose())
+            loop.close()
+
+
+def get_mock_data(city: str, max_price: Optional[int]) -> List[Dict]:
+    """Dati mock per testing/fallback"""
+    max_price = max_price or 200000  # senza budget: prezzi di esempio
     
-    def _get_mock_data(self, city: str, max_price: int) -> List[Dict]:
-        """Dati mock per testing/fallback"""
-        
-        mock_properties = [
-            {
-                "title": f"Appartamento da ristrutturare - Centro {city}",
-                "price": int(max_price * 0.85),
-                "surface": 85,
-                "rooms": 3,
-                "bathrooms": 1,
-                "floor": 2,
-                "condition": "da ristrutturare",
-                "address": f"Via Principale, {city}",
-                "zone": f"Centro {city}",
-                "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-1",
-                "description": "Appartamento in posizione centrale, necessita ristrutturazione completa. Ottimo per investimento.",
-                "price_per_sqm": int(max_price * 0.85 / 85),
-                "source": "mock"
-            },
-            {
-                "title": f"Trilocale da rinnovare - Zona Residenziale",
-                "price": int(max_price * 0.92),
-                "surface": 90,
-                "rooms": 3,
-                "bathrooms": 1,
-                "floor": 4,
-                "condition": "da ristrutturare",
-                "address": f"Via Secondaria, {city}",
-                "zone": f"{city} Nord",
-                "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-2",
-                "description": "Luminoso trilocale con balcone, da ristrutturare. Zona servita.",
-                "price_per_sqm": int(max_price * 0.92 / 90),
-                "source": "mock"
-            },
-            {
-                "title": f"Bilocale con potenziale - Periferia",
-                "price": int(max_price * 0.65),
-                "surface": 60,
-                "rooms": 2,
-                "bathrooms": 1,
-                "floor": 1,
-                "condition": "da ristrutturare",
-                "address": f"Via Terziaria, {city}",
-                "zone": f"{city} Sud",
-                "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-3",
-                "description": "Bilocale da ristrutturare completamente. Prezzo competitivo, ottimo per prima casa.",
-                "price_per_sqm": int(max_price * 0.65 / 60),
-                "source": "mock"
-            }
-        ]
-        
-        return mock_properties
+    mock_properties = [
+        {
+            "title": f"Appartamento da ristrutturare - Centro {city}",
+            "price": int(max_price * 0.85),
+            "surface": 85,
+            "rooms": 3,
+            "bathrooms": 1,
+            "floor": 2,
+            "condition": "da ristrutturare",
+            "address": f"Via Principale, {city}",
+            "zone": f"Centro {city}",
+            "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-1",
+            "description": "Appartamento in posizione centrale, necessita ristrutturazione completa. Ottimo per investimento.",
+            "price_per_sqm": int(max_price * 0.85 / 85),
+            "source": "mock"
+        },
+        {
+            "title": f"Trilocale da rinnovare - Zona Residenziale",
+            "price": int(max_price * 0.92),
+            "surface": 90,
+            "rooms": 3,
+            "bathrooms": 1,
+            "floor": 4,
+            "condition": "da ristrutturare",
+            "address": f"Via Secondaria, {city}",
+            "zone": f"{city} Nord",
+            "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-2",
+            "description": "Luminoso trilocale con balcone, da ristrutturare. Zona servita.",
+            "price_per_sqm": int(max_price * 0.92 / 90),
+            "source": "mock"
+        },
+        {
+            "title": f"Bilocale con potenziale - Periferia",
+            "price": int(max_price * 0.65),
+            "surface": 60,
+            "rooms": 2,
+            "bathrooms": 1,
+            "floor": 1,
+            "condition": "da ristrutturare",
+            "address": f"Via Terziaria, {city}",
+            "zone": f"{city} Sud",
+            "url": f"https://www.idealista.it/immobile/mock-{city.lower()}-3",
+            "description": "Bilocale da ristrutturare completamente. Prezzo competitivo, ottimo per prima casa.",
+            "price_per_sqm": int(max_price * 0.65 / 60),
+            "source": "mock"
+        }
+    ]
+    
+    return mock_properties
 
 # ═══════════════════════════════════════════════════════════════════════
-# ESEMPIO DI USO
+# CLI - CRAWL IN BATCH
 # ═══════════════════════════════════════════════════════════════════════
 
-if __name__ == "__main__":
-    # Test scraper
-    scraper = PropertyScraper(use_scraper_api=False)
-    
-    properties = scraper.scrape_idealista(
-        city="Napoli",
-        max_price=200000,
-        min_surface=70,
-        condition="da_ristrutturare"
+def create_http_cache() -> Optional[HTTPCache]:
+    """Cache HTTP configurata da env (None se SCRAPER_CACHE_DIR è vuoto)"""
+    if not SCRAPER_CACHE_DIR:
+        return None
+    return HTTPCache(SCRAPER_CACHE_DIR, max_bytes=SCRAPER_CACHE_MAX_MB * 1024 * 1024, default_ttl=SCRAPER_CACHE_TTL_SECONDS)
+
+
+def create_cli_scraper(args: argparse.Namespace) -> AsyncPropertyScraper:
+    return AsyncPropertyScraper(
+        use_scraper_api=args.scraper_api,
+        concurrency=args.concurrency,
+        limiter=HostRateLimiter(rate=args.rate, burst=args.burst, max_rate=max(args.rate, SCRAPER_MAX_RATE)),
+        cache=None if args.no_cache else create_http_cache()
     )
-    
-    print(f"\n📊 Trovati {len(properties)} immobili:\n")
-    
-    for i, prop in enumerate(properties, 1):
-        print(f"{i}. {prop['title']}")
-        print(f"   💰 Prezzo: €{prop['price']:,} ({prop['price_per_sqm']}€/mq)")
-        print(f"   📏 Superficie: {prop['surface']}mq, {prop['rooms']} locali")
-        print(f"   🔗 {prop['url']}")
-        print()
\ No newline at end of file
+
+
+async def crawl(args: argparse.Namespace) -> Dict[str, List[Dict]]:
+    async with create_cli_scraper(args) as scraper:
+        return await scraper.scrape_cities(
+            args.cities,
+            max_price=args.max_price,
+            min_surface=args.min_surface,
+            condition=args.condition,
+            pages=args.pages,
+            max_results=args.max_results
+        )
+
+
+async def stream_crawl(args: argparse.Namespace, out):
+    """Segue la paginazione città per città scrivendo un annuncio JSON per riga"""
+    async with create_cli_scraper(args) as scraper:
+        for city in args.cities:
+            crawl = scraper.crawl_city(
+                city,
+                args.max_price,
+                args.min_surface,
+                args.condition,
+                limit=args.max_results,
+                cursor=args.cursor
+            )
+            async for prop in crawl:
+                out.write(json.dumps(prop, ensure_ascii=False) + "\n")
+            print(f"📍 {city}: {crawl.yielded} annunci, {crawl.pages_read} pagine, cursore: {crawl.cursor}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # Es: python Scraper.py Napoli Roma Milano --pages 3 --output immobili.json
+    #     python Scraper.py Napoli --stream --max-results 500 --output napoli.jsonl
+    parser = argparse.ArgumentParser(description="Crawl Idealista di una o più città")
+    parser.add_argument("cities", nargs="*", default=["Napoli"])
+    parser.add_argument("--max-price", type=int, default=200000)
+    parser.add_argument("--min-surface", type=int, default=70)
+    parser.add_argument("--condition", default="da_ristrutturare")
+    parser.add_argument("--pages", type=int, default=1, help="pagine di risultati per città")
+    parser.add_argument("--max-results", type=int, default=None, help="annunci massimi per città")
+    parser.add_argument("--concurrency", type=int, default=SCRAPER_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=SCRAPER_RATE, help="richieste/secondo iniziali per host")
+    parser.add_argument("--burst", type=int, default=SCRAPER_BURST)
+    parser.add_argument("--scraper-api", action="store_true", help="usa ScraperAPI (SCRAPER_API_KEY)")
+    parser.add_argument("--no-cache", action="store_true", help="non usare la cache HTTP su disco")
+    parser.add_argument("--output", help="salva i risultati in un file JSON")
+    parser.add_argument("--stream", action="store_true", help="segue tutta la paginazione, output JSON Lines")
+    parser.add_argument("--cursor", help="riprende un crawl --stream da \"pagina:offset\"")
+    args = parser.parse_args()
+
+    if args.stream:
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as out:
+                asyncio.run(stream_crawl(args, out))
+        else:
+            asyncio.run(stream_crawl(args, sys.stdout))
+        sys.exit(0)
+
+    results = asyncio.run(crawl(args))
+
+    for city, properties in results.items():
+        print(f"\n📊 {city}: trovati {len(properties)} immobili:\n")
+
+        for i, prop in enumerate(properties, 1):
+            print(f"{i}. {prop['title']}")
+            print(f"   💰 Prezzo: €{prop['price']:,} ({prop['price_per_sqm']}€/mq)")
+            print(f"   📏 Superficie: {prop['surface']}mq, {prop['rooms']} locali")
+            print(f"   🔗 {prop['url']}")
+            print()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Salvato in {args.output}")
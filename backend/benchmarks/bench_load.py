@@ -0,0 +1,312 @@
+"""
+⏱️ BIG HOUSE — Load test degli endpoint principali
+
+Avvia il server LLM finto (benchmarks/fake_llm.py) e il backend con uvicorn
+in una cartella temporanea (database vuoto, scraper in modalità mock), poi
+manda richieste con N client concorrenti a:
+
+- POST /auth/token          (login, bcrypt)
+- GET  /users/me            (JWT + cache utenti)
+- POST /features/calculate  (crew di 3 agenti + ROI + Monte Carlo)
+- POST /features/deep-research
+
+Per ogni endpoint riporta richieste/secondo, latenza P50/P95/P99, errori e
+chiamate all'LLM per richiesta. I risultati vanno in benchmarks/results/
+(un JSON per esecuzione, con il commit) e vengono confrontati con
+l'esecuzione precedente per vedere le regressioni.
+
+Le richieste AI usano input sempre diversi, così non vengono servite dalla
+cache dei risultati.
+
+Uso (dalla cartella backend):
+    python benchmarks/bench_load.py --concurrency 8 --requests 200 --ai-requests 16
+    python benchmarks/bench_load.py --endpoints users_me calculate --llm-latency 1.0
+    python benchmarks/bench_load.py --target http://localhost:8000   # backend già avviato
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(BACKEND_DIR, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+ENDPOINTS = ["auth_token", "users_me", "calculate", "deep_research"]
+AI_ENDPOINTS = {"calculate", "deep_research"}
+PASSWORD = "bench-password"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str:
+    """Commit corrente (con "-dirty" se ci sono modifiche non committate)"""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_process(args: list, workdir: str, log_name: str, env: dict) -> subprocess.Popen:
+    log = open(os.path.join(workdir, log_name), "w")
+    return subprocess.Popen(args, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo terminato (codice {process.returncode}) prima di essere pronto: {url}")
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} non risponde dopo {timeout:.0f}s")
+
+
+def start_stack(args, workdir: str) -> tuple:
+    """Server LLM finto + backend; ritorna (processi, url backend, url LLM)"""
+    llm_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "PYTHONUNBUFFERED": "1",
+        "OTEL_SDK_DISABLED": "true",
+        "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "DEEPSEEK_API_KEY": "sk-bench",
+        "SCRAPER_MODE": "mock",
+        "SCRAPER_CACHE_DIR": os.path.join(workdir, "http_cache"),
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "CREW_PROCESS": args.crew_process,
+        "JOB_WORKERS": str(args.job_workers),
+    }
+
+    llm = start_process([
+        sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(llm_port),
+        "--latency", str(args.llm_latency), "--tokens-per-second", str(args.llm_tps),
+        "--output-tokens", str(args.llm_output_tokens),
+    ], workdir, "fake_llm.log", env)
+    processes = [llm]
+    wait_ready(f"http://127.0.0.1:{llm_port}/health", llm)
+
+    app = start_process([
+        sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+        "--port", str(app_port), "--log-level", "warning",
+    ], workdir, "backend.log", env)
+    processes.append(app)
+    wait_ready(f"http://127.0.0.1:{app_port}/openapi.json", app)
+    return processes, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{llm_port}"
+
+
+async def setup_users(client: httpx.AsyncClient, count: int) -> list:
+    """Utenti plus (quota illimitata) con il loro token"""
+    run_id = int(time.time())
+    users = []
+    for i in range(count):
+        email = f"bench-{run_id}-{i}@example.com"
+        response = await client.post("/auth/register", json={"email": email, "password": PASSWORD, "name": f"Bench {i}"})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        (await client.post("/billing/upgrade", json={"plan": "plus"}, headers=headers)).raise_for_status()
+        users.append({"email": email, "headers": headers})
+    return users
+
+
+def request_for(endpoint: str, user: dict, i: int) -> dict:
+    """Argomenti di client.request per l'i-esima richiesta"""
+    if endpoint == "auth_token":
+        return {"method": "POST", "url": "/auth/token", "data": {"username": user["email"], "password": PASSWORD}}
+    if endpoint == "users_me":
+        return {"method": "GET", "url": "/users/me", "headers": user["headers"]}
+    if endpoint == "calculate":
+        return {"method": "POST", "url": "/features/calculate", "headers": user["headers"], "json": {
+            "city": "Napoli", "buy_price": 150000 + i * 137, "surface": 70 + i % 60, "condition": "da ristrutturare",
+        }}
+    if endpoint == "deep_research":
+        return {"method": "POST", "url": "/features/deep-research", "headers": user["headers"], "json": {
+            "query": f"Appartamento a Napoli, max {180 + i}k, almeno 60 mq, da ristrutturare", "max_results": 5,
+        }}
+    raise ValueError(f"Endpoint sconosciuto: {endpoint}")
+
+
+async def run_endpoint(client: httpx.AsyncClient, endpoint: str, users: list, requests: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+
+    async def worker(w: int):
+        user = users[w % len(users)]
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request_for(endpoint, user, i))
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = (float(v) * 1000 for v in np.percentile(latencies, [50, 95, 99]))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(p50, 1),
+        "p95_ms": round(p95, 1),
+        "p99_ms": round(p99, 1),
+    }
+
+
+async def llm_stats(llm_url: str) -> dict:
+    if not llm_url:
+        return {}
+    async with httpx.AsyncClient(base_url=llm_url) as client:
+        return (await client.get("/stats")).json()
+
+
+async def run_benchmark(args, base_url: str, llm_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = await setup_users(client, args.concurrency)
+        results = {}
+        for endpoint in args.endpoints:
+            requests = args.ai_requests if endpoint in AI_ENDPOINTS else args.requests
+            before = await llm_stats(llm_url)
+            results[endpoint] = await run_endpoint(client, endpoint, users, requests, args.concurrency)
+            after = await llm_stats(llm_url)
+            if before:
+                results[endpoint]["llm_calls_per_request"] = round((after["requests"] - before["requests"]) / requests, 2)
+            print_row(endpoint, results[endpoint])
+        return results
+
+
+def print_header():
+    print(f"\n{'endpoint':<15} {'req':>5} {'err':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'LLM/req':>8}")
+
+
+def print_row(endpoint: str, r: dict):
+    llm = r.get("llm_calls_per_request")
+    print(
+        f"{endpoint:<15} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.2f} "
+        f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {llm if llm is not None else '-':>8}"
+    )
+    if r["errors"]:
+        print(f"{'':<15} esiti: {r['statuses']}")
+
+
+def previous_results(path: str = None) -> dict:
+    """Esecuzione da confrontare: quella indicata o la più recente in results/"""
+    if path is None:
+        files = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+        if not files:
+            return None
+        path = files[-1]
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_comparison(current: dict, previous: dict):
+    print(f"\nConfronto con {previous['commit']} ({previous['timestamp']}):")
+    print(f"{'endpoint':<15} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint, r in current["results"].items():
+        old = previous["results"].get(endpoint)
+        if not old:
+            continue
+
+        def delta(key: str) -> str:
+            return f"{(r[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "-"
+
+        print(f"{endpoint:<15} {delta('rps'):>9} {delta('p50_ms'):>9} {delta('p95_ms'):>9} {delta('p99_ms'):>9}")
+    if current["config"] != previous["config"]:
+        print("⚠️ Configurazione diversa dall'esecuzione precedente: i numeri non sono del tutto confrontabili")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test del backend con LLM finto")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=8, help="Client concorrenti (uno per utente)")
+    parser.add_argument("--requests", type=int, default=200, help="Richieste per gli endpoint senza AI")
+    parser.add_argument("--ai-requests", type=int, default=16, help="Richieste per calculate e deep_research")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Secondi prima del primo token")
+    parser.add_argument("--llm-tps", type=float, default=80.0, help="Token al secondo generati dall'LLM finto")
+    parser.add_argument("--llm-output-tokens", type=int, default=200)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--crew-process", default="dag", choices=["dag", "sequential"])
+    parser.add_argument("--job-workers", type=int, default=2)
+    parser.add_argument("--target", help="URL di un backend già avviato (non avvia né backend né LLM finto)")
+    parser.add_argument("--compare", help="JSON di un'esecuzione precedente (default: la più recente in results/)")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    processes = []
+    workdir = tempfile.mkdtemp(prefix="bighouse-bench-")
+    try:
+        if args.target:
+            base_url, llm_url = args.target.rstrip("/"), None
+        else:
+            processes, base_url, llm_url = start_stack(args, workdir)
+            print(f"🚀 Backend {base_url}, LLM finto {llm_url} (log in {workdir})")
+
+        print_header()
+        results = asyncio.run(run_benchmark(args, base_url, llm_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "no_save", "timeout")}
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": config,
+        "results": results,
+    }
+
+    previous = previous_results(args.compare)
+    if previous:
+        print_comparison(run, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{run['commit']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\n💾 Risultati salvati in {os.path.relpath(path, BACKEND_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
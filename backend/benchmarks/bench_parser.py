@@ -0,0 +1,93 @@
+"""
+⏱️ BIG HOUSE — Benchmark dei parser delle pagine di risultati
+
+Confronta i parser di Scraper.py sulle pagine salvate in backend/fixtures:
+pagine/secondo e picco di memoria Python (tracemalloc) per pagina. Verifica
+anche che tutti i parser producano esattamente gli stessi annunci.
+
+Nota: tracemalloc vede solo le allocazioni Python; l'albero di libxml2 (usato
+anche da bs4 come backend) è in C e non compare nel picco.
+
+Uso (dalla cartella backend):
+    python benchmarks/bench_parser.py --iterations 50
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Scraper import PARSERS  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def load_fixtures(pattern: str = "idealista_*.html") -> list:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, pattern))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def measure_speed(parse, pages: list, iterations: int) -> float:
+    """Pagine al secondo (miglior giro su `iterations`)"""
+    best = float("inf")
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for _, html in pages:
+            parse(html, "Napoli", "da_ristrutturare")
+        best = min(best, time.perf_counter() - start)
+    return len(pages) / best
+
+
+def measure_memory(parse, pages: list) -> float:
+    """Picco medio di memoria Python (KB) durante il parsing di una pagina"""
+    peaks = []
+    tracemalloc.start()
+    for _, html in pages:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        parse(html, "Napoli", "da_ristrutturare")
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei parser di Scraper.py")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_fixtures()
+    if not pages:
+        sys.exit(f"Nessuna fixture in {FIXTURES_DIR}")
+
+    outputs = {name: [parse(html, "Napoli", "da_ristrutturare") for _, html in pages] for name, parse in PARSERS.items()}
+    reference = next(iter(outputs.values()))
+    for name, output in outputs.items():
+        if output != reference:
+            sys.exit(f"❌ Il parser '{name}' produce annunci diversi")
+
+    listings = sum(len(page) for page in reference)
+    print(f"📄 {len(pages)} pagine, {listings} annunci, output identico per {', '.join(PARSERS)}\n")
+    print(f"{'parser':<8} {'pagine/s':>10} {'annunci/s':>11} {'picco KB/pagina':>16}")
+
+    results = {}
+    for name, parse in PARSERS.items():
+        speed = measure_speed(parse, pages, args.iterations)
+        peak_kb = measure_memory(parse, pages)
+        results[name] = speed
+        print(f"{name:<8} {speed:>10.1f} {speed * listings / len(pages):>11.0f} {peak_kb:>16.0f}")
+
+    if "bs4" in results and "lxml" in results:
+        print(f"\n⚡ lxml è {results['lxml'] / results['bs4']:.1f}x più veloce di bs4")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+⏱️ BIG HOUSE — Benchmark del parser delle query di Deep Research
+
+Misura query/secondo e microsecondi per query di queryparser.QueryParser sul
+corpus di query reali in backend/fixtures/queries.jsonl, e l'accuratezza
+campo per campo rispetto ai valori attesi. Per confronto riporta anche
+l'accuratezza del vecchio parser (tre città e due budget fissi).
+
+Uso (dalla cartella backend):
+    python benchmarks/bench_query.py --iterations 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from queryparser import QueryParser  # noqa: E402
+
+CORPUS_PATH = os.path.join(BACKEND_DIR, "fixtures", "queries.jsonl")
+FIELDS = ["city", "zone", "max_price", "min_surface", "condition"]
+
+
+def legacy_parse(query: str) -> dict:
+    """Il parser precedente: tutto ciò che non riconosce diventa Napoli/200k"""
+    query_lower = query.lower()
+    city = "Napoli"
+    if "napoli" in query_lower:
+        city = "Napoli"
+    elif "roma" in query_lower:
+        city = "Roma"
+    elif "milano" in query_lower:
+        city = "Milano"
+
+    max_price = 200000
+    if "200k" in query_lower or "200.000" in query_lower:
+        max_price = 200000
+    elif "300k" in query_lower:
+        max_price = 300000
+
+    return {"city": city, "zone": None, "max_price": max_price, "min_surface": None, "condition": "da ristrutturare"}
+
+
+def load_corpus() -> list:
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def accuracy(parse, corpus: list, verbose: bool = False) -> dict:
+    """Quota di query con il campo corretto, per campo e per query intera"""
+    correct = {field: 0 for field in FIELDS}
+    exact = 0
+    for item in corpus:
+        result = parse(item["query"])
+        wrong = [field for field in FIELDS if result.get(field) != item["expected"][field]]
+        for field in FIELDS:
+            correct[field] += field not in wrong
+        exact += not wrong
+        if verbose and wrong:
+            print(f"  ✗ {item['query']!r}: " + ", ".join(f"{f}={result.get(f)!r} (atteso {item['expected'][f]!r})" for f in wrong))
+    return {**{field: count / len(corpus) for field, count in correct.items()}, "query": exact / len(corpus)}
+
+
+def measure_speed(parse, queries: list, iterations: int) -> float:
+    """Microsecondi per query (miglior giro su `iterations`)"""
+    best = float("inf")
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for query in queries:
+            parse(query)
+        best = min(best, time.perf_counter() - start)
+    return best / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parser delle query")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--verbose", action="store_true", help="Mostra le query sbagliate")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    queries = [item["query"] for item in corpus]
+
+    start = time.perf_counter()
+    query_parser = QueryParser(os.path.join(BACKEND_DIR, "data"))
+    load_ms = (time.perf_counter() - start) * 1000
+    print(f"📚 Gazetteer: {query_parser.gazetteer.places} luoghi caricati in {load_ms:.1f} ms")
+    print(f"📝 Corpus: {len(corpus)} query\n")
+
+    print(f"{'parser':<10} {'µs/query':>9} {'query/s':>9} " + " ".join(f"{field:>11}" for field in FIELDS + ["query"]))
+    for name, parse in [("legacy", legacy_parse), ("gazetteer", query_parser.parse)]:
+        micros = measure_speed(parse, queries, args.iterations)
+        scores = accuracy(parse, corpus, verbose=args.verbose and name == "gazetteer")
+        print(
+            f"{name:<10} {micros:>9.1f} {1e6 / micros:>9.0f} "
+            + " ".join(f"{scores[field]:>10.0%} " for field in FIELDS + ["query"])
+        )
+
+
+if __name__ == "__main__":
+    main()
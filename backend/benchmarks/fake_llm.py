@@ -0,0 +1,146 @@
+"""
+🤖 BIG HOUSE — Server LLM finto, compatibile con l'API OpenAI
+
+Risponde a POST /v1/chat/completions (anche in streaming) con latenza e
+velocità di generazione configurabili, così i benchmark misurano il backend
+senza pagare DeepSeek né dipendere dai suoi tempi. Il backend ci si collega
+con DEEPSEEK_BASE_URL=http://127.0.0.1:<porta>/v1.
+
+Le risposte hanno il formato che si aspettano gli agenti CrewAI
+("Final Answer: ..."); se il prompt chiede il JSON degli scenari di
+ristrutturazione, la risposta è un JSON valido con 3 scenari. In JSON mode
+(response_format json_object) la risposta è solo JSON: {"scenarios": [...]}
+oppure, per le richieste di riparazione, lo scenario nominato nel prompt.
+
+Uso (dalla cartella backend):
+    python benchmarks/fake_llm.py --port 8900 --latency 0.3 --tokens-per-second 80
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FILLER = (
+    "Il mercato della zona mostra prezzi al metro quadro in linea con la media cittadina, "
+    "con margini interessanti sugli immobili da ristrutturare e una domanda di affitto stabile."
+).split()
+
+SCENARIOS = [
+    {"level": "bassa", "cost": 25000, "months": 2, "description": "Ristrutturazione cosmetica",
+     "roi_rent": 4.5, "roi_sell": 12.0, "risks": ["Sforamenti budget 5-10%"]},
+    {"level": "media", "cost": 60000, "months": 4, "description": "Ristrutturazione completa di impianti e finiture",
+     "roi_rent": 5.2, "roi_sell": 18.5, "risks": ["Sforamenti budget 10-15%", "Ritardi permessi"]},
+    {"level": "alta", "cost": 110000, "months": 8, "description": "Ristrutturazione di lusso con redistribuzione degli spazi",
+     "roi_rent": 5.8, "roi_sell": 24.0, "risks": ["Sforamenti budget 15-25%", "Mercato del lusso ristretto"]},
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def json_answer(prompt: str) -> str:
+    if '"scenarios"' in prompt:
+        return json.dumps({"scenarios": SCENARIOS}, ensure_ascii=False)
+    for scenario in SCENARIOS:
+        if f'"{scenario["level"]}"' in prompt:
+            return json.dumps(scenario, ensure_ascii=False)
+    return json.dumps(SCENARIOS[0], ensure_ascii=False)
+
+
+def answer_tokens(prompt: str, output_tokens: int, json_mode: bool = False) -> list:
+    """La risposta già divisa in "token" (parole con lo spazio)"""
+    if json_mode:
+        body = json_answer(prompt)
+        return [body[i:i + 16] for i in range(0, len(body), 16)]
+
+    if "formato JSON" in prompt:
+        body = json.dumps(SCENARIOS, ensure_ascii=False)
+        return ["Thought: ho stimato i tre scenari\n", "Final Answer: "] + [body[i:i + 16] for i in range(0, len(body), 16)]
+
+    words = [FILLER[i % len(FILLER)] + " " for i in range(max(output_tokens - 6, 1))]
+    return ["Thought: ", "analisi ", "completata\n", "Final ", "Answer: "] + words
+
+
+def create_app(latency: float = 0.3, tokens_per_second: float = 80.0, output_tokens: int = 200) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    counters = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    lock = threading.Lock()
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    @app.get("/stats")
+    async def stats():
+        with lock:
+            return dict(counters)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(str(m.get("content") or "") for m in body.get("messages", []))
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        tokens = answer_tokens(prompt, output_tokens, json_mode)
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with lock:
+            counters["requests"] += 1
+            counters["prompt_tokens"] += usage["prompt_tokens"]
+            counters["completion_tokens"] += usage["completion_tokens"]
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "deepseek-chat")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency + len(tokens) / tokens_per_second)
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": usage,
+            })
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        async def stream():
+            await asyncio.sleep(latency)
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(1 / tokens_per_second)
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server LLM finto (API OpenAI)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.3, help="Secondi prima del primo token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=200, help="Token per risposta testuale")
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_second, args.output_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
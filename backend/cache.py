@@ -0,0 +1,204 @@
+"""
+💾 BIG HOUSE — Cache dei risultati delle crew AI e degli utenti autenticati
+
+Input identici (stesso immobile per Calcola ROI, stesso insieme di immobili per
+Deep Research) producono la stessa analisi: invece di rilanciare la crew, il
+risultato viene salvato in SQLite con una chiave content-addressed (hash degli
+input normalizzati e dei prompt). Le voci scadono dopo un TTL e, oltre la
+dimensione massima, vengono eliminate le meno usate di recente (LRU).
+
+TTLCache è invece una piccola cache in memoria (LRU + TTL breve) usata per
+evitare una query al DB per ogni richiesta autenticata.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+def normalize(value: Any) -> Any:
+    """Normalizza gli input così che varianti banali producano la stessa chiave"""
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return normalize(str(value))
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """Chiave sha256 su namespace + parti normalizzate (JSON canonico)"""
+    canonical = json.dumps(
+        [namespace, normalize(list(parts))],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Cache chiave → JSON su SQLite con TTL, eviction LRU e contatori hit/miss"""
+
+    def __init__(self, get_db: Callable, ttl_seconds: int = 86400, max_entries: int = 500):
+        self._get_db = get_db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._init_table()
+
+    def _init_table(self):
+        with self._get_db() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_stats (
+                    namespace TEXT PRIMARY KEY,
+                    hits INTEGER DEFAULT 0,
+                    misses INTEGER DEFAULT 0
+                )
+            """)
+            conn.commit()
+
+    def _count(self, conn, namespace: str, column: str):
+        conn.execute("INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)", (namespace,))
+        conn.execute(f"UPDATE cache_stats SET {column} = {column} + 1 WHERE namespace = ?", (namespace,))
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._get_db() as conn:
+            row = conn.execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+
+            if row is None:
+                self._count(conn, namespace, "misses")
+                conn.commit()
+                return None
+
+            conn.execute(
+                "UPDATE cache_entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                (now, key)
+            )
+            self._count(conn, namespace, "hits")
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any):
+        now = time.time()
+        with self._get_db() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO cache_entries (key, namespace, value, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, namespace, json.dumps(value, ensure_ascii=False, default=str),
+                  now, now + self.ttl_seconds, now))
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        conn.execute("""
+            DELETE FROM cache_entries WHERE key IN (
+                SELECT key FROM cache_entries
+                ORDER BY last_access DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._get_db() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            rows = conn.execute("SELECT namespace, hits, misses FROM cache_stats").fetchall()
+
+        by_namespace = {}
+        for namespace, hits, misses in rows:
+            total = hits + misses
+            by_namespace[namespace] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / total, 3) if total else 0.0
+            }
+        return {"entries": entries, "max_entries": self.max_entries, "namespaces": by_namespace}
+
+
+class TTLCache:
+    """
+    Cache in memoria limitata (LRU) con scadenza per voce e invalidazione esplicita.
+
+    Per evitare di reinserire un valore letto prima di un'invalidazione, chi
+    carica dal DB legge `epoch(key)` prima della query e lo passa a `set`:
+    se nel frattempo la chiave è stata invalidata, il valore vecchio viene scartato.
+    """
+
+    def __init__(self, ttl_seconds: float = 30, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._epochs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def epoch(self, key: str) -> int:
+        with self._lock:
+            return self._epochs.get(key, 0)
+
+    def set(self, key: str, value: Any, epoch: Optional[int] = None):
+        with self._lock:
+            if epoch is not None and epoch != self._epochs.get(key, 0):
+                return
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self._epochs[key] = self._epochs.get(key, 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0
+            }
@@ -0,0 +1,395 @@
+"""
+📼 BIG HOUSE — Registrazione e replay del traffico HTTP (cassette)
+
+Trasporti httpx da mettere sotto il client dell'LLM e sotto lo scraper:
+
+- "passthrough": nessun effetto, le richieste vanno in rete
+- "record": le richieste vanno in rete e ogni risposta (header, corpo a
+  pezzi e tempi di arrivo dei pezzi) viene aggiunta alla cassetta
+- "replay": nessuna rete, le risposte escono dalla cassetta; una richiesta
+  non registrata fallisce con CassetteMiss (un errore di trasporto httpx)
+
+Le richieste si riconoscono da una forma normalizzata: metodo, URL senza
+parametri segreti (api_key) e con la query ordinata, corpo JSON con le
+chiavi ordinate, più gli header condizionali (una GET con If-None-Match
+può ricevere 304). Se la stessa richiesta è stata registrata più volte, il
+replay restituisce le risposte nello stesso ordine (poi ripete l'ultima).
+
+Il replay può andare alla massima velocità ("fast") o rispettare i tempi
+registrati ("recorded"), streaming compreso: così i percorsi caldi dei crew
+e dello scraper si misurano offline con latenze realistiche.
+
+Una cassetta è un file JSONL (un'interazione per riga) per ogni target,
+es. cassettes/llm.jsonl e cassettes/scraper.jsonl. "record" aggiunge in
+fondo: per una registrazione pulita cancella prima il file. Le cassette
+contengono prompt e risposte complete: la cartella cassettes/ è in .gitignore.
+
+Configurazione da env: CASSETTE_MODE vale per tutti i target, LLM_CASSETTE e
+SCRAPER_CASSETTE la sovrascrivono per uno solo; CASSETTE_DIR e
+CASSETTE_TIMING ("fast" o "recorded"). In replay dello scraper conviene
+alzare SCRAPER_RATE e disattivare la cache HTTP (SCRAPER_CACHE_DIR=""), che
+altrimenti risponde al posto della cassetta.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+import httpx
+
+MODES = ("passthrough", "record", "replay")
+TIMINGS = ("fast", "recorded")
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "passthrough")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes")
+CASSETTE_TIMING = os.getenv("CASSETTE_TIMING", "fast")
+
+# Parametri della query esclusi dal confronto (e dal file): segreti o variabili
+IGNORED_PARAMS = {"api_key", "apikey", "key", "token"}
+
+# Header delle richieste che cambiano la risposta
+MATCH_HEADERS = ("if-none-match", "if-modified-since")
+
+
+class CassetteMiss(httpx.TransportError):
+    """Richiesta non presente nella cassetta (modalità replay)"""
+
+
+def normalize_request(request: httpx.Request) -> Tuple[str, str]:
+    """Chiave e URL normalizzato di una richiesta (il corpo deve essere già letto)"""
+    params = sorted((k, v) for k, v in request.url.params.multi_items() if k.lower() not in IGNORED_PARAMS)
+    url = str(request.url.copy_with(params=params or None, fragment=None))
+
+    body = request.content
+    if body and "json" in request.headers.get("content-type", ""):
+        try:
+            body_text = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        except ValueError:
+            body_text = body.decode("utf-8", "replace")
+    else:
+        body_text = body.decode("utf-8", "replace")
+
+    headers = [(name, request.headers[name]) for name in MATCH_HEADERS if name in request.headers]
+    canonical = json.dumps([request.method, url, headers, body_text], ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32], url
+
+
+def _encode_chunks(chunks: List[Tuple[float, bytes]]) -> Tuple[str, list]:
+    try:
+        return "utf-8", [[round(offset, 4), data.decode("utf-8")] for offset, data in chunks]
+    except UnicodeDecodeError:
+        return "base64", [[round(offset, 4), base64.b64encode(data).decode("ascii")] for offset, data in chunks]
+
+
+def _decode_chunks(interaction: dict) -> List[Tuple[float, bytes]]:
+    if interaction["encoding"] == "base64":
+        return [(offset, base64.b64decode(data)) for offset, data in interaction["chunks"]]
+    return [(offset, data.encode("utf-8")) for offset, data in interaction["chunks"]]
+
+
+class Cassette:
+    """Interazioni registrate di un target, lette e scritte su un file JSONL"""
+
+    def __init__(self, path: str, mode: str = "replay", timing: str = "fast"):
+        if mode not in MODES:
+            raise ValueError(f"Modalità cassetta sconosciuta: {mode} (valide: {', '.join(MODES)})")
+        if timing not in TIMINGS:
+            raise ValueError(f"Timing cassetta sconosciuto: {timing} (validi: {', '.join(TIMINGS)})")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[dict]] = {}
+        self._played: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            if self.mode == "replay":
+                print(f"⚠️ Cassetta {self.path} non trovata: ogni richiesta fallirà")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions.setdefault(interaction["key"], []).append(interaction)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(items) for items in self._interactions.values())
+
+    def find(self, key: str) -> Optional[dict]:
+        """Prossima risposta registrata per la richiesta (l'ultima si ripete)"""
+        with self._lock:
+            items = self._interactions.get(key)
+            if not items:
+                self.misses += 1
+                return None
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+            self.hits += 1
+            return items[min(played, len(items) - 1)]
+
+    def add(self, key: str, request: httpx.Request, url: str, response: httpx.Response,
+            headers_after: float, chunks: List[Tuple[float, bytes]]):
+        encoding, encoded = _encode_chunks(chunks)
+        interaction = {
+            "key": key,
+            "method": request.method,
+            "url": url,
+            "status": response.status_code,
+            "headers": [[name, value] for name, value in response.headers.multi_items()],
+            "headers_after": round(headers_after, 4),
+            "encoding": encoding,
+            "chunks": encoded,
+            "recorded_at": time.time(),
+        }
+        line = json.dumps(interaction, ensure_ascii=False)
+        with self._lock:
+            self._interactions.setdefault(key, []).append(interaction)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "mode": self.mode,
+                "timing": self.timing,
+                "interactions": sum(len(items) for items in self._interactions.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+    def miss(self, request: httpx.Request, url: str) -> CassetteMiss:
+        return CassetteMiss(f"Richiesta non registrata in {self.path}: {request.method} {url}", request=request)
+
+
+def _replayed_response(interaction: dict, request: httpx.Request, stream) -> httpx.Response:
+    return httpx.Response(
+        interaction["status"],
+        headers=[tuple(header) for header in interaction["headers"]],
+        stream=stream,
+        request=request,
+    )
+
+
+# --- Stream di registrazione e di replay ---
+class _RecordingStream(httpx.SyncByteStream):
+    """Passa i pezzi del corpo al client e li registra; alla chiusura legge il resto e salva"""
+
+    def __init__(self, stream: httpx.SyncByteStream, started: float, on_complete):
+        self._stream = stream
+        self._started = started
+        self._on_complete = on_complete
+        self._chunks: List[Tuple[float, bytes]] = []
+        self._iterator = None
+        self._complete = False
+        self._failed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        self._iterator = iter(self._stream)
+        try:
+            for chunk in self._iterator:
+                self._chunks.append((time.perf_counter() - self._started, chunk))
+                yield chunk
+        except Exception:
+            self._failed = True
+            raise
+        self._complete = True
+
+    def close(self):
+        # Gli stream SSE di litellm/openai si fermano su "[DONE]" senza chiedere
+        # l'ultimo pezzo: quel che resta del corpo si legge qui, prima di chiudere
+        if not self._complete and not self._failed and self._iterator is not None:
+            try:
+                for chunk in self._iterator:
+                    self._chunks.append((time.perf_counter() - self._started, chunk))
+                self._complete = True
+            except Exception:
+                # Risposta troncata: meglio non registrarla
+                pass
+        self._stream.close()
+        if self._complete:
+            self._complete = False
+            self._on_complete(self._chunks)
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, started: float, on_complete):
+        self._stream = stream
+        self._started = started
+        self._on_complete = on_complete
+        self._chunks: List[Tuple[float, bytes]] = []
+        self._iterator = None
+        self._complete = False
+        self._failed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        self._iterator = self._stream.__aiter__()
+        try:
+            async for chunk in self._iterator:
+                self._chunks.append((time.perf_counter() - self._started, chunk))
+                yield chunk
+        except Exception:
+            self._failed = True
+            raise
+        self._complete = True
+
+    async def aclose(self):
+        if not self._complete and not self._failed and self._iterator is not None:
+            try:
+                async for chunk in self._iterator:
+                    self._chunks.append((time.perf_counter() - self._started, chunk))
+                self._complete = True
+            except Exception:
+                pass
+        await self._stream.aclose()
+        if self._complete:
+            self._complete = False
+            self._on_complete(self._chunks)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: List[Tuple[float, bytes]], started: float, realtime: bool):
+        self._chunks = chunks
+        self._started = started
+        self._realtime = realtime
+
+    def __iter__(self) -> Iterator[bytes]:
+        for offset, data in self._chunks:
+            if self._realtime:
+                delay = offset - (time.perf_counter() - self._started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield data
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: List[Tuple[float, bytes]], started: float, realtime: bool):
+        self._chunks = chunks
+        self._started = started
+        self._realtime = realtime
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for offset, data in self._chunks:
+            if self._realtime:
+                delay = offset - (time.perf_counter() - self._started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield data
+
+
+# --- Trasporti ---
+class CassetteTransport(httpx.BaseTransport):
+    """Trasporto sincrono (client dell'LLM) che registra o riproduce da una cassetta"""
+
+    def __init__(self, transport: httpx.BaseTransport, cassette: Cassette):
+        self._transport = transport
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key, url = normalize_request(request)
+        started = time.perf_counter()
+        cassette = self.cassette
+
+        if cassette.mode == "replay":
+            interaction = cassette.find(key)
+            if interaction is None:
+                raise cassette.miss(request, url)
+            realtime = cassette.timing == "recorded"
+            if realtime:
+                time.sleep(interaction["headers_after"])
+            stream = _ReplayStream(_decode_chunks(interaction), started, realtime)
+            return _replayed_response(interaction, request, stream)
+
+        response = self._transport.handle_request(request)
+        if cassette.mode == "record":
+            headers_after = time.perf_counter() - started
+            response.stream = _RecordingStream(
+                response.stream, started,
+                lambda chunks: cassette.add(key, request, url, response, headers_after, chunks)
+            )
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Trasporto async (scraper) che registra o riproduce da una cassetta"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cassette: Cassette):
+        self._transport = transport
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key, url = normalize_request(request)
+        started = time.perf_counter()
+        cassette = self.cassette
+
+        if cassette.mode == "replay":
+            interaction = cassette.find(key)
+            if interaction is None:
+                raise cassette.miss(request, url)
+            realtime = cassette.timing == "recorded"
+            if realtime:
+                await asyncio.sleep(interaction["headers_after"])
+            stream = _AsyncReplayStream(_decode_chunks(interaction), started, realtime)
+            return _replayed_response(interaction, request, stream)
+
+        response = await self._transport.handle_async_request(request)
+        if cassette.mode == "record":
+            headers_after = time.perf_counter() - started
+            response.stream = _AsyncRecordingStream(
+                response.stream, started,
+                lambda chunks: cassette.add(key, request, url, response, headers_after, chunks)
+            )
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def wrap(
+    transport: Union[httpx.BaseTransport, httpx.AsyncBaseTransport],
+    name: str,
+    mode: str = "passthrough",
+    directory: str = "cassettes",
+    timing: str = "fast",
+) -> Union[httpx.BaseTransport, httpx.AsyncBaseTransport]:
+    """
+    Mette la cassetta `<directory>/<name>.jsonl` sopra `transport` (sincrono o
+    async). In passthrough ritorna `transport` così com'è.
+    """
+    if mode == "passthrough":
+        return transport
+    cassette = Cassette(os.path.join(directory, f"{name}.jsonl"), mode, timing)
+    print(f"📼 Cassetta {name}: {mode} ({len(cassette)} interazioni, timing {timing})")
+    if isinstance(transport, httpx.AsyncBaseTransport):
+        return AsyncCassetteTransport(transport, cassette)
+    return CassetteTransport(transport, cassette)
+
+
+def from_env(
+    transport: Union[httpx.BaseTransport, httpx.AsyncBaseTransport],
+    name: str
+) -> Union[httpx.BaseTransport, httpx.AsyncBaseTransport]:
+    """`wrap` con la configurazione da env (<NAME>_CASSETTE, altrimenti CASSETTE_MODE)"""
+    mode = os.getenv(f"{name.upper()}_CASSETTE", CASSETTE_MODE)
+    return wrap(transport, name, mode, CASSETTE_DIR, CASSETTE_TIMING)
@@ -0,0 +1,120 @@
+"""
+🕸️ BIG HOUSE — Esecuzione parallela dei task CrewAI (scheduler a DAG)
+
+Con Process.sequential ogni task aspetta il precedente anche quando non ne usa
+l'output. Qui il grafo delle dipendenze viene costruito da `Task.context`: i
+task senza dipendenze in sospeso partono subito in parallelo, gli altri appena
+i loro task di contesto sono completati.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from crewai import Task
+from crewai.tasks.task_output import TaskOutput
+from crewai.utilities.formatter import aggregate_raw_outputs_from_tasks
+
+import metrics
+
+
+def execute_task(task: Task, context: Optional[str] = None) -> TaskOutput:
+    """Esegue un task nel thread corrente, misurandolo e attribuendo le chiamate LLM al suo agente"""
+    role = task.agent.role if task.agent else metrics.UNKNOWN_AGENT
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with metrics.agent_scope(role):
+            output = task.execute_sync(agent=task.agent, context=context)
+        status = "ok"
+        return output
+    finally:
+        metrics.TASK_SECONDS.observe(time.perf_counter() - start, agent=role, status=status)
+
+
+class TaskGraph:
+    """Grafo dei task ricavato da Task.context"""
+
+    def __init__(self, tasks: List[Task]):
+        self.tasks = tasks
+        ids = {id(task) for task in tasks}
+        self.dependencies: Dict[int, List[Task]] = {}
+
+        for task in tasks:
+            context = task.context or []
+            for dependency in context:
+                if id(dependency) not in ids:
+                    raise ValueError(f"Il task '{task.description[:40]}...' dipende da un task fuori dal grafo")
+            self.dependencies[id(task)] = list(context)
+
+        self.layers()  # valida l'assenza di cicli
+
+    def layers(self) -> List[List[Task]]:
+        """Livelli topologici: i task dello stesso livello sono indipendenti"""
+        level: Dict[int, int] = {}
+        remaining = list(self.tasks)
+
+        while remaining:
+            progressed = False
+            for task in list(remaining):
+                deps = self.dependencies[id(task)]
+                if all(id(dep) in level for dep in deps):
+                    level[id(task)] = 1 + max((level[id(dep)] for dep in deps), default=-1)
+                    remaining.remove(task)
+                    progressed = True
+            if not progressed:
+                raise ValueError("Dipendenze cicliche tra i task")
+
+        layers: List[List[Task]] = [[] for _ in range(max(level.values(), default=-1) + 1)]
+        for task in self.tasks:
+            layers[level[id(task)]].append(task)
+        return layers
+
+    def run(
+        self,
+        max_workers: Optional[int] = None,
+        on_start: Optional[Callable[[Task], None]] = None,
+    ) -> List[TaskOutput]:
+        """
+        Esegue il grafo e ritorna gli output nell'ordine originale dei task.
+
+        Un agente esegue un solo task alla volta (l'executor dell'agente non è
+        condiviso in sicurezza tra thread). Il primo errore interrompe il grafo.
+        """
+        done: Dict[int, TaskOutput] = {}
+        running: Dict[Future, Task] = {}
+        busy_agents = set()
+        pending = list(self.tasks)
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or len(self.tasks) or 1,
+            thread_name_prefix="bighouse-task"
+        ) as pool:
+            while pending or running:
+                for task in list(pending):
+                    deps = self.dependencies[id(task)]
+                    if id(task.agent) in busy_agents or not all(id(dep) in done for dep in deps):
+                        continue
+
+                    pending.remove(task)
+                    busy_agents.add(id(task.agent))
+                    if on_start:
+                        on_start(task)
+                    context = aggregate_raw_outputs_from_tasks(deps) if deps else None
+                    running[pool.submit(execute_task, task, context)] = task
+
+                if not running:
+                    raise RuntimeError("Nessun task eseguibile: grafo bloccato")
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    busy_agents.discard(id(task.agent))
+                    try:
+                        done[id(task)] = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+
+        return [done[id(task)] for task in self.tasks]
@@ -0,0 +1,110 @@
+"""
+🗄️ BIG HOUSE — Accesso a SQLite con pool di connessioni
+
+Aprire una connessione per ogni query costa (open del file, parsing dello
+schema, statement da ricompilare). Il pool tiene aperte poche connessioni
+configurate una volta sola:
+
+- journal_mode=WAL: i lettori non vengono bloccati da chi scrive
+- synchronous=NORMAL: sicuro con WAL, molte meno fsync
+- cache_size / mmap_size / temp_store: pagine calde in memoria
+- cached_statements: ogni connessione tiene in cache gli statement preparati,
+  riusati tra richieste perché le connessioni restano vive
+
+Gli endpoint async eseguono le query con `await pool.run(fn, ...)`, su un
+executor dedicato, senza bloccare l'event loop.
+
+Attesa di una connessione, tempo d'uso e durata delle `run` finiscono nelle
+metriche (metrics.py), etichettate con il nome del pool.
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, List
+
+import metrics
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",     # ~16 MB di page cache per connessione
+    "PRAGMA mmap_size = 67108864",    # 64 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+]
+
+
+class ConnectionPool:
+    """Pool thread-safe di connessioni SQLite verso un unico file"""
+
+    def __init__(self, path: str, size: int = 8, statement_cache: int = 256, name: str = "main"):
+        self.path = path
+        self.name = name  # etichetta "database" delle metriche
+        self.size = size
+        self.statement_cache = statement_cache
+        self._idle: queue.Queue = queue.Queue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="bighouse-db")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=5.0,
+            check_same_thread=False,  # ogni connessione è usata da un thread alla volta
+            cached_statements=self.statement_cache,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Presta una connessione; eventuali transazioni lasciate aperte vengono annullate"""
+        start = time.perf_counter()
+        conn = self._acquire()
+        acquired = time.perf_counter()
+        metrics.DB_WAIT_SECONDS.observe(acquired - start, database=self.name)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+            metrics.DB_CONNECTION_SECONDS.observe(time.perf_counter() - acquired, database=self.name)
+
+    def _timed(self, fn: Callable, *args, **kwargs):
+        with metrics.DB_OPERATION_SECONDS.time(database=self.name, operation=fn.__name__):
+            return fn(*args, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Esegue una funzione che usa il DB sull'executor del pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._timed, fn, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
@@ -0,0 +1,219 @@
+"""
+📦 BIG HOUSE — Cache HTTP su disco per lo scraper
+
+Le pagine scaricate vengono salvate compresse (zlib) in una cartella, con un
+indice SQLite che tiene ETag, Last-Modified, scadenza e ultimo accesso:
+
+- voce ancora fresca → la pagina viene servita senza toccare la rete
+- voce scaduta → GET condizionale (If-None-Match / If-Modified-Since): un 304
+  rinnova la voce e costa pochi byte (e nessun credito ScraperAPI pieno)
+- oltre `max_bytes` vengono eliminate le voci usate meno di recente (LRU)
+
+La freschezza segue Cache-Control (max-age, no-store, no-cache) ed Expires;
+in mancanza di indicazioni vale `default_ttl`.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+from db import ConnectionPool
+
+
+def freshness_lifetime(headers: Mapping[str, str], default_ttl: float) -> Optional[float]:
+    """Secondi di validità della risposta (None = da non salvare)"""
+    cache_control = headers.get("cache-control", "").lower()
+    directives = {}
+    for part in cache_control.split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(float(directives["max-age"]), 0.0)
+        except ValueError:
+            pass
+
+    expires = headers.get("expires")
+    if expires:
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+    return default_ttl
+
+
+class HTTPCache:
+    """Cache URL → corpo compresso su disco, con revalidazione e eviction LRU"""
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024, default_ttl: float = 900):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+        self._pool = ConnectionPool(os.path.join(directory, "index.db"), size=2, name="http_cache")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._init_table()
+
+    def _init_table(self):
+        with self._pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    url TEXT PRIMARY KEY,
+                    file TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fresh_until REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_last_access ON http_cache (last_access)")
+            conn.commit()
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name[:2], name)
+
+    def _count(self, attribute: str):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """
+        Voce in cache per `url`: {"body", "fresh", "etag", "last_modified"}.
+        Se la voce è fresca viene contata come hit; se è scaduta serve a
+        preparare la richiesta condizionale.
+        """
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT file, etag, last_modified, fresh_until FROM http_cache WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            try:
+                with open(self._path(row[0]), "rb") as f:
+                    body = zlib.decompress(f.read()).decode("utf-8")
+            except (OSError, zlib.error):
+                conn.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+                conn.commit()
+                self._count("misses")
+                return None
+
+            conn.execute("UPDATE http_cache SET last_access = ? WHERE url = ?", (time.time(), url))
+            conn.commit()
+
+        fresh = row[3] > time.time()
+        self._count("hits" if fresh else "stale")
+        return {"body": body, "fresh": fresh, "etag": row[1], "last_modified": row[2]}
+
+    @staticmethod
+    def conditional_headers(entry: Optional[dict]) -> dict:
+        """Header per la GET condizionale a partire da una voce scaduta"""
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, headers: Mapping[str, str], body: str):
+        """Salva una risposta 200 (se gli header lo consentono)"""
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        if lifetime is None:
+            return
+
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self._path(name)
+        data = zlib.compress(body.encode("utf-8"), 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._pool.connection() as conn:
+            old = conn.execute("SELECT size FROM http_cache WHERE url = ?", (url,)).fetchone()
+            conn.execute("""
+                INSERT OR REPLACE INTO http_cache (url, file, etag, last_modified, fresh_until, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (url, name, headers.get("etag"), headers.get("last-modified"), now + lifetime, len(data), now))
+            conn.commit()
+            with self._lock:
+                self._total_bytes += len(data) - (old[0] if old else 0)
+            self._evict(conn)
+
+    def revalidate(self, url: str, headers: Mapping[str, str]):
+        """Il server ha risposto 304: la voce torna fresca con i nuovi header"""
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        now = time.time()
+        with self._pool.connection() as conn:
+            conn.execute("""
+                UPDATE http_cache SET
+                    fresh_until = ?,
+                    etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified),
+                    last_access = ?
+                WHERE url = ?
+            """, (now + (lifetime or 0.0), headers.get("etag"), headers.get("last-modified"), now, url))
+            conn.commit()
+        self._count("revalidated")
+
+    def _evict(self, conn):
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        # Si libera fino al 90% del massimo, per non ripetere l'eviction a ogni store
+        target = self.max_bytes * 0.9
+        evicted = []
+        for url, name, size in conn.execute("SELECT url, file, size FROM http_cache ORDER BY last_access"):
+            if self._total_bytes <= target:
+                break
+            evicted.append((url, name))
+            with self._lock:
+                self._total_bytes -= size
+
+        conn.executemany("DELETE FROM http_cache WHERE url = ?", [(url,) for url, _ in evicted])
+        conn.commit()
+        for _, name in evicted:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._pool.connection() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM http_cache").fetchone()[0]
+        with self._lock:
+            total = self.hits + self.stale + self.misses
+            return {
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale": self.stale,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.revalidated) / total, 3) if total else 0.0
+            }
+
+    def close(self):
+        self._pool.close()
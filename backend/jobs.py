@@ -0,0 +1,331 @@
+"""
+⏳ BIG HOUSE — Coda di job in background per le analisi AI
+
+Deep Research e Calcola ROI lanciano crew multi-agente che durano decine di
+secondi. Invece di eseguirle dentro l'event loop di uvicorn, vengono accodate
+qui ed eseguite da un pool limitato di worker thread. Lo stato di ogni job è
+salvato in SQLite, così i job in coda sopravvivono a un riavvio del server.
+
+Richieste identiche in contemporanea (stessa chiave `coalesce_key`) non
+lanciano crew duplicate: la seconda si aggancia al job già in coda o in
+esecuzione, ne riceve gli eventi di avanzamento e, alla fine, il risultato
+passato dalla funzione `share` del tipo di job (che sistema la quota di chi
+si è agganciato). Un job agganciato non occupa un worker.
+
+I job terminati restano consultabili per `ttl_seconds`, poi vengono
+cancellati all'avvio (`resume`).
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+# emit(evento, dati): notifica l'avanzamento di un job (es. verso uno stream SSE)
+EmitFn = Callable[[str, Any], None]
+
+
+def _no_emit(event: str, data: Any):
+    pass
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Troppi job in attesa: il client deve riprovare più tardi"""
+
+
+class JobQueue:
+    """Coda persistente con pool di worker limitato"""
+
+    def __init__(
+        self,
+        get_db: Callable,
+        max_workers: int = 2,
+        max_pending: int = 50,
+        ttl_seconds: Optional[float] = 7 * 86400
+    ):
+        self._get_db = get_db
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._handlers: Dict[str, Callable[[dict, EmitFn], dict]] = {}
+        self._sharers: Dict[str, Callable[[dict, Future], dict]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._listeners: Dict[str, EmitFn] = {}
+        # (tipo, chiave) → job che esegue davvero; job → job agganciati
+        self._leaders: Dict[Tuple[str, str], str] = {}
+        self._followers: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="bighouse-job"
+        )
+        self._init_table()
+
+    def _init_table(self):
+        with self._get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at)")
+            conn.commit()
+
+    def register(
+        self,
+        kind: str,
+        handler: Callable[[dict, EmitFn], dict],
+        share: Optional[Callable[[dict, Future], dict]] = None
+    ):
+        """
+        Associa un tipo di job alla funzione (bloccante) che lo esegue.
+        L'handler riceve il payload e una funzione emit(evento, dati)
+        per pubblicare l'avanzamento.
+
+        Con `share` i job del tipo si possono agganciare: riceve il payload
+        del job agganciato e il future (già concluso) del job che ha
+        eseguito l'handler, e ritorna il risultato del job agganciato
+        (`future.result()` rilancia l'eventuale errore).
+        """
+        self._handlers[kind] = handler
+        if share is not None:
+            self._sharers[kind] = share
+
+    def submit(
+        self,
+        kind: str,
+        payload: dict,
+        owner: str,
+        emit: Optional[EmitFn] = None,
+        coalesce_key: Optional[str] = None
+    ) -> str:
+        """
+        Salva il job come 'queued' e lo affida al pool. Ritorna subito l'id.
+        Se passato, `emit` riceve gli eventi di avanzamento e, alla fine,
+        'done' con il risultato oppure 'error' (non viene persistito).
+        Se un job dello stesso tipo con la stessa `coalesce_key` è ancora in
+        corso, il nuovo job si aggancia a quello invece di andare nel pool.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo di job sconosciuto: {kind}")
+
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                raise QueueFullError(f"{len(self._futures)} job già in coda")
+
+            job_id = uuid.uuid4().hex
+            with self._get_db() as conn:
+                conn.execute("""
+                    INSERT INTO jobs (id, kind, owner, status, payload, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (job_id, kind, owner, JobStatus.QUEUED.value,
+                      json.dumps(payload, ensure_ascii=False), datetime.utcnow().isoformat()))
+                conn.commit()
+
+            if emit is not None:
+                self._listeners[job_id] = emit
+            if coalesce_key is None or kind not in self._sharers:
+                self._schedule(job_id)
+            elif not self._attach(job_id, kind, coalesce_key):
+                self._schedule(job_id, (kind, coalesce_key))
+        return job_id
+
+    def _schedule(self, job_id: str, coalesce: Optional[Tuple[str, str]] = None):
+        future = self._executor.submit(self._run, job_id)
+        self._futures[job_id] = future
+        if coalesce is not None:
+            self._leaders[coalesce] = job_id
+            self._followers[job_id] = []
+            future.add_done_callback(lambda f: self._share(job_id, coalesce, f))
+        future.add_done_callback(lambda _: self._forget(job_id))
+
+    def _attach(self, job_id: str, kind: str, coalesce_key: str) -> bool:
+        """Aggancia il job a quello identico in corso, se c'è (con il lock preso)"""
+        leader_id = self._leaders.get((kind, coalesce_key))
+        leader = self._futures.get(leader_id) if leader_id else None
+        if leader is None or leader.done():
+            return False
+
+        future = Future()
+        self._futures[job_id] = future
+        self._followers[leader_id].append(job_id)
+        future.add_done_callback(lambda _: self._forget(job_id))
+        metrics.JOBS_COALESCED.inc(kind=kind)
+        return True
+
+    def _share(self, leader_id: str, coalesce: Tuple[str, str], leader: Future):
+        """Concluso il job che ha eseguito l'handler, chiude quelli agganciati"""
+        with self._lock:
+            if self._leaders.get(coalesce) == leader_id:
+                del self._leaders[coalesce]
+            followers = self._followers.pop(leader_id, [])
+
+        kind = coalesce[0]
+        for job_id in followers:
+            with self._lock:
+                future = self._futures[job_id]
+                emit = self._listeners.get(job_id, _no_emit)
+            try:
+                with self._get_db() as conn:
+                    row = conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                result = self._sharers[kind](json.loads(row[0]), leader)
+            except Exception as e:
+                print(f"❌ Job {job_id} ({kind}) agganciato a {leader_id} fallito: {e}")
+                self._finish(job_id, JobStatus.FAILED, error=str(e))
+                emit("error", {"detail": str(e)})
+                future.set_exception(e)
+                continue
+
+            self._finish(job_id, JobStatus.DONE, result=result)
+            emit("done", result)
+            future.set_result(result)
+
+    def _progress(self, job_id: str) -> EmitFn:
+        """emit per l'handler: l'avanzamento arriva anche ai job agganciati"""
+        def emit(event: str, data: Any):
+            with self._lock:
+                listeners = [self._listeners.get(target) for target in [job_id] + self._followers.get(job_id, [])]
+            for listener in listeners:
+                if listener is not None:
+                    listener(event, data)
+        return emit
+
+    def pending(self) -> int:
+        """Job in coda o in esecuzione"""
+        with self._lock:
+            return len(self._futures)
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self._listeners.pop(job_id, None)
+
+    def _run(self, job_id: str) -> dict:
+        with self._get_db() as conn:
+            row = conn.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (JobStatus.RUNNING.value, datetime.utcnow().isoformat(), job_id)
+            )
+            conn.commit()
+
+        kind, payload = row[0], json.loads(row[1])
+        emit = self._listeners.get(job_id, _no_emit)
+
+        start = time.perf_counter()
+        try:
+            result = self._handlers[kind](payload, self._progress(job_id))
+        except Exception as e:
+            metrics.JOB_SECONDS.observe(time.perf_counter() - start, kind=kind, status=JobStatus.FAILED.value)
+            print(f"❌ Job {job_id} ({kind}) fallito: {e}")
+            self._finish(job_id, JobStatus.FAILED, error=str(e))
+            emit("error", {"detail": str(e)})
+            raise
+
+        metrics.JOB_SECONDS.observe(time.perf_counter() - start, kind=kind, status=JobStatus.DONE.value)
+        self._finish(job_id, JobStatus.DONE, result=result)
+        emit("done", result)
+        return result
+
+    def _finish(self, job_id: str, status: JobStatus, result: Optional[dict] = None, error: Optional[str] = None):
+        with self._get_db() as conn:
+            conn.execute("""
+                UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?
+                WHERE id = ?
+            """, (status.value,
+                  json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                  error, datetime.utcnow().isoformat(), job_id))
+            conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._get_db() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    async def wait(self, job_id: str) -> dict:
+        """Attende la fine del job senza bloccare l'event loop"""
+        with self._lock:
+            future = self._futures.get(job_id)
+
+        if future is not None:
+            return await asyncio.wrap_future(future)
+
+        # Job già terminato (o eseguito prima del riavvio): leggi dal DB in un thread
+        job = await asyncio.to_thread(self.get, job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job["status"] == JobStatus.FAILED.value:
+            raise RuntimeError(job["error"])
+        return job["result"]
+
+    def prune(self) -> int:
+        """Cancella i job terminati da più di `ttl_seconds` (None = mai)"""
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = datetime.utcfromtimestamp(time.time() - self.ttl_seconds).isoformat()
+        with self._get_db() as conn:
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (JobStatus.DONE.value, JobStatus.FAILED.value, cutoff)
+            ).rowcount
+            conn.commit()
+        return deleted
+
+    def resume(self) -> int:
+        """Rimette in coda i job rimasti 'queued' o 'running' dopo un riavvio (e pulisce quelli scaduti)"""
+        pruned = self.prune()
+        if pruned:
+            print(f"🧹 Cancellati {pruned} job terminati da più di {self.ttl_seconds:.0f}s")
+
+        with self._get_db() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+            ).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+            )
+            conn.commit()
+
+        with self._lock:
+            for row in rows:
+                self._schedule(row[0])
+
+        if rows:
+            print(f"🔁 Ripresi {len(rows)} job dalla coda persistente")
+        return len(rows)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,280 @@
+"""
+🏘️ BIG HOUSE — Archivio locale degli annunci immobiliari
+
+Gli annunci trovati dallo scraper vengono salvati nella tabella `listings`,
+una riga per URL canonico (lo stesso annuncio visto più volte non si
+duplica). Deep Research interroga l'archivio (indici su città, zona, prezzo,
+superficie e €/mq) e torna in rete solo per le città non aggiornate da più di
+`stale_after_seconds`.
+
+Il refresh è incrementale: le righe identiche aggiornano solo `last_seen`,
+quelle cambiate vengono riscritte e, se cambia il prezzo, il vecchio prezzo
+finisce in `price_history`. Gli annunci della città che il crawl non ha più
+visto (venduti, ritirati, o fuori dal nuovo budget) vengono rimossi a fine
+crawl, così l'archivio rispecchia sempre l'ultimo refresh.
+"""
+
+import hashlib
+import json
+import time
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Campi di un annuncio così come li producono gli scraper
+LISTING_FIELDS = [
+    "title", "price", "surface", "rooms", "bathrooms", "floor", "condition",
+    "address", "zone", "url", "description", "price_per_sqm", "source",
+]
+
+SORT_COLUMNS = {"price", "surface", "price_per_sqm", "last_seen"}
+
+
+def canonical_url(url: str) -> str:
+    """URL senza query, frammento e slash finale, host in minuscolo"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "https", parts.netloc.lower(), path, "", ""))
+
+
+def content_hash(prop: dict) -> str:
+    payload = json.dumps([prop.get(field) for field in LISTING_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ListingStore:
+    """Annunci per URL canonico con storico prezzi e freschezza per città"""
+
+    def __init__(self, get_db: Callable, stale_after_seconds: float = 6 * 3600):
+        self._get_db = get_db
+        self.stale_after_seconds = stale_after_seconds
+        self._init_table()
+
+    def _init_table(self):
+        with self._get_db() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    url TEXT PRIMARY KEY,
+                    city TEXT NOT NULL,
+                    zone TEXT,
+                    title TEXT,
+                    price INTEGER,
+                    surface INTEGER,
+                    rooms INTEGER,
+                    bathrooms INTEGER,
+                    floor INTEGER,
+                    condition TEXT,
+                    address TEXT,
+                    description TEXT,
+                    price_per_sqm INTEGER,
+                    source TEXT,
+                    content_hash TEXT NOT NULL,
+                    price_history TEXT NOT NULL DEFAULT '[]',
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_city_price ON listings (city, price)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_zone ON listings (zone)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_surface ON listings (surface)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_price_per_sqm ON listings (price_per_sqm)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS listing_refresh (
+                    city TEXT PRIMARY KEY,
+                    refreshed_at REAL NOT NULL,
+                    max_price INTEGER
+                )
+            """)
+            conn.commit()
+
+    @staticmethod
+    def _city_key(city: str) -> str:
+        return " ".join(city.lower().split())
+
+    def is_stale(self, city: str, max_price: Optional[int] = None) -> bool:
+        """Da riscaricare se mai aggiornata, troppo vecchia o scaricata con un budget più basso"""
+        with self._get_db() as conn:
+            row = conn.execute(
+                "SELECT refreshed_at, max_price FROM listing_refresh WHERE city = ?",
+                (self._city_key(city),)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.stale_after_seconds:
+            return True
+        return row[1] is not None and (max_price is None or max_price > row[1])
+
+    def stale_cities(self, cities: List[str], max_price: Optional[int] = None) -> List[str]:
+        return [city for city in cities if self.is_stale(city, max_price)]
+
+    def upsert(self, city: str, properties: List[dict], max_price: Optional[int] = None) -> Dict[str, int]:
+        """
+        Salva gli annunci di una città (scaricati con budget `max_price`, None =
+        senza limite) e la segna come aggiornata. Ritorna quante righe sono
+        state inserite, modificate o erano invariate.
+        """
+        return self.upsert_stream(city, properties, max_price)
+
+    def upsert_stream(
+        self,
+        city: str,
+        properties: Iterable[dict],
+        max_price: Optional[int] = None,
+        batch_size: int = 50
+    ) -> Dict[str, int]:
+        """
+        Come `upsert`, ma consuma un iterabile (es. un crawl in streaming) a
+        blocchi di `batch_size`: gli annunci sono interrogabili man mano, la
+        città viene segnata come aggiornata solo a crawl completato e gli
+        annunci che il crawl non ha visto vengono rimossi.
+        """
+        city_key = self._city_key(city)
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        iterator = iter(properties)
+        started = time.time()
+
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            self._write_batch(city_key, batch, counts)
+
+        with self._get_db() as conn:
+            # Un crawl vuoto è più spesso un errore di rete che una città senza annunci
+            if counts["inserted"] or counts["updated"] or counts["unchanged"]:
+                counts["removed"] = conn.execute(
+                    "DELETE FROM listings WHERE city = ? AND last_seen < ?",
+                    (city_key, started)
+                ).rowcount
+            conn.execute(
+                "INSERT OR REPLACE INTO listing_refresh (city, refreshed_at, max_price) VALUES (?, ?, ?)",
+                (city_key, time.time(), max_price)
+            )
+            conn.commit()
+        return counts
+
+    def _write_batch(self, city_key: str, properties: List[dict], counts: Dict[str, int]):
+        now = time.time()
+
+        rows = {}
+        for prop in properties:
+            if not prop.get("url"):
+                continue
+            row = {field: prop.get(field) for field in LISTING_FIELDS}
+            row["url"] = canonical_url(prop["url"])
+            row["content_hash"] = content_hash(row)
+            rows[row["url"]] = row
+
+        with self._get_db() as conn:
+            existing = {}
+            urls = list(rows)
+            if urls:
+                for url, old_hash, old_price, history in conn.execute(
+                    f"SELECT url, content_hash, price, price_history FROM listings WHERE url IN ({','.join('?' * len(urls))})",
+                    urls
+                ):
+                    existing[url] = (old_hash, old_price, history)
+
+            unchanged = []
+            for url, row in rows.items():
+                if url not in existing:
+                    conn.execute(f"""
+                        INSERT INTO listings ({', '.join(LISTING_FIELDS)}, city, content_hash, first_seen, last_seen)
+                        VALUES ({', '.join('?' * len(LISTING_FIELDS))}, ?, ?, ?, ?)
+                    """, [row[field] for field in LISTING_FIELDS] + [city_key, row["content_hash"], now, now])
+                    counts["inserted"] += 1
+                    continue
+
+                old_hash, old_price, history = existing[url]
+                if old_hash == row["content_hash"]:
+                    unchanged.append((now, url))
+                    continue
+
+                history = json.loads(history)
+                if old_price is not None and old_price != row["price"]:
+                    history.append({"price": old_price, "until": now})
+                conn.execute(f"""
+                    UPDATE listings SET {', '.join(f'{field} = ?' for field in LISTING_FIELDS)},
+                        city = ?, content_hash = ?, price_history = ?, last_seen = ?
+                    WHERE url = ?
+                """, [row[field] for field in LISTING_FIELDS] + [city_key, row["content_hash"], json.dumps(history), now, url])
+                counts["updated"] += 1
+
+            conn.executemany("UPDATE listings SET last_seen = ? WHERE url = ?", unchanged)
+            counts["unchanged"] += len(unchanged)
+            conn.commit()
+
+    def search(
+        self,
+        city: str,
+        max_price: Optional[int] = None,
+        min_surface: Optional[int] = None,
+        min_price: Optional[int] = None,
+        zone: Optional[str] = None,
+        order_by: str = "price_per_sqm",
+        limit: int = 10
+    ) -> List[dict]:
+        """Annunci di una città dall'archivio locale (solo i campi dello scraper)"""
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Ordinamento non supportato: {order_by}")
+
+        where = ["city = ?"]
+        params: list = [self._city_key(city)]
+        if max_price is not None:
+            where.append("price <= ?")
+            params.append(max_price)
+        if min_price is not None:
+            where.append("price >= ?")
+            params.append(min_price)
+        if min_surface is not None:
+            where.append("surface >= ?")
+            params.append(min_surface)
+        if zone:
+            # Gli annunci riportano la zona in forme diverse ("Vomero", "Vomero - Arenella")
+            where.append("zone LIKE ?")
+            params.append(f"%{zone}%")
+        params.append(limit)
+
+        with self._get_db() as conn:
+            rows = conn.execute(f"""
+                SELECT {', '.join(LISTING_FIELDS)} FROM listings
+                WHERE {' AND '.join(where)}
+                ORDER BY {order_by}, url
+                LIMIT ?
+            """, params).fetchall()
+        return [dict(zip(LISTING_FIELDS, row)) for row in rows]
+
+    def history(self, url: str) -> Optional[dict]:
+        """Primo/ultimo avvistamento e storico prezzi di un annuncio"""
+        with self._get_db() as conn:
+            row = conn.execute(
+                "SELECT price, price_history, first_seen, last_seen FROM listings WHERE url = ?",
+                (canonical_url(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "price": row[0],
+            "price_history": json.loads(row[1]),
+            "first_seen": row[2],
+            "last_seen": row[3]
+        }
+
+    def stats(self) -> dict:
+        with self._get_db() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+            cities = conn.execute("""
+                SELECT l.city, COUNT(*), r.refreshed_at
+                FROM listings l LEFT JOIN listing_refresh r ON r.city = l.city
+                GROUP BY l.city
+            """).fetchall()
+        now = time.time()
+        return {
+            "listings": total,
+            "cities": {
+                city: {
+                    "listings": count,
+                    "age_seconds": round(now - refreshed_at) if refreshed_at else None
+                }
+                for city, count, refreshed_at in cities
+            }
+        }
@@ -1,21 +1,46 @@
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, date, timedelta
 from enum import Enum
 import jwt
-from passlib.context import CryptContext
-import sqlite3
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 import os
-from typing import Optional, List, Dict
+import asyncio
+import hashlib
+import secrets
+import inspect
+import threading
+import time
+from typing import Optional, List, Dict, Callable, Iterable, Literal, Annotated
+from concurrent.futures import Future, ThreadPoolExecutor
+from jobs import JobQueue, QueueFullError, EmitFn
+from cache import ResultCache, TTLCache, make_key
+from dag import TaskGraph
+from registry import AgentRegistry
+from db import ConnectionPool
+from quota import QuotaEngine, FeatureNotInPlan, QuotaExceeded
+from passwords import PasswordHasher, HasherBusy
+from Scraper import ScraperRunner, create_http_cache, get_mock_data
+from listings import ListingStore
+from market import MarketIndex
+from queryparser import QueryParser
+import cassette
+import metrics
+import prompts
+import risk
+import roi
+import structured
 
 # CrewAI & AI imports
 from crewai import Agent, Task, Crew, Process, LLM
-import requests
-from bs4 import BeautifulSoup
+from crewai import llm as crewai_llm
+import litellm
+import httpx
+from openai import OpenAI
 import json
 
 # --- CONFIGURAZIONE ---
@@ -23,10 +48,75 @@ SECRET_KEY = "chiave_super_segreta_per_demo"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 DATABASE_PATH = "bighouse.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# Worker per le analisi AI in background
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "50"))
+# Per quanto restano consultabili i job terminati (pulizia all'avvio)
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", str(7 * 86400)))
+
+# Cache dei risultati AI (file SQLite accanto a bighouse.db)
+CACHE_DATABASE_PATH = "bighouse_cache.db"
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "500"))
+
+# Cache in memoria degli utenti autenticati (evita una query per ogni richiesta)
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Bcrypt: costo configurabile (gli hash vecchi vengono aggiornati al login)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "32"))
+
+# Portafoglio massimo per /features/roi/batch
+ROI_BATCH_MAX = int(os.getenv("ROI_BATCH_MAX", "20000"))
+
+# Estrazioni Monte Carlo per la simulazione del rischio di /features/calculate
+RISK_DRAWS = int(os.getenv("RISK_DRAWS", "10000"))
+
+# Scraping: "mock" (dati simulati) o "live" (Idealista, engine async in background)
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "mock")
+SCRAPER_MAX_LISTINGS = int(os.getenv("SCRAPER_MAX_LISTINGS", "200"))  # annunci per città a ogni refresh
+
+# Archivio annunci: una città viene riscaricata solo se più vecchia di così
+LISTINGS_STALE_SECONDS = float(os.getenv("LISTINGS_STALE_SECONDS", str(6 * 3600)))
+
+# Analisi di mercato di Deep Research: "llm" (l'agente riceve le statistiche esatte
+# dell'indice) o "index" (testo generato dall'indice, senza chiamare l'LLM)
+MARKET_ANALYSIS = os.getenv("MARKET_ANALYSIS", "llm")
+MARKET_TREND_DAYS = int(os.getenv("MARKET_TREND_DAYS", "90"))
+
+# Budget di token (stimati) per la descrizione di ogni task di Deep Research
+PROMPT_TASK_TOKENS = int(os.getenv("PROMPT_TASK_TOKENS", "1500"))
+
+# Gazetteer di comuni e zone per il parser delle query (comuni.csv nel formato ISTAT)
+GAZETTEER_DIR = os.getenv("GAZETTEER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+# Città usata quando la query non cita un comune del gazetteer (comuni.csv non è ancora completo)
+DEFAULT_CITY = os.getenv("DEFAULT_CITY", "Napoli")
 
 # DeepSeek API Configuration
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "sk-your-key-here")  # ← Metti la tua chiave qui
 DEEPSEEK_MODEL = "deepseek-chat"
+# Qualsiasi endpoint compatibile OpenAI (es. il server finto di benchmarks/fake_llm.py)
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+
+# Pool HTTP keep-alive condiviso verso l'API dell'LLM
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+
+# Token per /metrics e /admin/stats (header "Authorization: Bearer <token>").
+# Se non impostato i due endpoint non sono esposti (404)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Esecuzione dei task: "dag" (task indipendenti in parallelo) o "sequential"
+CREW_PROCESS = os.getenv("CREW_PROCESS", "dag")
+
+# Output degli scenari di Calcola ROI: "structured" (JSON mode letto in streaming,
+# riparazione dei soli campi non validi) o "text" (JSON estratto dal testo della crew)
+CALCULATION_OUTPUT = os.getenv("CALCULATION_OUTPUT", "structured")
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", "2"))
 
 app = FastAPI(title="Big House API - AI Powered")
 
@@ -38,7 +128,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    """Latenza per route (template, es. /jobs/{job_id}); per gli stream conta fino agli header"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status_code)
+        )
+
+password_hasher = PasswordHasher(rounds=BCRYPT_ROUNDS, max_workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING)
+user_cache = TTLCache(ttl_seconds=USER_CACHE_TTL_SECONDS, max_entries=USER_CACHE_MAX_ENTRIES)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class Plan(str, Enum):
@@ -47,19 +156,184 @@ class Plan(str, Enum):
     PLUS = "plus"
 
 # --- LLM CONFIGURATION ---
-def get_deepseek_llm():
-    """Inizializza DeepSeek LLM per CrewAI"""
-    return LLM(
-        model=f"openai/{DEEPSEEK_MODEL}",
+_llm: Optional[LLM] = None
+_llm_lock = threading.Lock()
+
+# A ogni chiamata CrewAI sostituisce sys.stdout/sys.stderr e i filtri di warnings
+# (crewai.llm.suppress_warnings): non è thread-safe e con più task in parallelo
+# (DAG, più job) il processo va in segfault. I messaggi di litellm che quel filtro
+# nascondeva si spengono una volta sola qui.
+crewai_llm.suppress_warnings = nullcontext
+litellm.suppress_debug_info = True
+
+def mark_llm_request(request: httpx.Request):
+    request.extensions["bighouse_started"] = time.perf_counter()
+
+def record_llm_response(response: httpx.Response):
+    """
+    Hook httpx del client LLM: latenza e token (campo "usage") per ruolo dell'agente.
+    Le risposte in streaming sono contate da stream_completion.
+    """
+    if "text/event-stream" in response.headers.get("content-type", ""):
+        return
+    response.read()
+    agent = metrics.current_agent()
+    started = response.request.extensions.get("bighouse_started")
+    if started is not None:
+        metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, agent=agent, status=str(response.status_code))
+    try:
+        metrics.record_usage(response.json().get("usage"), agent)
+    except (ValueError, AttributeError):
+        pass  # corpo non JSON (es. errore del proxy): niente token da contare
+
+def create_llm_transport() -> OpenAI:
+    """
+    Client OpenAI-compatibile con pool di connessioni keep-alive (thread-safe).
+    Con LLM_CASSETTE/CASSETTE_MODE le risposte vengono registrate o riprodotte (cassette.py).
+    """
+    pool = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+        )
+    )
+    return OpenAI(
         api_key=DEEPSEEK_API_KEY,
-        base_url="https://api.deepseek.com/v1",
-        temperature=0.3,
+        base_url=DEEPSEEK_BASE_URL,
+        http_client=httpx.Client(
+            transport=cassette.from_env(pool, "llm"),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            event_hooks={"request": [mark_llm_request], "response": [record_llm_response]},
+        ),
     )
 
+def get_deepseek_llm():
+    """DeepSeek LLM per CrewAI, creato una volta e condiviso da tutte le richieste"""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = LLM(
+                model=f"openai/{DEEPSEEK_MODEL}",
+                api_key=DEEPSEEK_API_KEY,
+                base_url=DEEPSEEK_BASE_URL,
+                temperature=0.3,
+                # Passato a litellm: riusa sempre lo stesso pool HTTP invece di ricrearlo
+                client=create_llm_transport(),
+            )
+    return _llm
+
+def stream_completion(llm: LLM, messages: List[dict], on_token: Callable[[str], None], response_format: Optional[dict] = None) -> str:
+    """
+    Chiamata LLM in streaming: passa ogni token a on_token e ritorna il testo completo.
+    Lo stream non riporta "usage": i token per le metriche sono stimati.
+    Con response_format={"type": "json_object"} DeepSeek risponde in JSON mode.
+    """
+    agent = metrics.current_agent()
+    start = time.perf_counter()
+    status_label = "error"
+    chunks = []
+    try:
+        response = litellm.completion(
+            model=llm.model,
+            api_key=llm.api_key,
+            api_base=llm.base_url,
+            temperature=llm.temperature,
+            messages=messages,
+            stream=True,
+            response_format=response_format,
+            client=llm.kwargs.get("client"),
+        )
+        
+        for chunk in response:
+            token = chunk.choices[0].delta.content
+            if token:
+                chunks.append(token)
+                on_token(token)
+        status_label = "200"
+    finally:
+        metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, agent=agent, status=status_label)
+        metrics.record_usage({
+            "prompt_tokens": prompt_builder.tokens("\n".join(m["content"] for m in messages)),
+            "completion_tokens": prompt_builder.tokens("".join(chunks)) if chunks else 0,
+        }, agent)
+    return "".join(chunks)
+
+def run_tasks(agents: List[Agent], tasks: List[Task], on_start: Optional[Callable[[Task], None]] = None) -> str:
+    """
+    Esegue i task secondo CREW_PROCESS e ritorna l'output dell'ultimo.
+    
+    - "dag": grafo ricavato da Task.context, i task indipendenti girano in parallelo
+    - "sequential": Crew classica, un task dopo l'altro
+    """
+    start = time.perf_counter()
+    status_label = "error"
+    try:
+        if CREW_PROCESS == "dag":
+            outputs = TaskGraph(tasks).run(on_start=on_start)
+            result = outputs[-1].raw
+        else:
+            result = run_sequential(agents, tasks, on_start)
+        status_label = "ok"
+        return result
+    finally:
+        metrics.CREW_SECONDS.observe(time.perf_counter() - start, process=CREW_PROCESS, status=status_label)
+
+def run_sequential(agents: List[Agent], tasks: List[Task], on_start: Optional[Callable[[Task], None]] = None) -> str:
+    """
+    Crew classica. Ogni task parte quando termina il precedente: il callback di
+    un task ne chiude la misura e apre quella del successivo (anche l'agente a
+    cui attribuire le chiamate LLM).
+    """
+    started = {}
+    
+    def begin(task):
+        started[id(task)] = time.perf_counter()
+        metrics.set_agent(task.agent.role)
+        if on_start:
+            on_start(task)
+    
+    def finish_then_start(task, previous_callback, next_task):
+        def callback(output):
+            metrics.TASK_SECONDS.observe(time.perf_counter() - started[id(task)], agent=task.agent.role, status="ok")
+            if previous_callback:
+                previous_callback(output)
+            if next_task:
+                begin(next_task)
+        return callback
+    
+    for current, following in zip(tasks, tasks[1:] + [None]):
+        current.callback = finish_then_start(current, current.callback, following)
+    begin(tasks[0])
+    
+    crew = Crew(
+        agents=agents,
+        tasks=tasks,
+        process=Process.sequential,
+        verbose=True
+    )
+    try:
+        return str(crew.kickoff())
+    finally:
+        metrics.set_agent(None)
+
 # --- DATABASE SETUP ---
+db_pool = ConnectionPool(DATABASE_PATH, size=DB_POOL_SIZE)
+cache_db_pool = ConnectionPool(CACHE_DATABASE_PATH, size=4, name="cache")
+
+@contextmanager
+def get_db():
+    """Connessione presa in prestito dal pool (WAL, statement preparati riusati)"""
+    with db_pool.connection() as conn:
+        yield conn
+
 def init_db():
     """Crea il database e la tabella users se non esistono"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    with get_db() as conn:
+        create_tables(conn)
+    print(f"✅ Database inizializzato: {DATABASE_PATH}")
+
+def create_tables(conn):
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -75,21 +349,17 @@ def init_db():
         )
     """)
     conn.commit()
-    conn.close()
-    print(f"✅ Database inizializzato: {DATABASE_PATH}")
-
-@contextmanager
-def get_db():
-    """Context manager per connessione database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
 
 init_db()
 
+job_queue = JobQueue(get_db, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl_seconds=JOB_TTL_SECONDS)
+quota = QuotaEngine(get_db, on_change=user_cache.invalidate)
+listing_store = ListingStore(get_db, stale_after_seconds=LISTINGS_STALE_SECONDS)
+market_index = MarketIndex(get_db, trend_days=MARKET_TREND_DAYS)
+result_cache = ResultCache(cache_db_pool.connection, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES)
+agent_registry = AgentRegistry(pool_size=JOB_WORKERS)
+prompt_builder = prompts.PromptBuilder(PROMPT_TASK_TOKENS, model=f"deepseek/{DEEPSEEK_MODEL}")
+
 # --- MODELLI PYDANTIC ---
 class UserRegister(BaseModel):
     email: EmailStr
@@ -112,14 +382,14 @@ class DeepResearchRequest(BaseModel):
 
 class CalculationRequest(BaseModel):
     city: str
-    buy_price: float
-    surface: float
+    buy_price: float = Field(gt=0)
+    surface: float = Field(gt=0)
     condition: str  # "nuovo", "buono", "da ristrutturare"
     
 class RenovationScenario(BaseModel):
-    level: str  # "bassa", "media", "alta"
-    cost: float
-    months: int
+    level: Literal["bassa", "media", "alta"]
+    cost: float = Field(ge=0)
+    months: int = Field(ge=0)
     description: str
     roi_rent: float
     roi_sell: float
@@ -128,12 +398,46 @@ class RenovationScenario(BaseModel):
 class PlanUpdate(BaseModel):
     plan: Plan
 
+class RoiAssumptions(BaseModel):
+    """Ipotesi del motore ROI (i campi non indicati usano roi.DEFAULT_ASSUMPTIONS)"""
+    # Aliquote e quote in [0, 1]: fuori range i conti non hanno senso (o dividono per zero)
+    contingency: Optional[float] = Field(None, ge=0)
+    purchase_tax_rate: Optional[float] = Field(None, ge=0, le=1)
+    closing_costs_rate: Optional[float] = Field(None, ge=0, le=1)
+    sale_costs_rate: Optional[float] = Field(None, ge=0, le=1)
+    capital_gains_tax: Optional[float] = Field(None, ge=0, le=1)
+    rent_yield: Optional[float] = Field(None, ge=0, le=1)
+    occupancy: Optional[float] = Field(None, ge=0, le=1)
+    rent_tax_rate: Optional[float] = Field(None, ge=0, le=1)
+    holding_costs_rate: Optional[float] = Field(None, ge=0, le=1)
+    loan_to_value: Optional[float] = Field(None, ge=0, le=1)
+    interest_rate: Optional[float] = Field(None, ge=0, le=1)
+    loan_years: Optional[int] = Field(None, ge=1)
+    sale_months: Optional[int] = Field(None, ge=0)
+
+class RoiBatchRequest(BaseModel):
+    """Portafoglio in formato colonnare: l'i-esimo elemento di ogni lista è un immobile"""
+    buy_price: List[Annotated[float, Field(gt=0)]]
+    surface: List[float]
+    condition: Optional[List[str]] = None
+    market_price_sqm: Optional[List[Optional[float]]] = None
+    assumptions: Optional[RoiAssumptions] = None
+    objective: str = "roi_sell"  # "roi_sell" o "roi_rent"
+    metrics: Optional[List[str]] = None  # sottoinsieme di roi.METRICS (default: roi.DEFAULT_METRICS)
+
 # --- AUTH & DATABASE HELPERS ---
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str):
+    """Ritorna (valida, nuovo_hash): nuovo_hash è valorizzato se il costo bcrypt è cambiato"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Troppe richieste, riprova tra poco", headers={"Retry-After": "1"})
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Troppe richieste, riprova tra poco", headers={"Retry-After": "1"})
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -161,11 +465,19 @@ def create_user(email: str, name: str, hashed_password: str):
         conn.commit()
         return cursor.lastrowid
 
+def update_user_password(email: str, hashed_password: str):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET hashed_password = ? WHERE email = ?", (hashed_password, email))
+        conn.commit()
+    user_cache.invalidate(email)
+
 def update_user_plan(email: str, new_plan: str):
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("UPDATE users SET plan = ? WHERE email = ?", (new_plan, email))
         conn.commit()
+    user_cache.invalidate(email)
 
 def reset_usage_if_new_day(user: dict):
     today = str(date.today())
@@ -178,19 +490,11 @@ def reset_usage_if_new_day(user: dict):
                 WHERE email = ?
             """, (today, user["email"]))
             conn.commit()
+        user_cache.invalidate(user["email"])
         user["usage_date"] = today
         user["deepresearch_count"] = 0
         user["calcola_count"] = 0
 
-def increment_usage(email: str, feature: str):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        if feature == "deepresearch":
-            cursor.execute("UPDATE users SET deepresearch_count = deepresearch_count + 1 WHERE email = ?", (email,))
-        else:
-            cursor.execute("UPDATE users SET calcola_count = calcola_count + 1 WHERE email = ?", (email,))
-        conn.commit()
-
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -200,76 +504,101 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except Exception:
         raise HTTPException(status_code=401, detail="Credenziali non valide")
     
-    user = get_user_by_email(email)
+    user = user_cache.get(email)
     if user is None:
-        raise HTTPException(status_code=401, detail="Utente non trovato")
+        epoch = user_cache.epoch(email)
+        user = await db_pool.run(get_user_by_email, email)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Utente non trovato")
+        user_cache.set(email, user, epoch)
     
-    reset_usage_if_new_day(user)
+    # Copia: l'handler può modificare il dict senza toccare la voce in cache
+    user = dict(user)
+    if user["usage_date"] != str(date.today()):
+        await db_pool.run(reset_usage_if_new_day, user)
     return user
 
-def check_limit(user: dict, feature: str):
-    plan = user["plan"]
-    count = user[f"{feature}_count"]
-
-    if plan == "free":
+def reserve_quota(user: dict, feature: str) -> dict:
+    """Riserva atomicamente una unità di quota prima di avviare il lavoro"""
+    try:
+        return quota.reserve(user["email"], feature)
+    except FeatureNotInPlan:
         raise HTTPException(status_code=403, detail="Upgrade richiesto per questa funzione")
-    
-    if plan == "pro":
-        if count >= 2:
-            raise HTTPException(status_code=429, detail="Limite giornaliero raggiunto. Passa a Plus.")
-    
-    return True
+    except QuotaExceeded:
+        raise HTTPException(status_code=429, detail="Limite giornaliero raggiunto. Passa a Plus.")
 
 # ═══════════════════════════════════════════════════════════════════════
 # 🤖 SISTEMA AGENTI AI - DEEP RESEARCH
 # ═══════════════════════════════════════════════════════════════════════
 
-def scrape_idealista(query_params: dict) -> List[dict]:
+scraper_runner = ScraperRunner(
+    use_scraper_api=bool(os.getenv("SCRAPER_API_KEY")),
+    cache=create_http_cache()
+) if SCRAPER_MODE == "live" else None
+
+def scrape_idealista(query_params: dict) -> Iterable[dict]:
     """
-    Scraping simulato di Idealista
+    Scraping di Idealista (simulato se SCRAPER_MODE != "live")
     
     IMPORTANTE: In produzione usa:
     - Rotating proxies (ScraperAPI, Bright Data)
     - Rate limiting
     - Rispetta robots.txt
     """
+    city = query_params["city"]
+    max_price = query_params.get("max_price")
+    
+    if scraper_runner:
+        # Segue la paginazione: gli annunci arrivano man mano, pagina dopo pagina
+        return scraper_runner.iterate(
+            "crawl_city",
+            city,
+            max_price,
+            condition="da_ristrutturare",
+            limit=SCRAPER_MAX_LISTINGS
+        )
+    
     # Simulazione per demo - in produzione fai scraping vero
-    city = query_params.get("city", "Napoli")
-    max_price = query_params.get("max_price", 200000)
+    return get_mock_data(city, max_price)
+
+def find_properties(query_params: dict, limit: int = 10) -> List[dict]:
+    """
+    Immobili dall'archivio locale; la rete viene usata solo se la città non è
+    aggiornata da più di LISTINGS_STALE_SECONDS.
+    """
+    city = query_params["city"]
+    max_price = query_params.get("max_price")
+    stale = listing_store.is_stale(city, max_price)
+    if stale:
+        changes = listing_store.upsert_stream(city, scrape_idealista(query_params), max_price)
+        print(f"🏘️ Archivio {city} aggiornato: {changes}")
+        if changes["inserted"] or changes["updated"] or changes["removed"]:
+            market_index.refresh(city)
     
-    # Dati simulati - in produzione scraping reale
-    mock_properties = [
-        {
-            "title": "Appartamento da ristrutturare - Centro Storico",
-            "price": 185000,
-            "surface": 85,
-            "rooms": 3,
-            "bathrooms": 1,
-            "floor": 2,
-            "condition": "da ristrutturare",
-            "address": "Via Toledo, Napoli",
-            "zone": "Centro Storico",
-            "url": "https://www.idealista.it/immobile/12345",
-            "description": "Appartamento in posizione centrale, necessita ristrutturazione completa. Ottimo per investimento.",
-            "price_per_sqm": 2176,
-        },
-        {
-            "title": "Trilocale da rinnovare - Vomero",
-            "price": 195000,
-            "surface": 90,
-            "rooms": 3,
-            "bathrooms": 1,
-            "floor": 4,
-            "condition": "da ristrutturare",
-            "address": "Via Luca Giordano, Napoli",
-            "zone": "Vomero",
-            "url": "https://www.idealista.it/immobile/12346",
-            "description": "Luminoso trilocale con balcone, da ristrutturare. Zona servita.",
-            "price_per_sqm": 2167,
-        },
-    ]
+    # Archivio precedente all'indice di mercato: lo si costruisce al primo accesso
+    if market_index.lookup(city) is None:
+        market_index.refresh(city)
     
-    return mock_properties
+    filters = {
+        "min_price": query_params.get("min_price"),
+        "max_price": max_price,
+        "min_surface": query_params.get("min_surface"),
+        "limit": limit
+    }
+    properties = search_listings(city, query_params.get("zone"), filters)
+    if not properties and SCRAPER_MODE == "mock" and not stale:
+        # I prezzi mock dipendono dal budget: quelli di un budget più alto non passano i filtri
+        listing_store.upsert_stream(city, scrape_idealista(query_params), max_price)
+        market_index.refresh(city)
+        properties = search_listings(city, query_params.get("zone"), filters)
+    return properties
+
+def search_listings(city: str, zone: Optional[str], filters: dict) -> List[dict]:
+    properties = listing_store.search(city, zone=zone, **filters)
+    if not properties and zone:
+        # Nessun annuncio nella zona: meglio il resto della città che niente
+        properties = listing_store.search(city, **filters)
+    return properties
 
 def create_deep_research_agents(llm):
     """Crea gli agenti specializzati per Deep Research"""
@@ -325,34 +654,58 @@ def create_deep_research_agents(llm):
         "investment_advisor": investment_advisor
     }
 
-def run_deep_research(query: str, properties: List[dict], llm) -> dict:
-    """Esegue ricerca approfondita con agenti AI"""
+def run_deep_research(
+    query: str,
+    properties: List[dict],
+    agents: dict,
+    emit: Optional[EmitFn] = None,
+    market_report: Optional[str] = None,
+    condition: Optional[str] = None
+) -> dict:
+    """
+    Esegue ricerca approfondita con agenti AI.
+    
+    Se `emit` è passato, pubblica 'task_started' / 'task_completed' per ogni task
+    e i token della raccomandazione finale ('token') man mano che arrivano.
     
-    agents = create_deep_research_agents(llm)
+    `market_report` sono le statistiche dell'indice di mercato: vengono date
+    all'analista come dati certi oppure, con MARKET_ANALYSIS="index", prendono
+    il posto del suo task. `condition` è lo stato degli immobili cercato
+    dall'utente (dal parser della query): guida stime dei lavori e raccomandazione.
+    """
     
-    # Prepara contesto
-    properties_text = json.dumps(properties, indent=2, ensure_ascii=False)
+    # Con l'indice di mercato l'analisi dei prezzi si può non chiedere all'LLM
+    skip_market = MARKET_ANALYSIS == "index" and market_report is not None
     
     # Task 1: Analisi mercato
-    market_task = Task(
-        description=f"""
+    market_data_text = f"""
+Dati di mercato dall'archivio annunci (numeri esatti, non stimarli di nuovo):
+{market_report}
+""" if market_report else ""
+    
+    # Immobili in tabella compatta, solo le colonne utili a ogni task, entro PROMPT_TASK_TOKENS
+    market_description, market_prompt = prompt_builder.task("""
 Analizza questi immobili trovati per la query: "{query}"
 
 Immobili disponibili:
-{properties_text}
-
+{properties}
+{market_data}
 Fornisci:
 1. Analisi dei prezzi al mq della zona
 2. Valutazione se sono sottovalutati o sovravalutati
 3. Trend del mercato in quella zona
-        """,
+        """, properties, prompts.MARKET_COLUMNS, query=query, market_data=market_data_text)
+    
+    market_task = Task(
+        description=market_description,
         agent=agents["market_analyzer"],
         expected_output="Analisi dettagliata del mercato con valutazione prezzi"
     )
     
     # Task 2: Valutazione ristrutturazione
-    renovation_task = Task(
-        description=f"""
+    renovation_description, renovation_prompt = prompt_builder.task("""
+Stato degli immobili cercato dall'utente: {condition}
+
 Per ogni immobile, stima:
 1. Costo ristrutturazione (bassa/media/alta)
 2. Mesi necessari
@@ -360,8 +713,11 @@ Per ogni immobile, stima:
 4. Valore finale stimato post-ristrutturazione
 
 Immobili:
-{properties_text}
-        """,
+{properties}
+        """, properties, prompts.RENOVATION_COLUMNS, condition=condition or "non indicato")
+    
+    renovation_task = Task(
+        description=renovation_description,
         agent=agents["renovation_expert"],
         expected_output="Stima costi e tempi ristrutturazione per ogni immobile"
     )
@@ -379,28 +735,104 @@ Per ognuno calcola:
 4. Raccomandazione (comprare/evitare/negoziare)
 
 Query originale: "{query}"
+Stato degli immobili cercato dall'utente: {condition or "non indicato"}
+{market_data_text if skip_market else ""}
         """,
         agent=agents["investment_advisor"],
         expected_output="Classifica TOP 3 con analisi dettagliata ROI e raccomandazioni",
-        context=[market_task, renovation_task]
+        context=[renovation_task] if skip_market else [market_task, renovation_task]
     )
     
-    # Crea crew e esegui
-    crew = Crew(
-        agents=list(agents.values()),
-        tasks=[market_task, renovation_task, investment_task],
-        process=Process.sequential,
-        verbose=True
-    )
+    analysis_tasks = {"renovation_analysis": renovation_task} if skip_market else {
+        "market_analysis": market_task,
+        "renovation_analysis": renovation_task
+    }
+    
+    # Token stimati in ingresso per task (il contesto dei task precedenti non è incluso)
+    prompt_tokens = {
+        "market_analysis": 0 if skip_market else market_prompt["tokens"],
+        "renovation_analysis": renovation_prompt["tokens"],
+        "investment_recommendation": prompt_builder.tokens(investment_task.description),
+        "properties_omitted": max(market_prompt["omitted"], renovation_prompt["omitted"])
+    }
     
-    result = crew.kickoff()
+    if emit is not None:
+        if skip_market:
+            emit("task_completed", {"task": "market_analysis", "output": market_report})
+        analysis = stream_deep_research(query, properties, agents, analysis_tasks, investment_task, emit)
+        analysis["prompt_tokens"] = prompt_tokens
+        return {"market_analysis": market_report, **analysis} if skip_market else analysis
+    
+    # Esegui: mercato e ristrutturazione sono indipendenti, l'investimento li attende
+    result = run_tasks(list(agents.values()), [*analysis_tasks.values(), investment_task])
+    
+    if skip_market:
+        market_analysis = market_report
+    else:
+        market_analysis = str(market_task.output) if hasattr(market_task, 'output') else "Analisi completata"
     
     return {
         "query": query,
         "properties_analyzed": len(properties),
-        "market_analysis": str(market_task.output) if hasattr(market_task, 'output') else "Analisi completata",
+        "market_analysis": market_analysis,
         "renovation_analysis": str(renovation_task.output) if hasattr(renovation_task, 'output') else "Valutazione completata",
         "investment_recommendation": str(investment_task.output) if hasattr(investment_task, 'output') else str(result),
+        "properties": properties,
+        "prompt_tokens": prompt_tokens
+    }
+
+def stream_deep_research(query: str, properties: List[dict], agents: dict, analysis_tasks: Dict[str, Task], investment_task: Task, emit: EmitFn) -> dict:
+    """
+    Variante in streaming di run_deep_research.
+    
+    I task di analisi girano con run_tasks e notificano inizio/fine; la raccomandazione
+    finale viene chiesta direttamente all'LLM in streaming, così i token arrivano
+    al client mentre vengono generati.
+    """
+    names = {id(task): name for name, task in analysis_tasks.items()}
+    
+    def on_task_done(task):
+        def callback(output):
+            emit("task_completed", {"task": names[id(task)], "output": str(output)})
+        return callback
+    
+    for task in analysis_tasks.values():
+        task.callback = on_task_done(task)
+    
+    run_tasks(
+        [task.agent for task in analysis_tasks.values()],
+        list(analysis_tasks.values()),
+        on_start=lambda task: emit("task_started", {"task": names[id(task)], "agent": task.agent.role})
+    )
+    
+    # Raccomandazione finale: stessa persona dell'agente, output in streaming
+    advisor = agents["investment_advisor"]
+    context = "\n\n".join(str(task.output) for task in investment_task.context)
+    messages = [
+        {
+            "role": "system",
+            "content": f"Sei un {advisor.role}. {advisor.backstory}\nIl tuo obiettivo: {advisor.goal}"
+        },
+        {
+            "role": "user",
+            "content": f"{investment_task.description}\n\nContesto:\n{context}\n\n"
+                       f"Output atteso: {investment_task.expected_output}"
+        },
+    ]
+    
+    emit("task_started", {"task": "investment_recommendation", "agent": advisor.role})
+    with metrics.agent_scope(advisor.role):
+        recommendation = stream_completion(
+            advisor.llm, messages,
+            lambda token: emit("token", {"task": "investment_recommendation", "text": token})
+        )
+    emit("task_completed", {"task": "investment_recommendation", "output": recommendation})
+    
+    return {
+        "query": query,
+        "properties_analyzed": len(properties),
+        **{name: str(task.output) for name, task in analysis_tasks.items()},
+        "investment_recommendation": recommendation,
         "properties": properties
     }
 
@@ -450,10 +882,13 @@ def create_calculation_agents(llm):
         "risk_analyst": risk_analyst
     }
 
-def run_advanced_calculation(data: dict, llm) -> List[RenovationScenario]:
-    """Calcola 3 scenari di ristrutturazione con agenti AI"""
+def run_advanced_calculation(data: dict, agents: dict, on_fallback: Optional[Callable[[Exception], None]] = None) -> List[RenovationScenario]:
+    """
+    Calcola 3 scenari di ristrutturazione con agenti AI.
     
-    agents = create_calculation_agents(llm)
+    `on_fallback` viene chiamata se l'output dell'AI non è utilizzabile e si
+    ripiega sugli scenari predefiniti.
+    """
     
     city = data["city"]
     buy_price = data["buy_price"]
@@ -469,13 +904,8 @@ Immobile da analizzare:
 - Prezzo al mq: €{buy_price/surface:,.0f}/mq
     """
     
-    # Task 1: Calcola costi per 3 scenari
-    cost_task = Task(
-        description=f"""
-{context_text}
-
-Calcola i costi di ristrutturazione per 3 scenari:
-
+    # I 3 scenari: condivisi da costi e tempi, così i due task non dipendono l'uno dall'altro
+    scenarios_text = """
 1. RISTRUTTURAZIONE BASSA (cosmetica):
    - Tinteggiatura
    - Pavimenti esistenti lucidati
@@ -493,7 +923,15 @@ Calcola i costi di ristrutturazione per 3 scenari:
    - Cucina e bagni di lusso
    - Domotica
    - Impianti certificati
+    """
+    
+    # Task 1: Calcola costi per 3 scenari
+    cost_task = Task(
+        description=f"""
+{context_text}
 
+Calcola i costi di ristrutturazione per 3 scenari:
+{scenarios_text}
 Per ogni scenario fornisci:
 - Costo totale in €
 - Costo al mq
@@ -508,6 +946,8 @@ Per ogni scenario fornisci:
         description=f"""
 {context_text}
 
+Scenari di ristrutturazione:
+{scenarios_text}
 Per ognuno dei 3 scenari di ristrutturazione, pianifica:
 1. Mesi necessari (realistici)
 2. Fasi dei lavori
@@ -520,8 +960,7 @@ Considera:
 - Stagionalità lavori
         """,
         agent=agents["timeline_planner"],
-        expected_output="Timeline per ogni scenario con stima mesi realistica",
-        context=[cost_task]
+        expected_output="Timeline per ogni scenario con stima mesi realistica"
     )
     
     # Task 3: Analisi rischi e ROI
@@ -570,15 +1009,13 @@ Output in formato JSON con questa struttura:
         context=[cost_task, timeline_task]
     )
     
-    # Crea crew
-    crew = Crew(
-        agents=list(agents.values()),
-        tasks=[cost_task, timeline_task, risk_task],
-        process=Process.sequential,
-        verbose=True
-    )
+    if CALCULATION_OUTPUT == "structured":
+        # Costi e tempi con la crew; l'analista dei rischi risponde in JSON mode, letto mentre arriva
+        run_tasks([agents["cost_estimator"], agents["timeline_planner"]], [cost_task, timeline_task])
+        return structured_scenarios(data, context_text, risk_task, on_fallback)
     
-    result = crew.kickoff()
+    # Esegui: costi e tempi in parallelo, l'analisi rischi li attende entrambi
+    result = run_tasks(list(agents.values()), [cost_task, timeline_task, risk_task])
     
     # Parse output
     try:
@@ -592,77 +1029,125 @@ Output in formato JSON con questa struttura:
             json_str = result_str[start:end]
             scenarios_data = json.loads(json_str)
         else:
-            # Fallback: dati simulati se l'AI non produce JSON valido
-            scenarios_data = generate_fallback_scenarios(buy_price, surface, city)
+            # Fallback: scenari dal motore ROI se l'AI non produce JSON valido
+            scenarios_data = generate_fallback_scenarios(buy_price, surface, city, condition)
+            if on_fallback:
+                on_fallback(ValueError("Nessun JSON nell'output della crew"))
         
         scenarios = [RenovationScenario(**s) for s in scenarios_data]
         
     except Exception as e:
         print(f"⚠️ Errore parsing JSON: {e}")
+        if on_fallback:
+            on_fallback(e)
         # Fallback
-        scenarios = [
-            RenovationScenario(
-                level="bassa",
-                cost=surface * 300,
-                months=2,
-                description="Ristrutturazione cosmetica: tinteggiatura, pavimenti lucidati, aggiornamento impianti base",
-                roi_rent=4.5,
-                roi_sell=12.0,
-                risks=["Ritardi per materiali", "Costi nascosti imprevisti"]
-            ),
-            RenovationScenario(
-                level="media",
-                cost=surface * 600,
-                months=4,
-                description="Ristrutturazione completa: nuovo pavimento, cucina e bagno rinnovati, impianti rifatti",
-                roi_rent=5.2,
-                roi_sell=18.5,
-                risks=["Sforamenti budget 10-15%", "Ritardi per permessi", "Difficoltà reperimento materiali"]
-            ),
-            RenovationScenario(
-                level="alta",
-                cost=surface * 1000,
-                months=6,
-                description="Ristrutturazione premium: layout ridisegnato, finiture di lusso, domotica, certificazioni energetiche",
-                roi_rent=6.0,
-                roi_sell=25.0,
-                risks=["Sforamenti budget 20%+", "Ritardi significativi", "Mercato limitato per immobili premium"]
-            )
-        ]
+        scenarios = [RenovationScenario(**s) for s in generate_fallback_scenarios(buy_price, surface, city, condition)]
     
     return scenarios
 
-def generate_fallback_scenarios(buy_price: float, surface: float, city: str) -> List[dict]:
-    """Genera scenari fallback se gli agenti AI falliscono"""
-    return [
-        {
-            "level": "bassa",
-            "cost": surface * 300,
-            "months": 2,
-            "description": "Ristrutturazione cosmetica: tinteggiatura, pavimenti lucidati, impianti base aggiornati",
-            "roi_rent": 4.2,
-            "roi_sell": 12.0,
-            "risks": ["Ritardi materiali", "Costi nascosti 5-10%"]
-        },
+JSON_MODE = {"type": "json_object"}
+
+def structured_scenarios(data: dict, context_text: str, risk_task: Task, on_fallback: Optional[Callable[[Exception], None]] = None) -> List[RenovationScenario]:
+    """
+    I 3 scenari dall'analista dei rischi in JSON mode (stessa persona dell'agente).
+    
+    Ogni scenario viene validato appena il suo oggetto si chiude nello stream e,
+    se non è valido, parte subito una richiesta che corregge solo i campi
+    sbagliati (senza rilanciare la crew). Uno scenario che manca viene chiesto
+    da solo; se resta non valido lo sostituisce quello del motore ROI, mentre
+    gli altri restano quelli dell'AI.
+    """
+    analyst = risk_task.agent
+    persona = {
+        "role": "system",
+        "content": f"Sei un {analyst.role}. {analyst.backstory}\nIl tuo obiettivo: {analyst.goal}"
+    }
+    context = "\n\n".join(str(task.output) for task in risk_task.context)
+    messages = [
+        persona,
         {
-            "level": "media",
-            "cost": surface * 600,
-            "months": 4,
-            "description": "Ristrutturazione completa: nuovo pavimento, cucina/bagno rinnovati, impianti rifatti, serramenti nuovi",
-            "roi_rent": 5.5,
-            "roi_sell": 18.0,
-            "risks": ["Sforamenti budget 10-15%", "Ritardi permessi", "Problemi strutturali nascosti"]
+            "role": "user",
+            "content": f"{risk_task.description}\n\nContesto:\n{context}\n\n"
+                       f"Rispondi solo con un oggetto JSON {{\"scenarios\": [...]}} con i 3 scenari "
+                       f"nell'ordine {', '.join(roi.LEVELS)}. Ogni scenario segue questo JSON Schema:\n"
+                       f"{structured.schema_for(RenovationScenario)}"
         },
-        {
-            "level": "alta",
-            "cost": surface * 1000,
-            "months": 6,
-            "description": "Ristrutturazione premium: demolizioni, layout ridisegnato, finiture lusso, domotica, certificazioni",
-            "roi_rent": 6.5,
-            "roi_sell": 25.0,
-            "risks": ["Sforamenti 20%+", "Ritardi significativi", "Mercato limitato", "Difficoltà vendita"]
-        }
     ]
+    
+    def ask(level: str) -> Callable[[dict, Dict[str, str]], str]:
+        def ask_fields(value: dict, errors: Dict[str, str]) -> str:
+            fields = list(errors)
+            problems = "\n".join(f"- {field}: {message}" for field, message in errors.items())
+            repair_messages = [
+                persona,
+                {
+                    "role": "user",
+                    "content": f"{context_text}\nContesto:\n{context}\n\n"
+                               f"Nello scenario di ristrutturazione \"{level}\" questi campi mancano o non sono validi:\n"
+                               f"{problems}\n\nScenario attuale: {json.dumps(value, ensure_ascii=False)}\n\n"
+                               f"Rispondi solo con un oggetto JSON con i campi {', '.join(fields)}, "
+                               f"secondo questo JSON Schema:\n{structured.schema_for(RenovationScenario, fields)}"
+                },
+            ]
+            with metrics.agent_scope(analyst.role):
+                return stream_completion(analyst.llm, repair_messages, lambda token: None, JSON_MODE)
+        return ask_fields
+    
+    valid: Dict[str, RenovationScenario] = {}
+    repairs: Dict[str, Future] = {}
+    
+    with ThreadPoolExecutor(max_workers=len(roi.LEVELS), thread_name_prefix="bighouse-repair") as executor:
+        def settle(level: str, value: dict):
+            value = {**value, "level": level}
+            if structured.field_errors(RenovationScenario, value):
+                repairs[level] = executor.submit(
+                    structured.repair, RenovationScenario, value, ask(level), STRUCTURED_REPAIR_ATTEMPTS
+                )
+            else:
+                valid[level] = RenovationScenario(**value)
+        
+        scanner = structured.ArrayScanner()
+        
+        def on_token(token: str):
+            for _, value, _ in scanner.feed(token):
+                free = [level for level in roi.LEVELS if level not in valid and level not in repairs]
+                if not free:
+                    continue
+                value = value if isinstance(value, dict) else {}
+                claimed = str(value.get("level", "")).strip().lower()
+                settle(claimed if claimed in free else free[0], value)
+        
+        with metrics.agent_scope(analyst.role):
+            stream_completion(analyst.llm, messages, on_token, JSON_MODE)
+        
+        for level in roi.LEVELS:
+            if level not in valid and level not in repairs:
+                settle(level, {})
+        
+        scenarios = []
+        fallback = None
+        for level in roi.LEVELS:
+            if level in valid:
+                scenarios.append(valid[level])
+                continue
+            try:
+                scenario, errors = repairs[level].result()
+            except Exception as e:
+                scenario, errors = None, {structured.WHOLE_OBJECT: str(e)}
+            if scenario is None:
+                print(f"⚠️ Scenario {level} non valido dopo la riparazione: {errors}")
+                if on_fallback:
+                    on_fallback(ValueError(f"Scenario {level} non valido: {', '.join(errors)}"))
+                if fallback is None:
+                    fallback = {s["level"]: s for s in generate_fallback_scenarios(data["buy_price"], data["surface"], data["city"], data["condition"])}
+                scenario = RenovationScenario(**fallback[level])
+            scenarios.append(scenario)
+    
+    return scenarios
+
+def generate_fallback_scenarios(buy_price: float, surface: float, city: str, condition: str = "da ristrutturare") -> List[dict]:
+    """Scenari calcolati dal motore ROI deterministico se gli agenti AI falliscono"""
+    return roi.scenarios_for(buy_price, surface, condition)
 
 # ═══════════════════════════════════════════════════════════════════════
 # 📡 ENDPOINTS API
@@ -670,20 +1155,26 @@ def generate_fallback_scenarios(buy_price: float, surface: float, city: str) ->
 
 @app.post("/auth/register", response_model=Token)
 async def register(user_in: UserRegister):
-    if get_user_by_email(user_in.email):
+    if await db_pool.run(get_user_by_email, user_in.email):
         raise HTTPException(status_code=400, detail="Email già registrata")
     
-    hashed_pw = get_password_hash(user_in.password)
-    create_user(user_in.email, user_in.name, hashed_pw)
+    hashed_pw = await get_password_hash(user_in.password)
+    await db_pool.run(create_user, user_in.email, user_in.name, hashed_pw)
     
     access_token = create_access_token(data={"sub": user_in.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/auth/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = get_user_by_email(form_data.username)
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    user = await db_pool.run(get_user_by_email, form_data.username)
+    if not user:
+        raise HTTPException(status_code=400, detail="Email o password errati")
+    
+    valid, new_hash = await verify_password(form_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(status_code=400, detail="Email o password errati")
+    if new_hash:
+        await db_pool.run(update_user_password, user["email"], new_hash)
     
     access_token = create_access_token(data={"sub": user["email"]})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -702,64 +1193,70 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
 
 @app.post("/billing/upgrade")
 async def upgrade_plan(plan_update: PlanUpdate, current_user: dict = Depends(get_current_user)):
-    update_user_plan(current_user["email"], plan_update.plan)
+    await db_pool.run(update_user_plan, current_user["email"], plan_update.plan)
     return {"status": "success", "new_plan": plan_update.plan}
 
-@app.post("/features/deep-research")
-async def deep_research_ai(
-    req: DeepResearchRequest, 
-    background_tasks: BackgroundTasks,
-    current_user: dict = Depends(get_current_user)
-):
+# ═══════════════════════════════════════════════════════════════════════
+# ⏳ JOB IN BACKGROUND - ESECUZIONE ANALISI
+# ═══════════════════════════════════════════════════════════════════════
+
+query_parser = QueryParser(GAZETTEER_DIR, default_city=DEFAULT_CITY)
+
+def parse_research_query(query: str) -> dict:
     """
-    🤖 DEEP RESEARCH CON AGENTI AI
-    
-    Trova immobili reali e li analizza con 4 agenti specializzati
+    Estrae città, zona, budget, superficie e stato dalla query testuale.
+    Es: "Trilocale al Vomero, max 250k, almeno 80 mq, da ristrutturare"
     """
-    check_limit(current_user, "deepresearch")
-    
-    # Parse query
-    # Es: "Napoli, 200k€, da ristrutturare"
-    query_lower = req.query.lower()
-    
-    # Estrai parametri (parsing semplice - migliora con NLP)
-    city = "Napoli"  # Default
-    if "napoli" in query_lower:
-        city = "Napoli"
-    elif "roma" in query_lower:
-        city = "Roma"
-    elif "milano" in query_lower:
-        city = "Milano"
-    
-    max_price = 200000  # Default
-    if "200k" in query_lower or "200.000" in query_lower:
-        max_price = 200000
-    elif "300k" in query_lower:
-        max_price = 300000
+    # Comune assente dal gazetteer: come prima del parser, si ripiega su DEFAULT_CITY
+    return query_parser.parse(query)
+
+def prompt_fingerprint(*functions) -> str:
+    """Hash del codice che costruisce agenti e prompt: se cambia, la cache si invalida"""
+    source = "".join(inspect.getsource(f) for f in functions)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+DEEP_RESEARCH_PROMPTS = prompt_fingerprint(create_deep_research_agents, run_deep_research, stream_deep_research, prompts.encode_properties)
+CALCULATION_PROMPTS = prompt_fingerprint(create_calculation_agents, run_advanced_calculation, structured_scenarios)
+
+def execute_deep_research(payload: dict, emit: EmitFn) -> dict:
+    """Job 'deepresearch': scraping + agenti AI (eseguito in un worker)"""
+    query = payload["query"]
     
     # Step 1: Scraping immobili
-    properties = scrape_idealista({
-        "city": city,
-        "max_price": max_price,
-        "condition": "da ristrutturare"
-    })
+    emit("status", {"stage": "scraping"})
+    # I job accodati prima del parser non hanno "params"
+    query_params = payload.get("params") or parse_research_query(query)
+    properties = find_properties(query_params, limit=payload.get("max_results") or 10)
+    emit("properties", {"count": len(properties), "properties": properties})
     
+    # I job accodati prima delle prenotazioni non hanno "reservation" (refund e conteggi saltati)
+    reservation = payload.get("reservation")
     if not properties:
+        quota.refund(reservation)
         return {
             "result": "Nessun immobile trovato per i criteri specificati. Prova ad ampliare la ricerca.",
             "properties": [],
-            "remaining_usage": 2 - (current_user["deepresearch_count"] + 1) if current_user["plan"] == "pro" else "Unlimited"
+            "remaining_usage": quota.remaining(reservation)
         }
     
-    # Step 2: Analisi con agenti AI
-    llm = get_deepseek_llm()
-    analysis = run_deep_research(req.query, properties, llm)
+    # Step 2: Analisi con agenti AI (o risultato già in cache)
+    market_report = market_index.report(query_params["city"], properties)
+    cache_key = make_key("deepresearch", DEEPSEEK_MODEL, DEEP_RESEARCH_PROMPTS, MARKET_ANALYSIS, query, query_params.get("condition"), properties, market_report)
+    analysis = result_cache.get("deepresearch", cache_key)
+    cached = analysis is not None
     
-    # Incrementa usage
-    if current_user["plan"] != "plus":
-        increment_usage(current_user["email"], "deepresearch")
+    if cached:
+        emit("status", {"stage": "cache_hit"})
+    else:
+        with agent_registry.checkout("deepresearch") as agents:
+            analysis = run_deep_research(
+                query, properties, agents, emit if payload.get("stream") else None, market_report, query_params.get("condition")
+            )
+        result_cache.set("deepresearch", cache_key, analysis)
     
-    remaining = 2 - (current_user["deepresearch_count"] + 1) if current_user["plan"] == "pro" else "Unlimited"
+    # I risultati dalla cache non consumano quota
+    if cached:
+        quota.refund(reservation)
     
     return {
         "result": analysis["investment_recommendation"],
@@ -767,9 +1264,202 @@ async def deep_research_ai(
         "renovation_analysis": analysis["renovation_analysis"],
         "properties": analysis["properties"],
         "properties_count": len(properties),
-        "remaining_usage": remaining
+        "prompt_tokens": analysis.get("prompt_tokens"),
+        "cached": cached,
+        "remaining_usage": quota.remaining(reservation)
+    }
+
+def execute_calculation(payload: dict, emit: EmitFn) -> dict:
+    """Job 'calcola': 3 scenari di ristrutturazione (eseguito in un worker)"""
+    data = payload["data"]
+    
+    # Calcola con agenti AI (o risultato già in cache)
+    cache_key = make_key("calcola", DEEPSEEK_MODEL, CALCULATION_PROMPTS, data)
+    scenarios = result_cache.get("calcola", cache_key)
+    cached = scenarios is not None
+    
+    if not cached:
+        fallback_errors = []
+        with agent_registry.checkout("calcola") as agents:
+            scenarios = [s.dict() for s in run_advanced_calculation(data, agents, fallback_errors.append)]
+        # Gli scenari di fallback non vanno in cache: al prossimo giro si riprova con l'AI
+        if not fallback_errors:
+            result_cache.set("calcola", cache_key, scenarios)
+    
+    # I risultati dalla cache non consumano quota (i job accodati prima delle prenotazioni non ne hanno)
+    reservation = payload.get("reservation")
+    if cached:
+        quota.refund(reservation)
+    
+    # Percentili di ROI e probabilità di perdita attorno a costi e tempi degli scenari
+    # (deterministica per immobile, non serve in cache)
+    by_level = {s["level"]: s for s in scenarios}
+    base = [by_level[level] for level in roi.LEVELS] if set(roi.LEVELS) <= set(by_level) else None
+    risk_simulation = risk.simulate(
+        data["buy_price"], data["surface"], data["condition"], draws=RISK_DRAWS,
+        cost=base and [s["cost"] for s in base], months=base and [s["months"] for s in base]
+    )
+    
+    return {
+        "scenarios": scenarios,
+        "risk_simulation": risk_simulation,
+        "buy_price": data["buy_price"],
+        "surface": data["surface"],
+        "city": data["city"],
+        "price_per_sqm": data["buy_price"] / data["surface"],
+        "cached": cached,
+        "remaining_usage": quota.remaining(reservation)
     }
 
+def share_result(payload: dict, leader: Future) -> dict:
+    """
+    Job agganciato a uno identico già in corso: riceve lo stesso risultato e,
+    come per la cache, non consuma quota (la paga solo chi ha lanciato la crew).
+    """
+    result = leader.result()
+    reservation = payload.get("reservation")
+    quota.refund(reservation)
+    return {**result, "shared": True, "remaining_usage": quota.remaining(reservation)}
+
+def refund_on_failure(handler: Callable[..., dict]) -> Callable[..., dict]:
+    """Se il job fallisce, la quota riservata all'avvio viene restituita"""
+    def run(payload: dict, *args) -> dict:
+        try:
+            return handler(payload, *args)
+        except Exception:
+            quota.refund(payload.get("reservation"))
+            raise
+    return run
+
+job_queue.register("deepresearch", refund_on_failure(execute_deep_research), share=refund_on_failure(share_result))
+job_queue.register("calcola", refund_on_failure(execute_calculation), share=refund_on_failure(share_result))
+
+agent_registry.register("deepresearch", lambda: create_deep_research_agents(get_deepseek_llm()))
+agent_registry.register("calcola", lambda: create_calculation_agents(get_deepseek_llm()))
+
+def coalesce_key(kind: str, payload: dict) -> Optional[str]:
+    """Richieste con gli stessi input normalizzati (e stessi modello e prompt) condividono la crew"""
+    if payload.get("stream"):
+        # Chi segue un altro job non riceverebbe i token già emessi né, se lo
+        # stream è suo, quelli del leader che non fa streaming: si esegue da solo
+        return None
+    if kind == "deepresearch":
+        return make_key(kind, DEEPSEEK_MODEL, DEEP_RESEARCH_PROMPTS, MARKET_ANALYSIS,
+                        payload["query"], payload["params"], payload["max_results"])
+    return make_key(kind, DEEPSEEK_MODEL, CALCULATION_PROMPTS, payload["data"])
+
+def submit_job(kind: str, payload: dict, owner: str, emit: Optional[EmitFn] = None) -> str:
+    try:
+        return job_queue.submit(kind, payload, owner, emit, coalesce_key=coalesce_key(kind, payload))
+    except QueueFullError:
+        quota.refund(payload.get("reservation"))
+        raise HTTPException(status_code=503, detail="Server occupato, riprova tra poco")
+
+def deep_research_payload(req: DeepResearchRequest, params: dict, reservation: dict) -> dict:
+    return {
+        "query": req.query,
+        "params": params,
+        "max_results": req.max_results,
+        "reservation": reservation
+    }
+
+def calculation_payload(req: CalculationRequest, reservation: dict) -> dict:
+    return {
+        "data": {
+            "city": req.city,
+            "buy_price": req.buy_price,
+            "surface": req.surface,
+            "condition": req.condition
+        },
+        "reservation": reservation
+    }
+
+@app.on_event("startup")
+async def resume_jobs():
+    # Agenti e client LLM pronti prima della prima richiesta
+    agent_registry.warm_up()
+    job_queue.resume()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    job_queue.shutdown()
+    password_hasher.shutdown()
+    if scraper_runner:
+        scraper_runner.close()
+
+@app.post("/features/deep-research")
+async def deep_research_ai(
+    req: DeepResearchRequest, 
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    🤖 DEEP RESEARCH CON AGENTI AI
+    
+    Trova immobili reali e li analizza con 4 agenti specializzati.
+    La crew gira nel pool di worker: l'event loop resta libero durante l'attesa.
+    """
+    # Query interpretata prima di consumare quota
+    params = parse_research_query(req.query)
+    reservation = await db_pool.run(reserve_quota, current_user, "deepresearch")
+    
+    job_id = await db_pool.run(submit_job, "deepresearch", deep_research_payload(req, params, reservation), current_user["email"])
+    return await job_queue.wait(job_id)
+
+@app.post("/features/deep-research/jobs", status_code=202)
+async def deep_research_job(
+    req: DeepResearchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Accoda una Deep Research e ritorna subito l'id del job da interrogare"""
+    # Query interpretata prima di consumare quota
+    params = parse_research_query(req.query)
+    reservation = await db_pool.run(reserve_quota, current_user, "deepresearch")
+    
+    job_id = await db_pool.run(submit_job, "deepresearch", deep_research_payload(req, params, reservation), current_user["email"])
+    return {"job_id": job_id, "status": "queued"}
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/features/deep-research/stream")
+async def deep_research_stream(
+    req: DeepResearchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Deep Research in streaming (Server-Sent Events).
+    
+    Eventi: job, status, properties, task_started, task_completed, token, done, error.
+    Se il client si disconnette il job prosegue e resta consultabile su /jobs/{job_id}.
+    """
+    # Query interpretata prima di consumare quota
+    params = parse_research_query(req.query)
+    reservation = await db_pool.run(reserve_quota, current_user, "deepresearch")
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def emit(event: str, data):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+    
+    payload = deep_research_payload(req, params, reservation)
+    payload["stream"] = True
+    job_id = await db_pool.run(submit_job, "deepresearch", payload, current_user["email"], emit)
+    
+    async def event_stream():
+        yield format_sse("job", {"job_id": job_id})
+        while True:
+            event, data = await events.get()
+            yield format_sse(event, data)
+            if event in ("done", "error"):
+                break
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/features/calculate")
 async def calculate_advanced_roi(
     req: CalculationRequest,
@@ -780,38 +1470,79 @@ async def calculate_advanced_roi(
     
     Analizza 3 scenari di ristrutturazione con agenti AI specializzati
     """
-    check_limit(current_user, "calcola")
+    reservation = await db_pool.run(reserve_quota, current_user, "calcola")
     
-    # Calcola con agenti AI
-    llm = get_deepseek_llm()
+    job_id = await db_pool.run(submit_job, "calcola", calculation_payload(req, reservation), current_user["email"])
+    return await job_queue.wait(job_id)
+
+@app.post("/features/calculate/jobs", status_code=202)
+async def calculate_job(
+    req: CalculationRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Accoda un Calcolo ROI e ritorna subito l'id del job da interrogare"""
+    reservation = await db_pool.run(reserve_quota, current_user, "calcola")
     
-    data = {
-        "city": req.city,
-        "buy_price": req.buy_price,
-        "surface": req.surface,
-        "condition": req.condition
-    }
+    job_id = await db_pool.run(submit_job, "calcola", calculation_payload(req, reservation), current_user["email"])
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Stato e risultato di un job (solo per il proprietario)"""
+    job = await db_pool.run(job_queue.get, job_id)
+    if job is None or job["owner"] != current_user["email"]:
+        raise HTTPException(status_code=404, detail="Job non trovato")
     
-    scenarios = run_advanced_calculation(data, llm)
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+# ═══════════════════════════════════════════════════════════════════════
+# 📐 ROI IN BATCH - MOTORE DETERMINISTICO, NESSUNA CHIAMATA AI
+# ═══════════════════════════════════════════════════════════════════════
+
+@app.post("/features/roi/batch")
+async def roi_batch(req: RoiBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Valuta i 3 scenari per un intero portafoglio (risposta colonnare)"""
+    count = len(req.buy_price)
+    if count == 0 or count > ROI_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Servono da 1 a {ROI_BATCH_MAX} immobili")
+    for name in ("surface", "condition", "market_price_sqm"):
+        column = getattr(req, name)
+        if column is not None and len(column) != count:
+            raise HTTPException(status_code=400, detail=f"'{name}' deve avere {count} elementi")
+    if min(req.surface) <= 0:
+        raise HTTPException(status_code=400, detail="La superficie deve essere positiva")
+    if req.objective not in ("roi_sell", "roi_rent"):
+        raise HTTPException(status_code=400, detail="objective deve essere 'roi_sell' o 'roi_rent'")
+    unknown = set(req.metrics or []) - set(roi.METRICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Metriche sconosciute: {', '.join(sorted(unknown))}")
     
-    # Incrementa usage
-    if current_user["plan"] != "plus":
-        increment_usage(current_user["email"], "calcola")
+    market = None
+    if req.market_price_sqm is not None:
+        market = [float("nan") if value is None else value for value in req.market_price_sqm]
+    assumptions = req.assumptions.model_dump(exclude_none=True) if req.assumptions else {}
     
-    remaining = 2 - (current_user["calcola_count"] + 1) if current_user["plan"] == "pro" else "Unlimited"
+    results = roi.evaluate(req.buy_price, req.surface, req.condition, market, **assumptions)
     
-    return {
-        "scenarios": [s.dict() for s in scenarios],
-        "buy_price": req.buy_price,
-        "surface": req.surface,
-        "city": req.city,
-        "price_per_sqm": req.buy_price / req.surface,
-        "remaining_usage": remaining
-    }
+    # JSONResponse diretta: evita jsonable_encoder su decine di migliaia di valori
+    return JSONResponse({
+        "count": count,
+        "levels": roi.LEVELS,
+        "assumptions": {**roi.DEFAULT_ASSUMPTIONS, **assumptions},
+        "best_level": roi.best_levels(results, req.objective),
+        "metrics": roi.to_columns(results, req.metrics)
+    })
 
-@app.get("/admin/stats")
-async def get_stats():
-    """Statistiche database (rimuovi in produzione!)"""
+def read_db_stats() -> dict:
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) as total FROM users")
@@ -819,10 +1550,55 @@ async def get_stats():
         
         cursor.execute("SELECT plan, COUNT(*) as count FROM users GROUP BY plan")
         plans = {row[0]: row[1] for row in cursor.fetchall()}
+        
+        cursor.execute("SELECT status, COUNT(*) as count FROM jobs GROUP BY status")
+        jobs = {row[0]: row[1] for row in cursor.fetchall()}
     
     return {
         "total_users": total_users,
         "plans": plans,
+        "jobs": jobs,
+        "cache": result_cache.stats(),
+        "listings": listing_store.stats(),
+        "market_index": market_index.stats()
+    }
+
+def collect_gauges():
+    metrics.JOBS_PENDING.set(job_queue.pending())
+    metrics.PASSWORD_HASHES_IN_FLIGHT.set(password_hasher.stats()["in_flight"])
+
+metrics.REGISTRY.on_collect(collect_gauges)
+
+def require_admin(request: Request):
+    """Accesso agli endpoint operativi solo con ADMIN_TOKEN (Prometheus lo manda come bearer token)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    header = request.headers.get("authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Token amministratore non valido",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Metriche in formato Prometheus (richiede ADMIN_TOKEN)"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def get_stats():
+    """Statistiche database (richiede ADMIN_TOKEN)"""
+    stats = await db_pool.run(read_db_stats)
+    
+    return {
+        **stats,
+        "user_cache": user_cache.stats(),
+        "agents": agent_registry.stats(),
+        "passwords": password_hasher.stats(),
+        "scraper_hosts": scraper_runner.scraper.limiter.stats() if scraper_runner else {},
+        "http_cache": scraper_runner.scraper.cache.stats() if scraper_runner and scraper_runner.scraper.cache else None,
         "database_file": DATABASE_PATH,
         "deepseek_model": DEEPSEEK_MODEL
     }
@@ -835,11 +1611,16 @@ if __name__ == "__main__":
     print(f"📊 Database: {DATABASE_PATH}")
     print(f"🌐 Server: http://localhost:8000")
     print(f"📚 API Docs: http://localhost:8000/docs")
-    print(f"📈 Stats: http://localhost:8000/admin/stats")
+    if ADMIN_TOKEN:
+        print(f"📈 Stats: http://localhost:8000/admin/stats")
+        print(f"📉 Metrics: http://localhost:8000/metrics")
+    else:
+        print("🔒 /admin/stats e /metrics disattivati (imposta ADMIN_TOKEN)")
     print(f"{'='*70}\n")
     print("⚡ Features:")
     print("  🔍 Deep Research: Trova immobili con 4 agenti AI")
     print("  🧮 Calcola ROI: 3 scenari ristrutturazione con analisi rischi")
+    print("  📐 ROI Batch: scenari per interi portafogli, senza AI")
     print(f"{'='*70}\n")
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
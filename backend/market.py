@@ -0,0 +1,221 @@
+"""
+📊 BIG HOUSE — Indice di mercato per città e zona
+
+Statistiche del prezzo al mq calcolate dagli annunci in archivio (tabella
+`listings`) e salvate in `market_index`: numero di annunci, mediana,
+quantili P10/P25/P75/P90 e trend. Una riga per zona più una per l'intera
+città (zona ''), tenute anche in memoria: la lettura è un accesso a dizionario.
+
+L'indice si aggiorna solo per le città appena riscaricate (`refresh(city)`).
+A ogni aggiornamento la mediana viene salvata in `market_snapshots` (una al
+giorno): il trend è la variazione rispetto alla fotografia più vecchia entro
+`trend_days` giorni.
+
+Deep Research usa questi numeri esatti al posto di far stimare all'LLM il
+prezzo di zona da due o tre annunci.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+QUANTILES = [10, 25, 50, 75, 90]
+
+# Scarto dalla mediana di zona oltre il quale un immobile è fuori mercato
+VALUATION_THRESHOLD = 0.10
+
+# Annunci minimi perché una zona abbia statistiche proprie (altrimenti si usa la città)
+MIN_ZONE_LISTINGS = 3
+
+
+class MarketIndex:
+    """Mediana, quantili e trend del €/mq per (città, zona)"""
+
+    def __init__(self, get_db: Callable, trend_days: int = 90):
+        self._get_db = get_db
+        self.trend_days = trend_days
+        self._lock = threading.Lock()
+        self._index: Dict[Tuple[str, str], dict] = {}
+        self._init_table()
+        self._load()
+
+    def _init_table(self):
+        with self._get_db() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS market_index (
+                    city TEXT NOT NULL,
+                    zone TEXT NOT NULL,
+                    listings INTEGER NOT NULL,
+                    p10 REAL, p25 REAL, median REAL, p75 REAL, p90 REAL,
+                    trend_pct REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (city, zone)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS market_snapshots (
+                    city TEXT NOT NULL,
+                    zone TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    taken_at REAL NOT NULL,
+                    median REAL NOT NULL,
+                    PRIMARY KEY (city, zone, day)
+                )
+            """)
+            conn.commit()
+
+    def _load(self):
+        with self._get_db() as conn:
+            rows = conn.execute("""
+                SELECT city, zone, listings, p10, p25, median, p75, p90, trend_pct, updated_at
+                FROM market_index
+            """).fetchall()
+        with self._lock:
+            self._index = {(row[0], row[1]): self._entry(row[2:]) for row in rows}
+
+    @staticmethod
+    def _entry(values) -> dict:
+        listings, p10, p25, median, p75, p90, trend_pct, updated_at = values
+        return {
+            "listings": listings,
+            "p10": p10, "p25": p25, "median": median, "p75": p75, "p90": p90,
+            "trend_pct": trend_pct,
+            "updated_at": updated_at
+        }
+
+    @staticmethod
+    def _city_key(city: str) -> str:
+        return " ".join(city.lower().split())
+
+    def refresh(self, city: str) -> int:
+        """Ricalcola le statistiche di una città dall'archivio. Ritorna le zone aggiornate."""
+        city_key = self._city_key(city)
+        with self._get_db() as conn:
+            rows = conn.execute(
+                "SELECT COALESCE(zone, ''), price_per_sqm FROM listings WHERE city = ? AND price_per_sqm > 0",
+                (city_key,)
+            ).fetchall()
+
+        groups: Dict[str, List[float]] = {}
+        for zone, price_per_sqm in rows:
+            groups.setdefault(zone, []).append(price_per_sqm)
+        groups.pop("", None)
+        groups[""] = [price_per_sqm for _, price_per_sqm in rows]
+
+        now = time.time()
+        day = time.strftime("%Y-%m-%d", time.gmtime(now))
+        since = now - self.trend_days * 86400
+        entries = {}
+
+        with self._get_db() as conn:
+            for zone, values in groups.items():
+                if not values:
+                    continue
+                p10, p25, median, p75, p90 = (round(float(q), 1) for q in np.percentile(values, QUANTILES))
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO market_snapshots (city, zone, day, taken_at, median) VALUES (?, ?, ?, ?, ?)",
+                    (city_key, zone, day, now, median)
+                )
+                oldest = conn.execute("""
+                    SELECT median FROM market_snapshots
+                    WHERE city = ? AND zone = ? AND taken_at >= ? AND day < ?
+                    ORDER BY taken_at LIMIT 1
+                """, (city_key, zone, since, day)).fetchone()
+                trend_pct = round((median - oldest[0]) / oldest[0] * 100, 2) if oldest and oldest[0] else None
+
+                entries[(city_key, zone)] = self._entry((len(values), p10, p25, median, p75, p90, trend_pct, now))
+
+            # Le zone sparite dall'archivio escono dall'indice
+            conn.execute("DELETE FROM market_index WHERE city = ?", (city_key,))
+            conn.executemany("""
+                INSERT INTO market_index (city, zone, listings, p10, p25, median, p75, p90, trend_pct, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (city_key, zone, e["listings"], e["p10"], e["p25"], e["median"], e["p75"], e["p90"], e["trend_pct"], e["updated_at"])
+                for (_, zone), e in entries.items()
+            ])
+            conn.commit()
+
+        with self._lock:
+            for key in [key for key in self._index if key[0] == city_key]:
+                del self._index[key]
+            self._index.update(entries)
+        return len(entries)
+
+    def lookup(self, city: str, zone: Optional[str] = None) -> Optional[dict]:
+        """
+        Statistiche della zona (o della città se `zone` è None). Una zona con
+        meno di MIN_ZONE_LISTINGS annunci ripiega sui numeri della città.
+        """
+        city_key = self._city_key(city)
+        with self._lock:
+            if zone:
+                entry = self._index.get((city_key, zone))
+                if entry and entry["listings"] >= MIN_ZONE_LISTINGS:
+                    return {"city": city_key, "zone": zone, **entry}
+            entry = self._index.get((city_key, ""))
+        return {"city": city_key, "zone": None, **entry} if entry else None
+
+    def zones(self, city: str) -> List[dict]:
+        """Tutte le zone di una città, dalla più cara"""
+        city_key = self._city_key(city)
+        with self._lock:
+            rows = [{"zone": zone, **entry} for (c, zone), entry in self._index.items() if c == city_key and zone]
+        return sorted(rows, key=lambda row: row["median"], reverse=True)
+
+    def valuation(self, prop: dict, city: str) -> Optional[dict]:
+        """Scarto del €/mq di un annuncio dalla mediana di zona (o città)"""
+        price_per_sqm = prop.get("price_per_sqm")
+        stats = self.lookup(city, prop.get("zone"))
+        if not price_per_sqm or not stats or not stats["median"]:
+            return None
+
+        delta = (price_per_sqm - stats["median"]) / stats["median"]
+        if delta <= -VALUATION_THRESHOLD:
+            verdict = "sottovalutato"
+        elif delta >= VALUATION_THRESHOLD:
+            verdict = "sopravvalutato"
+        else:
+            verdict = "in linea"
+        return {
+            "zone_median": stats["median"],
+            "compared_to": stats["zone"] or "città",
+            "delta_pct": round(delta * 100, 1),
+            "verdict": verdict
+        }
+
+    def report(self, city: str, properties: List[dict]) -> Optional[str]:
+        """Analisi di mercato testuale per il prompt (o al posto dell'LLM); None se non ci sono dati"""
+        stats = self.lookup(city)
+        if not stats:
+            return None
+
+        def describe(s: dict) -> str:
+            trend = f", trend {s['trend_pct']:+.1f}% in {self.trend_days} giorni" if s["trend_pct"] is not None else ""
+            return (
+                f"mediana €{s['median']:,.0f}/mq (P10 €{s['p10']:,.0f}, P25 €{s['p25']:,.0f}, "
+                f"P75 €{s['p75']:,.0f}, P90 €{s['p90']:,.0f}) su {s['listings']} annunci{trend}"
+            )
+
+        lines = [f"Mercato di {city}: {describe(stats)}."]
+        for zone in self.zones(city):
+            if zone["listings"] >= MIN_ZONE_LISTINGS:
+                lines.append(f"- {zone['zone']}: {describe(zone)}")
+
+        lines.append("Valutazione degli immobili rispetto alla mediana di zona:")
+        for prop in properties:
+            valuation = self.valuation(prop, city)
+            if valuation:
+                lines.append(
+                    f"- {prop.get('title')} (€{prop['price_per_sqm']:,.0f}/mq): {valuation['verdict']}, "
+                    f"{valuation['delta_pct']:+.1f}% rispetto a {valuation['compared_to']} (€{valuation['zone_median']:,.0f}/mq)"
+                )
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        with self._lock:
+            cities = {city for city, _ in self._index}
+            return {"cities": len(cities), "zones": sum(1 for _, zone in self._index if zone)}
@@ -0,0 +1,299 @@
+"""
+📈 BIG HOUSE — Metriche in formato Prometheus
+
+Contatori, istogrammi e gauge con etichette, esposti da GET /metrics nel
+formato testuale di Prometheus (0.0.4): uno scrape di Prometheus o un
+`curl` bastano per vedere dove va il tempo di una Deep Research. L'endpoint
+richiede ADMIN_TOKEN come bearer token (senza token non è esposto).
+
+Misuriamo:
+- latenza delle richieste HTTP per route (il template, non il path reale)
+- durata dei crew e dei singoli task per ruolo dell'agente
+- chiamate all'LLM: latenza e token in/out per ruolo dell'agente
+- scraping: durata dei fetch per host ed esito (200, 304, cache, errore, ...)
+- SQLite: attesa di una connessione dal pool, tempo in cui resta in uso e
+  durata delle operazioni lanciate dagli endpoint async
+- job in background per tipo ed esito
+
+Niente dipendenze: il formato è semplice e prometheus_client non serve.
+Il ruolo dell'agente che sta chiamando l'LLM viaggia in una variabile
+thread-local (`agent_scope`): le chiamate di CrewAI sono sincrone nel thread
+del task, quindi l'hook HTTP del client LLM sa a chi attribuire i token.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Secondi: dalle query SQLite (ms) alle Deep Research complete (minuti)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+UNKNOWN_AGENT = "none"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: etichette attese {self.labels}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Valore che cresce soltanto (richieste, token, ...)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name}: un counter non può diminuire")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Valore istantaneo (job in coda, hash in corso, ...)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribuzione di durate in bucket cumulativi, più somma e conteggio"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per etichette: [conteggi per bucket (non cumulativi) + overflow, somma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Misura il blocco `with` (anche se solleva un'eccezione)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Insieme di metriche da esporre; i collector aggiornano i gauge prima di ogni scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def on_collect(self, collector: Callable[[], None]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                # Un collector rotto non deve far sparire le altre metriche
+                print(f"⚠️ Collector metriche fallito: {e}")
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+# --- Metriche dell'applicazione ---
+HTTP_REQUEST_SECONDS = histogram(
+    "bighouse_http_request_seconds", "Durata delle richieste HTTP (per gli stream: fino agli header)",
+    ["method", "route", "status"]
+)
+CREW_SECONDS = histogram(
+    "bighouse_crew_seconds", "Durata di un'esecuzione completa dei task di un crew", ["process", "status"]
+)
+TASK_SECONDS = histogram("bighouse_task_seconds", "Durata dei singoli task CrewAI", ["agent", "status"])
+LLM_REQUEST_SECONDS = histogram("bighouse_llm_request_seconds", "Durata delle chiamate all'LLM", ["agent", "status"])
+LLM_TOKENS = counter("bighouse_llm_tokens_total", "Token scambiati con l'LLM", ["agent", "direction"])
+SCRAPER_FETCH_SECONDS = histogram(
+    "bighouse_scraper_fetch_seconds", "Durata dei fetch dello scraper, retry compresi", ["host", "status"]
+)
+SCRAPER_RESPONSES = counter(
+    "bighouse_scraper_responses_total", "Risposte HTTP ricevute dallo scraper (ogni tentativo)", ["host", "status"]
+)
+DB_WAIT_SECONDS = histogram(
+    "bighouse_db_pool_wait_seconds", "Attesa di una connessione libera dal pool SQLite", ["database"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+DB_CONNECTION_SECONDS = histogram(
+    "bighouse_db_connection_seconds", "Tempo in cui una connessione SQLite resta in uso (query e commit)", ["database"],
+    buckets=DB_BUCKETS
+)
+DB_OPERATION_SECONDS = histogram(
+    "bighouse_db_operation_seconds", "Durata delle funzioni DB eseguite sull'executor del pool", ["database", "operation"],
+    buckets=DB_BUCKETS
+)
+JOB_SECONDS = histogram("bighouse_job_seconds", "Durata dei job in background", ["kind", "status"])
+JOBS_PENDING = gauge("bighouse_jobs_pending", "Job in coda o in esecuzione")
+JOBS_COALESCED = counter("bighouse_jobs_coalesced_total", "Job agganciati a un job identico già in corso", ["kind"])
+PASSWORD_HASHES_IN_FLIGHT = gauge("bighouse_password_hashes_in_flight", "Hash bcrypt in corso o in attesa")
+
+
+# --- Agente corrente (thread-local) ---
+_local = threading.local()
+
+
+def current_agent() -> str:
+    return getattr(_local, "agent", None) or UNKNOWN_AGENT
+
+
+def set_agent(role: Optional[str]):
+    _local.agent = role
+
+
+@contextmanager
+def agent_scope(role: str):
+    """Attribuisce a `role` le chiamate LLM fatte dal thread corrente dentro il blocco"""
+    previous = getattr(_local, "agent", None)
+    _local.agent = role
+    try:
+        yield
+    finally:
+        _local.agent = previous
+
+
+def record_usage(usage: Optional[dict], agent: Optional[str] = None):
+    """Conta i token di un blocco `usage` in stile OpenAI (prompt_tokens / completion_tokens)"""
+    if not usage:
+        return
+    agent = agent or current_agent()
+    LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, agent=agent, direction="in")
+    LLM_TOKENS.inc(usage.get("completion_tokens") or 0, agent=agent, direction="out")
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,77 @@
+"""
+🔐 BIG HOUSE — Hash delle password fuori dall'event loop
+
+Ogni hash/verifica bcrypt costa centinaia di millisecondi di CPU: chiamato
+direttamente da un endpoint async blocca tutte le altre richieste. Qui il
+lavoro gira su un executor dedicato con un numero limitato di thread, e le
+richieste in attesa oltre una soglia vengono rifiutate subito (HasherBusy)
+invece di accodarsi all'infinito durante un picco di login.
+
+Il costo (rounds) è configurabile: quando cambia, gli hash vecchi vengono
+riconosciuti come da aggiornare e rigenerati al login successivo.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class HasherBusy(Exception):
+    """Troppe operazioni sulle password in coda"""
+
+
+class PasswordHasher:
+    """Hash/verifica bcrypt su executor limitato, con rehash automatico"""
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 32):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bighouse-pwd")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def _run(self, fn: Callable, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifica la password. Se è corretta ma l'hash usa un costo diverso da
+        quello configurato, ritorna anche il nuovo hash da salvare.
+        """
+        return await self._run(self._context.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
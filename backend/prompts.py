@@ -0,0 +1,148 @@
+"""
+🧾 BIG HOUSE — Prompt compatti per gli agenti
+
+Gli immobili entrano nei prompt come tabella (una riga per immobile, colonne
+separate da "|") invece che come JSON indentato, e ogni task riceve solo le
+colonne che gli servono: prezzi e zone all'analista di mercato, superficie,
+stato e descrizione all'esperto di ristrutturazioni. I valori uguali per
+tutti gli immobili (stato, fonte, ...) compaiono una volta sola.
+
+Ogni task ha un budget di token: se la tabella non ci sta si accorciano le
+descrizioni e poi si tolgono le ultime righe (l'archivio le restituisce già
+in ordine di €/mq), riassumendo quelle omesse in una riga. Il risultato
+dipende solo dall'input, quindi resta stabile per la cache dei risultati.
+
+I token sono stimati con il tokenizer di litellm (tiktoken, offline): per
+DeepSeek il conteggio reale è diverso, ma l'ordine di grandezza è quello.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import litellm
+
+# (campo, intestazione) delle colonne disponibili
+COLUMNS = {
+    "title": "titolo",
+    "zone": "zona",
+    "price": "prezzo €",
+    "surface": "mq",
+    "price_per_sqm": "€/mq",
+    "rooms": "locali",
+    "bathrooms": "bagni",
+    "floor": "piano",
+    "condition": "stato",
+    "description": "descrizione",
+    "source": "fonte",
+}
+
+MARKET_COLUMNS = ["title", "zone", "price", "surface", "price_per_sqm", "source"]
+RENOVATION_COLUMNS = ["title", "surface", "rooms", "bathrooms", "floor", "condition", "description"]
+
+TITLE_CHARS = 60
+# Lunghezze provate per la descrizione prima di toglierla del tutto
+DESCRIPTION_CHARS = [160, 60, 0]
+
+
+def estimate_tokens(text: str, model: str = "deepseek/deepseek-chat") -> int:
+    try:
+        return litellm.token_counter(model=model, text=text)
+    except Exception:
+        return len(text) // 4 + 1
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split()).replace("|", "/")
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _cell(field: str, value, description_chars: int) -> str:
+    if value is None:
+        return "-"
+    if field == "title":
+        return _clip(str(value), TITLE_CHARS)
+    if field == "description":
+        return _clip(str(value), description_chars)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _clip(str(value), TITLE_CHARS)
+
+
+def _omitted_summary(properties: Sequence[dict]) -> str:
+    prices = sorted(p["price"] for p in properties if p.get("price"))
+    per_sqm = sorted(p["price_per_sqm"] for p in properties if p.get("price_per_sqm"))
+    parts = [f"Altri {len(properties)} immobili non elencati"]
+    if prices:
+        parts.append(f"prezzo {prices[0]}–{prices[-1]} €")
+    if per_sqm:
+        parts.append(f"€/mq mediana {per_sqm[len(per_sqm) // 2]}")
+    return ", ".join(parts)
+
+
+def encode_properties(properties: Sequence[dict], columns: Sequence[str], rows: Optional[int] = None, description_chars: int = 160) -> str:
+    """
+    Tabella compatta degli immobili: id progressivo, solo le colonne
+    richieste, colonne vuote tolte, valori comuni a tutti in una riga a parte.
+    """
+    shown = list(properties[:rows] if rows is not None else properties)
+    if not shown:
+        return "Nessun immobile."
+
+    columns = [c for c in columns if c != "description" or description_chars > 0]
+    present = [c for c in columns if any(p.get(c) is not None for p in shown)]
+    shared = [c for c in present if len(shown) > 1 and c != "title" and len({str(p.get(c)) for p in shown}) == 1]
+    varying = [c for c in present if c not in shared]
+
+    lines = ["id|" + "|".join(COLUMNS[c] for c in varying)]
+    for i, prop in enumerate(shown, 1):
+        lines.append(f"{i}|" + "|".join(_cell(c, prop.get(c), description_chars) for c in varying))
+    if shared:
+        lines.append("Uguale per tutti: " + "; ".join(f"{COLUMNS[c]}={_cell(c, shown[0].get(c), description_chars)}" for c in shared))
+    if len(shown) < len(properties):
+        lines.append(_omitted_summary(properties[len(shown):]))
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """Descrizioni dei task con tabella immobili entro un budget di token"""
+
+    def __init__(self, max_tokens_per_task: int = 1500, model: str = "deepseek/deepseek-chat"):
+        self.max_tokens_per_task = max_tokens_per_task
+        self.model = model
+
+    def tokens(self, text: str) -> int:
+        return estimate_tokens(text, self.model)
+
+    def task(self, template: str, properties: Sequence[dict], columns: Sequence[str], **fields) -> Tuple[str, dict]:
+        """
+        Compila `template` (con il segnaposto {properties}) inserendo la tabella
+        più ricca che sta nel budget. Ritorna il testo e {tokens, rows, omitted}.
+        """
+        def render(rows: int, description_chars: int) -> Tuple[str, int]:
+            table = encode_properties(properties, columns, rows, description_chars)
+            text = template.format(properties=table, **fields)
+            return text, self.tokens(text)
+
+        best = None
+        for description_chars in DESCRIPTION_CHARS:
+            text, tokens = render(len(properties), description_chars)
+            if tokens <= self.max_tokens_per_task:
+                best = (text, tokens, len(properties))
+                break
+            if "description" not in columns:
+                break
+
+        if best is None:
+            # Ricerca binaria sul numero di righe (senza descrizioni); almeno una riga resta sempre
+            low, high = 1, max(len(properties) - 1, 1)
+            best = (*render(1, 0), 1)
+            while low <= high:
+                middle = (low + high) // 2
+                text, tokens = render(middle, 0)
+                if tokens <= self.max_tokens_per_task:
+                    best = (text, tokens, middle)
+                    low = middle + 1
+                else:
+                    high = middle - 1
+
+        text, tokens, rows = best
+        return text, {"tokens": tokens, "rows": rows, "omitted": len(properties) - rows}
@@ -0,0 +1,274 @@
+"""
+🧭 BIG HOUSE — Parser delle query di Deep Research
+
+Da "Trilocale al Vomero, Napoli, max 250k, almeno 80 mq, da ristrutturare"
+ricava città, zona, budget, superficie e stato dell'immobile.
+
+Città e zone vengono riconosciute con un gazetteer offline (data/comuni.csv e
+data/zone.csv) compilato in un trie di parole: a ogni posizione della query
+si cerca il nome più lungo che inizia lì, così "Reggio Emilia" vince su
+"Reggio" e "San Giovanni a Teduccio" è una zona sola. I nomi che sono anche
+parole comuni ("Portici", "Vittoria", "Cento", "Porto", ...) contano solo se
+scritti con l'iniziale maiuscola o dopo "a", "in", "zona", ...
+
+comuni.csv ha lo stesso formato (comune;sigla;regione) dell'elenco ISTAT:
+per coprire tutti i comuni basta sostituirlo con l'elenco completo.
+"""
+
+import csv
+import os
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+DEFAULT_CONDITION = "da ristrutturare"
+
+# Nomi di luoghi che sono anche parole di uso comune
+AMBIGUOUS_NAMES = {
+    "cento", "portici", "vittoria", "massa", "prato", "fondi", "latina", "porto", "quarto",
+    "reno", "liberta", "borgo", "centro", "castello", "noto", "alba", "lido", "mercatello",
+    "trieste", "salario", "fiera", "isola", "monti", "lodi", "loreto", "augusta", "crema",
+    "assago", "gela", "cassia", "nolo", "santo spirito", "santa croce", "san marco",
+}
+
+# Parole che introducono un luogo ("a Portici", "zona Porto")
+PLACE_CUES = {"a", "ad", "in", "di", "da", "zona", "quartiere", "comune", "provincia", "presso", "vicino", "al", "nel"}
+
+# Lettere accentate → ASCII, senza cambiare la lunghezza del testo (gli offset restano validi)
+_ACCENTS = {
+    code: unicodedata.normalize("NFKD", chr(code))[0]
+    for code in range(0xC0, 0x250)
+    if unicodedata.normalize("NFKD", chr(code))[0].isascii()
+}
+_ACCENTS.update({ord("’"): "'", ord("`"): "'", ord("´"): "'", ord("²"): "2", ord("–"): "-"})
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+_NUM = r"\d+(?:[.,]\d+)*"
+_MULT = r"(?:k|mila|mln|milioni|milione|mio)"
+_CUR = r"(?:€|euro\b|eur\b)"
+
+SURFACE_UNIT = r"(?:mq|m2|metri\s+quadr(?:at)?i|metri|mt)\b"
+SURFACE_RE = re.compile(
+    rf"(?:\b(?P<cue>almeno|minimo|min|oltre|sopra|piu\s+di|da|fino\s+a|max|massimo|sotto|entro|meno\s+di)\s+)?"
+    rf"(?P<a>{_NUM})\s*(?:(?:-|/|\ba\b|\be\b)\s*(?P<b>{_NUM})\s*)?{SURFACE_UNIT}"
+)
+
+PRICE_PART = rf"(?:€\s*)?(?P<{{0}}>{_NUM})\s*(?P<{{0}}m>{_MULT})?\b\s*(?P<{{0}}c>{_CUR})?"
+PRICE_RANGE_RE = re.compile(
+    r"(?:\b(?:tra|fra|da)\s+(?:i\s+)?" + PRICE_PART.format("a") + r"\s*(?:\be\b|\ba\b|-|/)\s*"
+    r"|" + PRICE_PART.format("x") + r"\s*(?:-|/)\s*)"
+    + PRICE_PART.format("b")
+)
+PRICE_RE = re.compile(
+    r"(?:\b(?P<cue>almeno|minimo|min|da|oltre|sopra|piu\s+di|a\s+partire\s+da|max|massimo|fino\s+a|sotto|entro|"
+    r"budget|non\s+oltre|meno\s+di|prezzo|spesa|spendere)\s+(?:(?:i|di|a|un|massimo|max)\s+)*)?"
+    + PRICE_PART.format("n")
+)
+MIN_CUES = {"almeno", "minimo", "min", "da", "oltre", "sopra", "piu di", "a partire da"}
+
+MULTIPLIERS = {"k": 1e3, "mila": 1e3, "mln": 1e6, "milioni": 1e6, "milione": 1e6, "mio": 1e6}
+THOUSANDS_RE = re.compile(r"\d{1,3}(?:[.,]\d{3})+")
+SEPARATOR_RE = re.compile(r"[.,]")
+
+CONDITIONS = [
+    ("da ristrutturare", re.compile(
+        r"\b(?:da\s+(?:ristrutturare|rinnovare|sistemare|ammodernare|rimodernare)|ristrutturare|rustico|grezzo)\b"
+    )),
+    ("nuovo", re.compile(r"\b(?:nuov[oaie]|nuova\s+costruzione|mai\s+abitat[oa]|classe\s+a\d?)\b")),
+    ("buono", re.compile(
+        r"\b(?:ristrutturat[oaie]|rinnovat[oaie]|buono\s+stato|buone\s+condizioni|ottimo\s+stato|"
+        r"ottime\s+condizioni|abitabile|ben\s+tenut[oa])\b"
+    )),
+]
+
+
+def fold(text: str) -> str:
+    """Minuscolo e senza accenti, stessa lunghezza del testo originale"""
+    return text.lower().translate(_ACCENTS)
+
+
+def parse_number(text: str, multiplier: Optional[str] = None) -> float:
+    """'200.000' → 200000, '1,5' + 'milioni' → 1500000, '250' + 'k' → 250000"""
+    separators = len(SEPARATOR_RE.findall(text))
+    if multiplier and separators == 1:
+        value = float(text.replace(",", "."))
+    elif THOUSANDS_RE.fullmatch(text) or separators > 1:
+        value = float(SEPARATOR_RE.sub("", text))
+    elif separators == 1:
+        value = float(text.replace(",", "."))
+    else:
+        value = float(text)
+    return value * MULTIPLIERS.get(multiplier, 1.0)
+
+
+class Gazetteer:
+    """Trie di parole dei nomi di comuni e zone"""
+
+    def __init__(self):
+        self._root: Tuple[dict, list] = ({}, [])
+        self.places = 0
+
+    def add(self, name: str, place: dict):
+        node = self._root
+        for word in WORD_RE.findall(fold(name)):
+            node = node[0].setdefault(word, ({}, []))
+        node[1].append(place)
+        self.places += 1
+
+    @classmethod
+    def load(cls, directory: str) -> "Gazetteer":
+        gazetteer = cls()
+        comuni = {}
+        with open(os.path.join(directory, "comuni.csv"), encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f, delimiter=";"):
+                place = {"kind": "comune", "name": row["comune"], "province": row["sigla"], "region": row["regione"]}
+                comuni.setdefault(fold(row["comune"]), place)
+                gazetteer.add(row["comune"], place)
+
+        zones_path = os.path.join(directory, "zone.csv")
+        if os.path.exists(zones_path):
+            with open(zones_path, encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    city = comuni.get(fold(row["comune"]))
+                    if city:
+                        gazetteer.add(row["zona"], {"kind": "zona", "name": row["zona"], "city": city})
+        return gazetteer
+
+    def find(self, original: str, folded: str) -> List[dict]:
+        """Luoghi citati nel testo, in ordine, con il match più lungo a ogni posizione"""
+        words = [(m.group(), m.start(), m.end()) for m in WORD_RE.finditer(folded)]
+        found = []
+        i = 0
+        while i < len(words):
+            node = self._root
+            best = None
+            j = i
+            while j < len(words):
+                node = node[0].get(words[j][0])
+                if node is None:
+                    break
+                j += 1
+                if node[1]:
+                    best = (j, node[1])
+
+            if best is None:
+                i += 1
+                continue
+
+            end, places = best
+            name = folded[words[i][1]:words[end - 1][2]]
+            if name in AMBIGUOUS_NAMES:
+                cued = i > 0 and words[i - 1][0] in PLACE_CUES
+                if not (cued or original[words[i][1]].isupper()):
+                    i += 1
+                    continue
+            found.extend(places)
+            i = end
+        return found
+
+
+class QueryParser:
+    """Query testuale → parametri di ricerca (città, zona, budget, superficie, stato)"""
+
+    def __init__(self, gazetteer_dir: str, default_city: Optional[str] = None):
+        self.gazetteer = Gazetteer.load(gazetteer_dir)
+        # Città per le query che non citano un comune del gazetteer (None = resta None)
+        self.default_city = default_city
+
+    def parse(self, query: str) -> dict:
+        folded = fold(query)
+        params = {
+            "city": None, "province": None, "region": None, "zone": None,
+            "min_price": None, "max_price": None,
+            "min_surface": None, "max_surface": None,
+            "condition": DEFAULT_CONDITION,
+        }
+
+        self._parse_place(query, folded, params)
+        folded = self._parse_surface(folded, params)
+        self._parse_price(folded, params)
+
+        for condition, pattern in CONDITIONS:
+            if pattern.search(folded):
+                params["condition"] = condition
+                break
+        return params
+
+    def _parse_place(self, query: str, folded: str, params: dict):
+        places = self.gazetteer.find(query, folded)
+        comuni = [p for p in places if p["kind"] == "comune"]
+        zones = [p for p in places if p["kind"] == "zona"]
+        names = {c["name"] for c in comuni}
+
+        city = None
+        zone = None
+        # Una zona della città citata vince; una zona da sola indica anche la città
+        for candidate in zones:
+            if not comuni or candidate["city"]["name"] in names:
+                zone = candidate
+                city = candidate["city"]
+                break
+        if city is None and comuni:
+            city = comuni[0]
+        if city is None and self.default_city:
+            city = self._default_place()
+
+        if city:
+            params.update(city=city["name"], province=city["province"], region=city["region"])
+        if zone:
+            params["zone"] = zone["name"]
+
+    def _default_place(self) -> dict:
+        found = [p for p in self.gazetteer.find(self.default_city, fold(self.default_city)) if p["kind"] == "comune"]
+        if found:
+            return found[0]
+        return {"name": self.default_city, "province": None, "region": None}
+
+    @staticmethod
+    def _blank(text: str, match: re.Match) -> str:
+        return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+    def _parse_surface(self, folded: str, params: dict) -> str:
+        """Superficie min/max; ritorna il testo senza le superfici (non vanno lette come prezzi)"""
+        for match in list(SURFACE_RE.finditer(folded)):
+            a = parse_number(match.group("a"))
+            if match.group("b"):
+                params["min_surface"] = int(a)
+                params["max_surface"] = int(parse_number(match.group("b")))
+            elif match.group("cue") in ("fino a", "max", "massimo", "sotto", "entro", "meno di"):
+                params["max_surface"] = int(a)
+            else:
+                params["min_surface"] = int(a)
+            folded = self._blank(folded, match)
+        return folded
+
+    def _parse_price(self, folded: str, params: dict):
+        for match in PRICE_RANGE_RE.finditer(folded):
+            low_key = "a" if match.group("a") else "x"
+            low_mult = match.group(f"{low_key}m") or match.group("bm")
+            high = parse_number(match.group("b"), match.group("bm"))
+            low = parse_number(match.group(low_key), low_mult)
+            marked = match.group("bm") or match.group("bc") or match.group(f"{low_key}c") or "€" in match.group()
+            if (marked or high >= 10000) and low <= high:
+                params["min_price"] = int(low)
+                params["max_price"] = int(high)
+                return
+
+        budgets = []
+        for match in PRICE_RE.finditer(folded):
+            cue = match.group("cue")
+            cue = " ".join(cue.split()) if cue else None
+            value = parse_number(match.group("n"), match.group("nm"))
+            marked = match.group("nm") or match.group("nc") or "€" in match.group()
+            # Un numero "nudo" è un prezzo solo se ha i separatori delle migliaia o un indizio
+            # davanti (un CAP come 80121 non è un budget)
+            plain_price = value >= 10000 and (THOUSANDS_RE.fullmatch(match.group("n")) or cue or value >= 100000)
+            if not (marked or plain_price) or value < 1000:
+                continue
+            if cue in MIN_CUES:
+                params["min_price"] = int(value)
+            else:
+                budgets.append(int(value))
+        if budgets:
+            params["max_price"] = max(budgets)
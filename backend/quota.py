@@ -0,0 +1,159 @@
+"""
+🎟️ BIG HOUSE — Quote giornaliere per piano, riservate in modo atomico
+
+Una unità di quota viene riservata PRIMA di avviare il lavoro con un singolo
+UPDATE condizionale: il controllo del limite e l'incremento avvengono nella
+stessa istruzione, quindi N richieste concorrenti non possono superare il
+limite del piano. Se il lavoro fallisce (o non consuma quota, es. cache hit)
+l'unità viene restituita con `refund`.
+
+I limiti stanno nella tabella `plan_limits` (NULL = illimitato, 0 = funzione
+non inclusa nel piano).
+"""
+
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+FEATURE_COLUMNS = {
+    "deepresearch": "deepresearch_count",
+    "calcola": "calcola_count",
+}
+
+DEFAULT_LIMITS = [
+    ("free", "deepresearch", 0),
+    ("free", "calcola", 0),
+    ("pro", "deepresearch", 2),
+    ("pro", "calcola", 2),
+    ("plus", "deepresearch", None),
+    ("plus", "calcola", None),
+]
+
+
+class FeatureNotInPlan(Exception):
+    """La funzione non è inclusa nel piano dell'utente"""
+
+
+class QuotaExceeded(Exception):
+    """Limite giornaliero del piano raggiunto"""
+
+
+class QuotaEngine:
+    """Riserva e restituisce unità di quota direttamente sulla tabella users"""
+
+    def __init__(self, get_db: Callable, on_change: Optional[Callable[[str], None]] = None):
+        self._get_db = get_db
+        self._on_change = on_change
+        self._limits: Dict[Tuple[str, str], Optional[int]] = {}
+        self._init_table()
+        self.reload()
+
+    def _init_table(self):
+        with self._get_db() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS plan_limits (
+                    plan TEXT NOT NULL,
+                    feature TEXT NOT NULL,
+                    daily_limit INTEGER,
+                    PRIMARY KEY (plan, feature)
+                )
+            """)
+            conn.executemany(
+                "INSERT OR IGNORE INTO plan_limits (plan, feature, daily_limit) VALUES (?, ?, ?)",
+                DEFAULT_LIMITS
+            )
+            conn.commit()
+
+    def reload(self):
+        """Rilegge i limiti dalla tabella (dopo una modifica manuale)"""
+        with self._get_db() as conn:
+            rows = conn.execute("SELECT plan, feature, daily_limit FROM plan_limits").fetchall()
+        self._limits = {(row[0], row[1]): row[2] for row in rows}
+
+    def limit(self, plan: str, feature: str) -> Optional[int]:
+        """Limite giornaliero (None = illimitato). Piani/funzioni sconosciuti → 0."""
+        return self._limits.get((plan, feature), 0)
+
+    def reserve(self, email: str, feature: str) -> dict:
+        """
+        Riserva una unità di `feature` per oggi.
+
+        Azzeramento del giorno, controllo del limite e incremento sono un unico
+        UPDATE: se nessuna riga viene aggiornata il limite è già raggiunto.
+        """
+        column = FEATURE_COLUMNS[feature]
+        others = [c for c in FEATURE_COLUMNS.values() if c != column]
+        today = str(date.today())
+
+        reset_others = "".join(
+            f", {other} = CASE WHEN usage_date = :today THEN {other} ELSE 0 END"
+            for other in others
+        )
+
+        with self._get_db() as conn:
+            row = conn.execute(f"""
+                UPDATE users SET
+                    usage_date = :today,
+                    {column} = (CASE WHEN usage_date = :today THEN {column} ELSE 0 END) + 1
+                    {reset_others}
+                WHERE email = :email
+                  AND EXISTS (
+                      SELECT 1 FROM plan_limits
+                      WHERE plan_limits.plan = users.plan
+                        AND plan_limits.feature = :feature
+                        AND (plan_limits.daily_limit IS NULL
+                             OR plan_limits.daily_limit > (CASE WHEN users.usage_date = :today THEN users.{column} ELSE 0 END))
+                  )
+                RETURNING plan, {column}
+            """, {"today": today, "email": email, "feature": feature}).fetchone()
+
+            if row is None:
+                user = conn.execute("SELECT plan FROM users WHERE email = ?", (email,)).fetchone()
+            conn.commit()
+
+        if row is None:
+            plan = user[0] if user else None
+            if not self.limit(plan, feature):
+                raise FeatureNotInPlan(feature)
+            raise QuotaExceeded(feature)
+
+        self._changed(email)
+        plan, used = row[0], row[1]
+        return {
+            "email": email,
+            "feature": feature,
+            "day": today,
+            "plan": plan,
+            "used": used,
+            "limit": self.limit(plan, feature),
+        }
+
+    def refund(self, reservation: Optional[dict]):
+        """
+        Restituisce l'unità riservata (solo se siamo ancora nello stesso giorno).
+        Idempotente: una prenotazione già restituita non viene restituita di nuovo.
+        I job accodati prima delle prenotazioni non ne hanno una: niente da restituire.
+        """
+        if reservation is None or reservation.get("refunded"):
+            return
+        reservation["refunded"] = True
+        column = FEATURE_COLUMNS[reservation["feature"]]
+        with self._get_db() as conn:
+            conn.execute(
+                f"UPDATE users SET {column} = MAX({column} - 1, 0) WHERE email = ? AND usage_date = ?",
+                (reservation["email"], reservation["day"])
+            )
+            conn.commit()
+        reservation["used"] = max(reservation["used"] - 1, 0)
+        self._changed(reservation["email"])
+
+    def _changed(self, email: str):
+        if self._on_change:
+            self._on_change(email)
+
+    @staticmethod
+    def remaining(reservation: Optional[dict]):
+        if reservation is None:
+            return None
+        if reservation["limit"] is None:
+            return "Unlimited"
+        return max(reservation["limit"] - reservation["used"], 0)
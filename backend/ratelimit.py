@@ -0,0 +1,156 @@
+"""
+🚦 BIG HOUSE — Rate limiting per host con backoff adattivo
+
+Ogni portale (host) ha un token bucket condiviso da tutte le richieste
+concorrenti dello scraper: `rate` richieste al secondo in media, con picchi
+fino a `burst`. Il rate si adatta a quello che il sito risponde:
+
+- se nell'ultima finestra di risposte la quota di 429/5xx/errori supera
+  `max_error_ratio`, il rate viene ridotto (moltiplicativo)
+- se la finestra è pulita, il rate sale di un passo (additivo), fino a `max_rate`
+- un 429 con `Retry-After` sospende il bucket per il tempo indicato
+
+I tentativi falliti aspettano con backoff esponenziale con jitter.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Secondi indicati da un header Retry-After (numero o data HTTP)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Backoff esponenziale con "full jitter": uniforme in [0, min(cap, base·2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Token bucket async: `acquire` attende finché non c'è un token disponibile"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()  # i richiedenti vengono serviti in ordine di arrivo
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Nessun token per `seconds` (es. Retry-After)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class HostRateLimiter:
+    """Un token bucket adattivo per ogni host"""
+
+    def __init__(
+        self,
+        rate: float = 0.5,
+        burst: int = 2,
+        min_rate: float = 0.05,
+        max_rate: float = 5.0,
+        window: int = 10,
+        max_error_ratio: float = 0.1,
+        increase_step: float = 0.1,
+        decrease_factor: float = 0.5
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.window = window
+        self.max_error_ratio = max_error_ratio
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._outcomes: Dict[str, Deque[bool]] = {}
+        self._throttled: Dict[str, int] = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            self._outcomes[host] = deque(maxlen=self.window)
+            self._throttled[host] = 0
+        return bucket
+
+    async def acquire(self, url: str):
+        await self._bucket(self.host(url)).acquire()
+
+    def record(self, url: str, status: Optional[int], retry_after: Optional[str] = None):
+        """
+        Registra l'esito di una richiesta (status None = errore di rete) e
+        adatta il rate dell'host a fine finestra.
+        """
+        host = self.host(url)
+        bucket = self._bucket(host)
+        throttled = status is None or status == 429 or status >= 500
+
+        if throttled:
+            self._throttled[host] += 1
+        if status == 429:
+            bucket.pause(parse_retry_after(retry_after) or 1 / bucket.rate)
+
+        outcomes = self._outcomes[host]
+        outcomes.append(throttled)
+        errors = sum(outcomes)
+
+        # Troppi errori per la finestra (anche se non è ancora piena): rallenta subito
+        if errors > self.max_error_ratio * self.window:
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+            outcomes.clear()
+        elif len(outcomes) == self.window and errors == 0:
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase_step)
+            outcomes.clear()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            host: {
+                "rate": round(bucket.rate, 3),
+                "burst": bucket.burst,
+                "tokens": round(bucket.tokens, 2),
+                "paused_for": round(max(bucket.paused_until - now, 0.0), 1),
+                "throttled": self._throttled[host]
+            }
+            for host, bucket in self._buckets.items()
+        }
@@ -0,0 +1,64 @@
+"""
+🗂️ BIG HOUSE — Registro process-wide degli agenti AI
+
+Costruire gli Agent di CrewAI a ogni richiesta costa tempo e ricrea ogni volta
+il client dell'LLM. Qui ogni crew viene costruita una volta sola (alla
+partenza o al primo uso) e prestata alle esecuzioni: un set di agenti è usato
+da una sola esecuzione alla volta, perché gli Agent tengono stato interno
+(executor, contatori) e non sono thread-safe.
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class AgentRegistry:
+    """Pool di set di agenti, uno per esecuzione concorrente"""
+
+    def __init__(self, pool_size: int = 2):
+        self.pool_size = pool_size
+        self._factories: Dict[str, Callable[[], dict]] = {}
+        self._pools: Dict[str, queue.Queue] = {}
+        self._created: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], dict]):
+        """Registra la factory che costruisce il dict di agenti di una crew"""
+        self._factories[name] = factory
+        self._pools[name] = queue.Queue()
+        self._created[name] = 0
+
+    def warm_up(self):
+        """Costruisce subito tutti i set di agenti (da chiamare all'avvio)"""
+        for name in self._factories:
+            while self._reserve_slot(name):
+                self._pools[name].put(self._factories[name]())
+
+    def _reserve_slot(self, name: str) -> bool:
+        with self._lock:
+            if self._created[name] >= self.pool_size:
+                return False
+            self._created[name] += 1
+            return True
+
+    @contextmanager
+    def checkout(self, name: str, timeout: Optional[float] = None):
+        """Presta un set di agenti; attende se sono tutti in uso"""
+        pool = self._pools[name]
+        try:
+            agents = pool.get_nowait()
+        except queue.Empty:
+            agents = self._factories[name]() if self._reserve_slot(name) else pool.get(timeout=timeout)
+
+        try:
+            yield agents
+        finally:
+            pool.put(agents)
+
+    def stats(self) -> dict:
+        return {
+            name: {"built": self._created[name], "idle": self._pools[name].qsize()}
+            for name in self._factories
+        }
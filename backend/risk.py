@@ -0,0 +1,108 @@
+"""
+🎲 BIG HOUSE — Simulazione Monte Carlo del rischio sugli scenari
+
+I `risks` di uno scenario ("Sforamenti budget 10-15%", "Ritardi permessi", ...)
+sono testo: qui diventano distribuzioni. Per ogni scenario si estraggono
+diecimila esiti possibili, tutti insieme su array NumPy:
+
+- sforamento del budget lavori (gamma, sempre ≥ 0, coda lunga a destra)
+- ritardo dei lavori in mesi (gamma)
+- occupazione dell'affitto, cioè i mesi sfitti (beta)
+- prezzo di uscita (lognormale attorno al valore stimato)
+
+Ogni estrazione passa per gli stessi conti di roi.py; dal risultato si
+ricavano i percentili P10/P50/P90 del ROI e la probabilità di perdita.
+Lo sforamento simulato prende il posto della percentuale fissa di imprevisti.
+
+Costo e durata di partenza sono quelli degli scenari proposti dagli agenti
+(`cost`, `months`); se mancano si usano COST_PER_SQM e MONTHS di roi.py.
+"""
+
+import zlib
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import roi
+
+# Parametri per scenario (stesso ordine di roi.LEVELS)
+OVERRUN_MEAN = np.array([0.07, 0.12, 0.22])   # sforamento medio del budget lavori
+OVERRUN_SHAPE = 2.0                            # più basso = coda più lunga
+DELAY_MEAN = np.array([0.5, 1.5, 3.0])         # mesi di ritardo medi
+DELAY_SHAPE = 1.5
+EXIT_PRICE_SD = np.array([0.07, 0.09, 0.12])   # incertezza del prezzo di vendita (più alta sul lusso)
+OCCUPANCY_CONCENTRATION = 20.0                 # dispersione dell'occupazione attorno alla media
+
+PERCENTILES = [10, 50, 90]
+
+
+def _seed(buy_price: float, surface: float, condition: str) -> int:
+    """Stesso immobile → stesse estrazioni (risposte riproducibili)"""
+    return zlib.crc32(f"{buy_price:.2f}|{surface:.2f}|{condition}".encode("utf-8"))
+
+
+def simulate(
+    buy_price: float,
+    surface: float,
+    condition: str = "da ristrutturare",
+    draws: int = 10000,
+    seed: Optional[int] = None,
+    cost: Optional[Sequence[float]] = None,
+    months: Optional[Sequence[float]] = None,
+    **overrides
+) -> List[dict]:
+    """
+    Distribuzione di ROI, costi e durata dei 3 scenari di un immobile.
+
+    `cost` e `months` (uno per livello, ordine di roi.LEVELS) sono le stime
+    da perturbare; senza, valgono quelle del motore ROI.
+
+    Ritorna una voce per scenario con percentili di roi_sell/roi_rent,
+    probabilità di perdita sulla vendita e P50/P90 di costo e mesi.
+    """
+    a = {**roi.DEFAULT_ASSUMPTIONS, **overrides}
+    rng = np.random.default_rng(_seed(buy_price, surface, condition) if seed is None else seed)
+
+    price = np.asarray(float(buy_price))
+    factor = roi.condition_factors([condition])
+
+    # Rischi dei lavori: indipendenti per scenario → (draws, 3)
+    overrun = rng.gamma(OVERRUN_SHAPE, OVERRUN_MEAN / OVERRUN_SHAPE, size=(draws, 3))
+    base_cost = surface * roi.COST_PER_SQM if cost is None else np.asarray(cost, dtype=float)
+    cost = base_cost * (1 + overrun)
+    delay = rng.gamma(DELAY_SHAPE, DELAY_MEAN / DELAY_SHAPE, size=(draws, 3))
+    months = (roi.MONTHS if months is None else np.asarray(months, dtype=float)) + delay
+
+    # Rischi di mercato: uno shock per estrazione, comune ai 3 scenari → (draws, 1)
+    occupancy_mean = min(max(a["occupancy"], 0.01), 0.99)
+    occupancy = rng.beta(
+        occupancy_mean * OCCUPANCY_CONCENTRATION,
+        (1 - occupancy_mean) * OCCUPANCY_CONCENTRATION,
+        size=(draws, 1)
+    )
+    shock = rng.standard_normal((draws, 1))
+    # Lognormale con media 1: il valore atteso resta quello di roi.evaluate
+    exit_factor = np.exp(shock * EXIT_PRICE_SD - EXIT_PRICE_SD ** 2 / 2)
+    value_after = price * (1 + roi.VALUE_UPLIFT * factor) * exit_factor
+
+    results = roi.returns(price, cost, value_after, months, occupancy, a)
+
+    roi_sell = np.percentile(results["roi_sell"], PERCENTILES, axis=0)
+    roi_rent = np.percentile(results["roi_rent"], PERCENTILES, axis=0)
+    cost_q = np.percentile(cost, [50, 90], axis=0)
+    months_q = np.percentile(months, [50, 90], axis=0)
+    prob_loss = (results["profit_sell"] < 0).mean(axis=0)
+
+    return [
+        {
+            "level": level,
+            "roi_sell": {f"p{p}": round(float(roi_sell[j, i]), 2) for j, p in enumerate(PERCENTILES)},
+            "roi_rent": {f"p{p}": round(float(roi_rent[j, i]), 2) for j, p in enumerate(PERCENTILES)},
+            "prob_loss": round(float(prob_loss[i]), 3),
+            "cost_p50": round(float(cost_q[0, i]), 2),
+            "cost_p90": round(float(cost_q[1, i]), 2),
+            "months_p50": round(float(months_q[0, i]), 1),
+            "months_p90": round(float(months_q[1, i]), 1),
+        }
+        for i, level in enumerate(roi.LEVELS)
+    ]
@@ -0,0 +1,197 @@
+"""
+📐 BIG HOUSE — Motore ROI deterministico (NumPy, vettoriale)
+
+Calcola per ogni immobile i 3 scenari di ristrutturazione (bassa/media/alta)
+senza chiamare l'LLM: costo lavori, valore post-ristrutturazione, tasse di
+acquisto e di vendita, finanziamento, rendimento da affitto e ROI da vendita.
+Tutti i conti sono fatti su array (immobili × scenari) in un colpo solo, così
+un portafoglio di migliaia di annunci si valuta in pochi millisecondi.
+
+Il modello è volutamente semplice e le ipotesi sono tutte in
+DEFAULT_ASSUMPTIONS (sovrascrivibili per singola chiamata).
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+LEVELS = ["bassa", "media", "alta"]
+
+# Parametri per scenario (stesso ordine di LEVELS)
+COST_PER_SQM = np.array([300.0, 600.0, 1000.0])   # € al mq di lavori
+MONTHS = np.array([2, 4, 6])                       # durata lavori
+VALUE_UPLIFT = np.array([0.25, 0.55, 0.80])        # aumento di valore su un immobile da ristrutturare
+RENT_PREMIUM = np.array([0.00, 0.08, 0.15])        # canone in più rispetto al rendimento base
+
+# Quanto "spazio" di rivalutazione lascia lo stato attuale dell'immobile
+CONDITION_FACTOR = {
+    "da ristrutturare": 1.0,
+    "da_ristrutturare": 1.0,
+    "buono": 0.5,
+    "nuovo": 0.15,
+}
+
+DEFAULT_ASSUMPTIONS = {
+    "contingency": 0.10,          # imprevisti sui lavori
+    "purchase_tax_rate": 0.04,    # registro/ipotecaria/catastale (sul catastale, ≈4% del prezzo)
+    "closing_costs_rate": 0.03,   # notaio + agenzia all'acquisto
+    "sale_costs_rate": 0.03,      # agenzia alla vendita
+    "capital_gains_tax": 0.26,    # plusvalenza (vendita entro 5 anni)
+    "rent_yield": 0.055,          # rendimento lordo annuo sul valore
+    "occupancy": 0.92,            # mesi affittati / anno
+    "rent_tax_rate": 0.21,        # cedolare secca
+    "holding_costs_rate": 0.01,   # IMU, condominio, manutenzione (annui sul valore)
+    "loan_to_value": 0.0,         # quota del prezzo finanziata con mutuo
+    "interest_rate": 0.04,        # tasso annuo del mutuo
+    "loan_years": 25,
+    "sale_months": 3,             # mesi per vendere dopo i lavori
+}
+
+DESCRIPTIONS = [
+    "Ristrutturazione cosmetica: tinteggiatura, pavimenti lucidati, impianti base aggiornati",
+    "Ristrutturazione completa: nuovo pavimento, cucina/bagno rinnovati, impianti rifatti, serramenti nuovi",
+    "Ristrutturazione premium: demolizioni, layout ridisegnato, finiture lusso, domotica, certificazioni",
+]
+
+RISKS = [
+    ["Ritardi materiali", "Costi nascosti 5-10%"],
+    ["Sforamenti budget 10-15%", "Ritardi permessi", "Problemi strutturali nascosti"],
+    ["Sforamenti 20%+", "Ritardi significativi", "Mercato limitato", "Difficoltà vendita"],
+]
+
+METRICS = [
+    "cost", "months", "value_after", "cash_invested", "purchase_taxes", "financing_cost",
+    "monthly_rent", "net_rent", "profit_sell", "roi_rent", "roi_sell",
+]
+
+# Le stesse metriche numeriche di RenovationScenario: risposta snella per portafogli grandi
+DEFAULT_METRICS = ["cost", "months", "roi_rent", "roi_sell"]
+
+
+def condition_factors(conditions: Sequence[str]) -> np.ndarray:
+    return np.array([CONDITION_FACTOR.get(" ".join(c.lower().split()), 1.0) for c in conditions])
+
+
+def evaluate(
+    buy_price: Sequence[float],
+    surface: Sequence[float],
+    condition: Optional[Sequence[str]] = None,
+    market_price_sqm: Optional[Sequence[float]] = None,
+    **overrides
+) -> Dict[str, np.ndarray]:
+    """
+    Valuta N immobili: ogni metrica è un array (N, 3), una colonna per scenario.
+
+    `market_price_sqm` (opzionale, NaN dove manca) è il prezzo al mq di
+    immobili già ristrutturati in zona: se presente, il valore finale viene
+    stimato da lì invece che dalla rivalutazione percentuale.
+    """
+    a = {**DEFAULT_ASSUMPTIONS, **overrides}
+
+    price = np.asarray(buy_price, dtype=float)[:, None]
+    sqm = np.asarray(surface, dtype=float)[:, None]
+    factor = condition_factors(condition)[:, None] if condition is not None else np.ones_like(price)
+
+    # Lavori
+    cost = sqm * COST_PER_SQM * (1 + a["contingency"])
+    months = MONTHS
+
+    # Valore dopo i lavori
+    value_after = price * (1 + VALUE_UPLIFT * factor)
+    if market_price_sqm is not None:
+        market = np.asarray(market_price_sqm, dtype=float)[:, None]
+        # Lo scenario basso resta un po' sotto la media di zona, l'alto sopra
+        from_market = sqm * market * np.array([0.95, 1.05, 1.15])
+        value_after = np.where(np.isnan(from_market), value_after, from_market)
+
+    return returns(price, cost, value_after, months, a["occupancy"], a)
+
+
+def returns(
+    price: np.ndarray,
+    cost: np.ndarray,
+    value_after: np.ndarray,
+    months: np.ndarray,
+    occupancy,
+    a: dict
+) -> Dict[str, np.ndarray]:
+    """
+    Conti di acquisto, vendita e affitto su array che fanno broadcast tra loro
+    (usato sia da `evaluate` sia dalla simulazione Monte Carlo in risk.py).
+    """
+    # Acquisto e finanziamento
+    purchase_taxes = price * (a["purchase_tax_rate"] + a["closing_costs_rate"])
+    loan = price * a["loan_to_value"]
+    monthly_rate = a["interest_rate"] / 12
+    n_payments = a["loan_years"] * 12
+    if n_payments <= 0:
+        # Nessun piano di rimborso: nessuna rata (evita la divisione per zero)
+        installment = loan * 0
+    elif monthly_rate > 0:
+        installment = loan * monthly_rate / (1 - (1 + monthly_rate) ** -n_payments)
+    else:
+        installment = loan / n_payments
+    cash_invested = price + purchase_taxes + cost - loan
+
+    # Vendita: interessi e spese di gestione per la durata di lavori + vendita, plusvalenza tassata
+    holding_months = months + a["sale_months"]
+    financing_cost = loan * monthly_rate * holding_months
+    carrying_costs = price * a["holding_costs_rate"] * holding_months / 12
+    sale_costs = value_after * a["sale_costs_rate"]
+    gain = value_after - sale_costs - price - purchase_taxes - cost - financing_cost - carrying_costs
+    profit_sell = gain - np.maximum(gain, 0) * a["capital_gains_tax"]
+
+    # Affitto: rendimento netto annuo sul capitale investito
+    monthly_rent = value_after * a["rent_yield"] * (1 + RENT_PREMIUM) / 12
+    gross_rent = monthly_rent * 12 * occupancy
+    net_rent = (
+        gross_rent * (1 - a["rent_tax_rate"])
+        - value_after * a["holding_costs_rate"]
+        - installment * 12
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi_rent = np.where(cash_invested > 0, net_rent / cash_invested * 100, 0.0)
+        roi_sell = np.where(cash_invested > 0, profit_sell / cash_invested * 100, 0.0)
+
+    shape = np.broadcast_shapes(np.shape(cost), np.shape(value_after), np.shape(months))
+    return {
+        "cost": np.broadcast_to(cost, shape),
+        "months": np.broadcast_to(months, shape),
+        "value_after": np.broadcast_to(value_after, shape),
+        "cash_invested": np.broadcast_to(cash_invested, shape),
+        "purchase_taxes": np.broadcast_to(purchase_taxes, shape),
+        "financing_cost": np.broadcast_to(financing_cost, shape),
+        "monthly_rent": np.broadcast_to(monthly_rent, shape),
+        "net_rent": np.broadcast_to(net_rent, shape),
+        "profit_sell": np.broadcast_to(profit_sell, shape),
+        "roi_rent": np.broadcast_to(roi_rent, shape),
+        "roi_sell": np.broadcast_to(roi_sell, shape),
+    }
+
+
+def best_levels(results: Dict[str, np.ndarray], objective: str = "roi_sell") -> List[str]:
+    """Scenario migliore per ogni immobile secondo `objective` (roi_sell o roi_rent)"""
+    return [LEVELS[i] for i in np.argmax(results[objective], axis=1)]
+
+
+def to_columns(results: Dict[str, np.ndarray], metrics: Optional[Sequence[str]] = None, decimals: int = 2) -> Dict[str, list]:
+    """Metriche come liste di liste [bassa, media, alta] (JSON compatto)"""
+    return {name: np.round(results[name], decimals).tolist() for name in (metrics or DEFAULT_METRICS)}
+
+
+def scenarios_for(buy_price: float, surface: float, condition: str = "da ristrutturare", **overrides) -> List[dict]:
+    """I 3 scenari di un singolo immobile nel formato di RenovationScenario"""
+    results = evaluate([buy_price], [surface], [condition], **overrides)
+    return [
+        {
+            "level": level,
+            "cost": round(float(results["cost"][0, i]), 2),
+            "months": int(results["months"][0, i]),
+            "description": DESCRIPTIONS[i],
+            "roi_rent": round(float(results["roi_rent"][0, i]), 2),
+            "roi_sell": round(float(results["roi_sell"][0, i]), 2),
+            "risks": list(RISKS[i]),
+        }
+        for i, level in enumerate(LEVELS)
+    ]
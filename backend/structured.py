@@ -0,0 +1,154 @@
+"""
+🧩 BIG HOUSE — Output JSON degli agenti letto mentre arriva
+
+L'LLM risponde con un array di oggetti (es. i 3 scenari di ristrutturazione),
+in JSON mode o in mezzo a del testo. ArrayScanner riceve i token dello
+stream e restituisce ogni oggetto dell'array appena si chiude la sua
+parentesi, così la validazione (e l'eventuale riparazione) parte prima che
+la risposta sia finita. Le parentesi nel testo che non aprono un array di
+oggetti vengono ignorate.
+
+Un oggetto non valido non si butta: `field_errors` dice quali campi non
+rispettano il modello pydantic e `repair` chiede all'LLM solo quelli, con lo
+schema dei soli campi da correggere, finché l'oggetto è valido o finiscono i
+tentativi.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+# Errore che riguarda l'oggetto intero (non è un oggetto JSON, ...)
+WHOLE_OBJECT = "__root__"
+
+# (posizione nell'array, oggetto decodificato o None se non è JSON valido, testo grezzo)
+Item = Tuple[int, Optional[Any], str]
+
+
+class ArrayScanner:
+    """Estrae gli oggetti di un array JSON man mano che arrivano i token"""
+
+    def __init__(self):
+        self.items: List[Item] = []
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._capture: Optional[List[str]] = None
+
+    def feed(self, text: str) -> List[Item]:
+        """Consuma un pezzo di testo e ritorna gli oggetti completati in questo pezzo"""
+        completed = []
+        for char in text:
+            if self.done:
+                break
+
+            if self._in_string:
+                if self._capture is not None:
+                    self._capture.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif self._depth == 0:
+                # Fuori dall'array: si aspetta solo la "[" che lo apre
+                if char == "[":
+                    self._depth = 1
+                continue
+            elif char in "[{":
+                if self._depth == 1 and char == "{":
+                    self._capture = []
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    # Array chiuso: se non conteneva oggetti era una parentesi nel testo
+                    self.done = bool(self.items)
+                    continue
+
+            if self._capture is not None:
+                self._capture.append(char)
+                if self._depth == 1:
+                    raw = "".join(self._capture)
+                    self._capture = None
+                    try:
+                        value = json.loads(raw)
+                    except ValueError:
+                        value = None
+                    item = (len(self.items), value, raw)
+                    self.items.append(item)
+                    completed.append(item)
+        return completed
+
+
+def parse_object(text: str) -> Optional[dict]:
+    """Primo oggetto JSON completo nel testo (la risposta intera in JSON mode)"""
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def field_errors(model: Type[BaseModel], value: Any) -> Dict[str, str]:
+    """Campo → errore di validazione (vuoto se l'oggetto è valido)"""
+    if not isinstance(value, dict):
+        return {WHOLE_OBJECT: "non è un oggetto JSON"}
+    try:
+        model(**value)
+        return {}
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors():
+            field = str(error["loc"][0]) if error["loc"] else WHOLE_OBJECT
+            errors.setdefault(field, error["msg"])
+        return errors
+
+
+def schema_for(model: Type[BaseModel], fields: Optional[Sequence[str]] = None) -> str:
+    """JSON Schema del modello, ridotto ai campi indicati"""
+    schema = model.model_json_schema()
+    if fields is None:
+        return json.dumps(schema, ensure_ascii=False)
+    properties = {name: spec for name, spec in schema["properties"].items() if name in fields}
+    return json.dumps(
+        {"type": "object", "properties": properties, "required": list(properties)},
+        ensure_ascii=False
+    )
+
+
+def repair(
+    model: Type[BaseModel],
+    value: dict,
+    ask: Callable[[dict, Dict[str, str]], str],
+    attempts: int = 2
+) -> Tuple[Optional[BaseModel], Dict[str, str]]:
+    """
+    Ripara `value` chiedendo all'LLM solo i campi non validi: `ask(valore,
+    errori)` ritorna la risposta testuale, da cui si prendono i soli campi
+    richiesti. Ritorna l'oggetto validato (o None) e gli ultimi errori.
+    """
+    errors = field_errors(model, value)
+    for _ in range(attempts):
+        if not errors:
+            break
+        reply = parse_object(ask(value, errors)) or {}
+        value = {**value, **{field: reply[field] for field in errors if field in reply}}
+        errors = field_errors(model, value)
+
+    if errors:
+        return None, errors
+    return model(**value), {}
@@ -0,0 +1,28 @@
+"""
+🧪 BIG HOUSE — Fixture comuni dei test
+
+I moduli del backend si importano come in produzione (dalla cartella
+backend/). Ogni test usa un proprio file SQLite temporaneo: bighouse.db non
+viene mai toccato.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool
+
+
+@pytest.fixture
+def db_pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), size=8, name="test")
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def get_db(db_pool):
+    return db_pool.connection
@@ -0,0 +1,60 @@
+import time
+
+from cache import ResultCache, TTLCache, make_key
+
+
+def test_make_key_ignores_trivial_variations():
+    assert make_key("calcola", {"city": "Napoli ", "buy_price": 200000}) == \
+        make_key("calcola", {"city": "napoli", "buy_price": 200000.001})
+    assert make_key("calcola", {"city": "Napoli"}) != make_key("deepresearch", {"city": "Napoli"})
+
+
+def test_result_cache_entries_expire(get_db):
+    cache = ResultCache(get_db, ttl_seconds=0.2)
+    cache.set("calcola", "k", {"roi": 12})
+    assert cache.get("calcola", "k") == {"roi": 12}
+
+    time.sleep(0.3)
+    assert cache.get("calcola", "k") is None
+    assert cache.stats()["namespaces"]["calcola"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_result_cache_evicts_least_recently_used(get_db):
+    cache = ResultCache(get_db, max_entries=2)
+    cache.set("calcola", "a", 1)
+    time.sleep(0.01)
+    cache.set("calcola", "b", 2)
+    time.sleep(0.01)
+    cache.get("calcola", "a")  # "a" torna la più recente
+    time.sleep(0.01)
+    cache.set("calcola", "c", 3)
+
+    assert cache.get("calcola", "a") == 1
+    assert cache.get("calcola", "b") is None
+    assert cache.get("calcola", "c") == 3
+    assert cache.stats()["entries"] == 2
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(ttl_seconds=0.1, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    time.sleep(0.15)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_drops_values_read_before_an_invalidation():
+    cache = TTLCache()
+    epoch = cache.epoch("user@example.com")
+    # Un altro thread modifica l'utente mentre questo legge dal DB
+    cache.invalidate("user@example.com")
+    cache.set("user@example.com", {"plan": "free"}, epoch=epoch)
+    assert cache.get("user@example.com") is None
+
+    cache.set("user@example.com", {"plan": "pro"}, epoch=cache.epoch("user@example.com"))
+    assert cache.get("user@example.com") == {"plan": "pro"}
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import re
+
+from Scraper import CityCrawl
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+class FakeScraper:
+    """Due pagine di risultati dalle fixture; dalla terza in poi nessun annuncio"""
+
+    def __init__(self):
+        self.pages = {}
+        for page, name in ((1, "idealista_napoli_p1.html"), (2, "idealista_roma_p2.html")):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                self.pages[page] = f.read()
+        self.fetched = []
+
+    async def fetch(self, url: str) -> str:
+        match = re.search(r"lista-(\d+)\.htm", url)
+        page = int(match.group(1)) if match else 1
+        self.fetched.append(page)
+        return self.pages.get(page, "")
+
+
+def crawl(cursor=None, limit=None):
+    scraper = FakeScraper()
+
+    async def run():
+        crawl = CityCrawl(scraper, "Napoli", 200000, limit=limit, cursor=cursor)
+        urls = [prop["url"] async for prop in crawl]
+        return urls, crawl.cursor
+
+    urls, next_cursor = asyncio.run(run())
+    return urls, next_cursor, scraper.fetched
+
+
+def test_full_crawl_follows_pagination():
+    urls, cursor, fetched = crawl()
+    assert len(urls) == 56
+    assert len(set(urls)) == 56
+    assert cursor is None
+    assert sorted(set(fetched)) == [1, 2, 3]
+
+
+def test_limit_stops_with_a_resumable_cursor():
+    everything, _, _ = crawl()
+
+    first, cursor, _ = crawl(limit=40)
+    assert first == everything[:40]
+    assert cursor == "2:12"
+
+    rest, cursor, fetched = crawl(cursor=cursor)
+    assert rest == everything[40:]
+    assert cursor is None
+    # La ripresa parte dalla pagina del cursore, senza riscaricare la prima
+    assert 1 not in fetched
+
+
+def test_cursor_at_a_page_boundary():
+    everything, _, _ = crawl()
+
+    first, cursor, _ = crawl(limit=28)
+    rest, _, _ = crawl(cursor=cursor)
+    assert first + rest == everything
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobQueue, JobStatus, QueueFullError
+
+
+def double(payload, emit):
+    emit("status", "calcolo")
+    return {"value": payload["value"] * 2}
+
+
+def fail(payload, emit):
+    raise ValueError("crew esplosa")
+
+
+def wait_then(queue: JobQueue, job_id: str, release: threading.Event):
+    """Attende il job sbloccandolo solo dopo che wait ha preso il suo future"""
+    async def run():
+        waiting = asyncio.ensure_future(queue.wait(job_id))
+        await asyncio.sleep(0)
+        release.set()
+        return await waiting
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def queue(get_db):
+    queue = JobQueue(get_db, max_workers=2, max_pending=10)
+    queue.register("double", double)
+    yield queue
+    queue.shutdown()
+
+
+def test_wait_returns_the_result_and_persists_it(queue):
+    events = []
+    job_id = queue.submit("double", {"value": 21}, "user@example.com", lambda event, data: events.append(event))
+
+    assert asyncio.run(queue.wait(job_id)) == {"value": 42}
+    assert events == ["status", "done"]
+
+    job = queue.get(job_id)
+    assert job["status"] == JobStatus.DONE.value
+    assert job["result"] == {"value": 42}
+    # Job non più in memoria: wait legge dal DB
+    assert asyncio.run(queue.wait(job_id)) == {"value": 42}
+
+
+def test_failures_are_raised_and_recorded(queue):
+    release = threading.Event()
+    queue.register("fail_later", lambda payload, emit: release.wait(5) and fail(payload, emit))
+    job_id = queue.submit("fail_later", {}, "user@example.com")
+    with pytest.raises(ValueError):
+        wait_then(queue, job_id, release)
+    assert queue.get(job_id)["error"] == "crew esplosa"
+    # Job concluso: l'errore arriva dal DB
+    with pytest.raises(RuntimeError):
+        asyncio.run(queue.wait(job_id))
+
+
+def test_unknown_kind_and_full_queue(get_db):
+    release = threading.Event()
+    queue = JobQueue(get_db, max_workers=1, max_pending=2)
+    queue.register("block", lambda payload, emit: release.wait(5) and {})
+    try:
+        with pytest.raises(ValueError):
+            queue.submit("boh", {}, "user@example.com")
+        queue.submit("block", {}, "user@example.com")
+        queue.submit("block", {}, "user@example.com")
+        with pytest.raises(QueueFullError):
+            queue.submit("block", {}, "user@example.com")
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_resume_requeues_unfinished_jobs(get_db):
+    JobQueue(get_db).shutdown()  # crea la tabella
+    # Job rimasti a metà da un processo precedente
+    with get_db() as conn:
+        conn.executemany(
+            "INSERT INTO jobs (id, kind, owner, status, payload, created_at) VALUES (?, 'double', 'u', ?, ?, ?)",
+            [("a", "queued", '{"value": 1}', "2026-01-01T00:00:00"),
+             ("b", "running", '{"value": 2}', "2026-01-01T00:00:01")]
+        )
+        conn.commit()
+
+    queue = JobQueue(get_db)
+    queue.register("double", double)
+    try:
+        assert queue.resume() == 2
+        assert asyncio.run(queue.wait("a")) == {"value": 2}
+        assert asyncio.run(queue.wait("b")) == {"value": 4}
+    finally:
+        queue.shutdown()
+
+
+def test_prune_deletes_only_old_finished_jobs(queue, get_db):
+    recent = queue.submit("double", {"value": 1}, "user@example.com")
+    asyncio.run(queue.wait(recent))
+    old = datetime.utcnow() - timedelta(days=30)
+    with get_db() as conn:
+        conn.executemany(
+            "INSERT INTO jobs (id, kind, owner, status, payload, created_at, finished_at) VALUES (?, 'double', 'u', ?, '{}', ?, ?)",
+            [("old-done", "done", old.isoformat(), old.isoformat()),
+             ("old-failed", "failed", old.isoformat(), old.isoformat()),
+             ("old-queued", "queued", old.isoformat(), None)]
+        )
+        conn.commit()
+
+    assert queue.prune() == 2
+    assert queue.get("old-done") is None
+    assert queue.get("old-failed") is None
+    assert queue.get("old-queued") is not None
+    assert queue.get(recent) is not None
+
+    queue.ttl_seconds = None
+    assert queue.prune() == 0
+
+
+def test_identical_jobs_share_one_run(get_db):
+    release = threading.Event()
+    runs = []
+
+    def slow(payload, emit):
+        runs.append(payload["value"])
+        emit("status", "in corso")
+        release.wait(5)
+        return {"value": payload["value"]}
+
+    def share(payload, leader):
+        return {**leader.result(), "shared": True, "owner": payload["owner"]}
+
+    queue = JobQueue(get_db, max_workers=2)
+    queue.register("slow", slow, share=share)
+    events = []
+    try:
+        leader = queue.submit("slow", {"value": 1, "owner": "a"}, "a", coalesce_key="k")
+        follower = queue.submit("slow", {"value": 1, "owner": "b"}, "b", lambda event, data: events.append(event), coalesce_key="k")
+        other = queue.submit("slow", {"value": 2, "owner": "c"}, "c", coalesce_key="k2")
+        release.set()
+
+        assert asyncio.run(queue.wait(leader)) == {"value": 1}
+        assert asyncio.run(queue.wait(follower)) == {"value": 1, "shared": True, "owner": "b"}
+        assert asyncio.run(queue.wait(other)) == {"value": 2}
+        assert sorted(runs) == [1, 2]
+        assert events[-1] == "done"
+        assert queue.get(follower)["status"] == JobStatus.DONE.value
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_followers_get_the_leader_error(get_db):
+    release = threading.Event()
+
+    def broken(payload, emit):
+        release.wait(5)
+        raise ValueError("crew esplosa")
+
+    queue = JobQueue(get_db)
+    queue.register("broken", broken, share=lambda payload, leader: leader.result())
+    try:
+        queue.submit("broken", {}, "a", coalesce_key="k")
+        follower = queue.submit("broken", {}, "b", coalesce_key="k")
+        with pytest.raises(ValueError):
+            wait_then(queue, follower, release)
+        assert queue.get(follower)["status"] == JobStatus.FAILED.value
+    finally:
+        queue.shutdown()
+
+
+def test_no_coalescing_without_key_or_after_the_leader_finished(queue):
+    first = queue.submit("double", {"value": 1}, "a", coalesce_key="k")
+    asyncio.run(queue.wait(first))
+    # "double" non ha `share`: la chiave viene ignorata
+    second = queue.submit("double", {"value": 1}, "b", coalesce_key="k")
+    assert asyncio.run(queue.wait(second)) == {"value": 2}
@@ -0,0 +1,88 @@
+import pytest
+
+from listings import ListingStore, canonical_url
+
+
+def listing(n: int, price: int, **fields) -> dict:
+    return {
+        "title": f"Appartamento {n}",
+        "price": price,
+        "surface": 80,
+        "zone": "Vomero",
+        "url": f"https://www.idealista.it/immobile/{n}/",
+        "price_per_sqm": price // 80,
+        "source": "idealista",
+        **fields,
+    }
+
+
+@pytest.fixture
+def store(get_db):
+    return ListingStore(get_db, stale_after_seconds=3600)
+
+
+def test_canonical_url():
+    assert canonical_url("HTTPS://www.Idealista.it/immobile/1/?utm=x#foto") == "https://www.idealista.it/immobile/1"
+
+
+def test_upsert_counts_and_deduplicates(store):
+    first = store.upsert("Napoli", [listing(1, 150000), listing(2, 180000)], max_price=200000)
+    assert first == {"inserted": 2, "updated": 0, "unchanged": 0, "removed": 0}
+
+    # Stesso annuncio con URL diverso solo per query string: una riga sola
+    again = listing(1, 150000, url="https://www.idealista.it/immobile/1?ref=home")
+    second = store.upsert("Napoli", [again, listing(2, 180000)], max_price=200000)
+    assert second == {"inserted": 0, "updated": 0, "unchanged": 2, "removed": 0}
+    assert store.stats()["listings"] == 2
+
+
+def test_price_change_goes_to_history(store):
+    store.upsert("Napoli", [listing(1, 150000)])
+    store.upsert("Napoli", [listing(1, 140000)])
+
+    history = store.history("https://www.idealista.it/immobile/1")
+    assert history["price"] == 140000
+    assert [entry["price"] for entry in history["price_history"]] == [150000]
+    assert history["first_seen"] <= history["last_seen"]
+
+
+def test_listings_missing_from_the_crawl_are_removed(store):
+    store.upsert("Napoli", [listing(1, 150000), listing(2, 180000)])
+    counts = store.upsert("Napoli", [listing(2, 180000)])
+
+    assert counts["removed"] == 1
+    assert [p["url"] for p in store.search("Napoli")] == ["https://www.idealista.it/immobile/2"]
+
+
+def test_empty_crawl_keeps_the_archive(store):
+    store.upsert("Napoli", [listing(1, 150000)])
+    assert store.upsert("Napoli", [])["removed"] == 0
+    assert len(store.search("Napoli")) == 1
+
+
+def test_search_filters(store):
+    store.upsert("Napoli", [
+        listing(1, 120000, surface=60, zone="Vomero - Arenella"),
+        listing(2, 180000, surface=95, zone="Chiaia"),
+        listing(3, 250000, surface=110, zone="Vomero"),
+    ])
+    prices = lambda **filters: sorted(p["price"] for p in store.search("napoli", **filters))
+
+    assert prices(max_price=200000) == [120000, 180000]
+    assert prices(min_price=150000) == [180000, 250000]
+    assert prices(min_surface=90) == [180000, 250000]
+    assert prices(zone="Vomero") == [120000, 250000]
+    assert store.search("Roma") == []
+
+
+def test_staleness_follows_budget_and_age(get_db):
+    store = ListingStore(get_db, stale_after_seconds=3600)
+    assert store.is_stale("Napoli", 200000)
+
+    store.upsert("Napoli", [listing(1, 150000)], max_price=200000)
+    assert not store.is_stale("Napoli", 150000)
+    assert store.is_stale("Napoli", 300000)
+    assert store.is_stale("Napoli", None)
+
+    expired = ListingStore(get_db, stale_after_seconds=0)
+    assert expired.is_stale("Napoli", 150000)
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from queryparser import QueryParser
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAZETTEER_DIR = os.path.join(BACKEND, "data")
+
+with open(os.path.join(BACKEND, "fixtures", "queries.jsonl"), encoding="utf-8") as f:
+    QUERIES = [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return QueryParser(GAZETTEER_DIR)
+
+
+@pytest.mark.parametrize("case", QUERIES, ids=[case["query"] for case in QUERIES])
+def test_fixture_queries(parser, case):
+    params = parser.parse(case["query"])
+    assert {field: params[field] for field in case["expected"]} == case["expected"]
+
+
+def test_city_zone_and_price(parser):
+    params = parser.parse("Trilocale al Vomero, max 250k, almeno 80 mq, da ristrutturare")
+    assert params["city"] == "Napoli"
+    assert params["province"] == "NA"
+    assert params["zone"] == "Vomero"
+    assert params["max_price"] == 250000
+    assert params["min_surface"] == 80
+
+
+def test_longest_place_name_wins(parser):
+    assert parser.parse("casa a Reggio Emilia sotto i 180mila euro")["city"] == "Reggio Emilia"
+
+
+def test_price_range(parser):
+    params = parser.parse("Roma tra 150 e 200 mila euro")
+    assert (params["min_price"], params["max_price"]) == (150000, 200000)
+
+
+def test_unknown_city_without_default(parser):
+    params = parser.parse("bilocale a Trallallero, 120k")
+    assert params["city"] is None
+    assert params["max_price"] == 120000
+
+
+def test_unknown_city_falls_back_to_the_default():
+    parser = QueryParser(GAZETTEER_DIR, default_city="Napoli")
+    params = parser.parse("bilocale a Trallallero, 120k")
+    assert (params["city"], params["province"], params["region"]) == ("Napoli", "NA", "Campania")
+    assert params["max_price"] == 120000
+
+    # Un comune riconosciuto ha sempre la precedenza
+    assert parser.parse("Torino, 200k")["city"] == "Torino"
@@ -0,0 +1,102 @@
+import threading
+from datetime import date
+
+import pytest
+
+from quota import FeatureNotInPlan, QuotaEngine, QuotaExceeded
+
+
+@pytest.fixture
+def quota(get_db):
+    # Solo le colonne della tabella users che servono alle quote
+    with get_db() as conn:
+        conn.execute("""
+            CREATE TABLE users (
+                email TEXT PRIMARY KEY,
+                plan TEXT DEFAULT 'free',
+                usage_date TEXT,
+                deepresearch_count INTEGER DEFAULT 0,
+                calcola_count INTEGER DEFAULT 0
+            )
+        """)
+        conn.executemany("INSERT INTO users (email, plan) VALUES (?, ?)", [
+            ("free@example.com", "free"),
+            ("pro@example.com", "pro"),
+            ("plus@example.com", "plus"),
+        ])
+        conn.commit()
+    return QuotaEngine(get_db)
+
+
+def used(get_db, email: str, column: str = "deepresearch_count") -> int:
+    with get_db() as conn:
+        return conn.execute(f"SELECT {column} FROM users WHERE email = ?", (email,)).fetchone()[0]
+
+
+def test_concurrent_reservations_never_exceed_the_plan_limit(quota, get_db):
+    # Piano pro: 2 Deep Research al giorno, 6 richieste nello stesso istante
+    barrier = threading.Barrier(6)
+    outcomes = []
+
+    def request():
+        barrier.wait()
+        try:
+            quota.reserve("pro@example.com", "deepresearch")
+            outcomes.append("ok")
+        except QuotaExceeded:
+            outcomes.append("exceeded")
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ["exceeded"] * 4 + ["ok"] * 2
+    assert used(get_db, "pro@example.com") == 2
+
+
+def test_feature_not_in_plan(quota):
+    with pytest.raises(FeatureNotInPlan):
+        quota.reserve("free@example.com", "calcola")
+
+
+def test_unlimited_plan(quota):
+    for _ in range(5):
+        reservation = quota.reserve("plus@example.com", "calcola")
+    assert reservation["used"] == 5
+    assert QuotaEngine.remaining(reservation) == "Unlimited"
+
+
+def test_new_day_resets_the_counters(quota, get_db):
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE users SET usage_date = '2000-01-01', deepresearch_count = 2, calcola_count = 2 WHERE email = ?",
+            ("pro@example.com",)
+        )
+        conn.commit()
+
+    reservation = quota.reserve("pro@example.com", "deepresearch")
+    assert reservation["day"] == str(date.today())
+    assert reservation["used"] == 1
+    assert used(get_db, "pro@example.com", "calcola_count") == 0
+
+
+def test_refund_is_idempotent(quota, get_db):
+    first = quota.reserve("pro@example.com", "deepresearch")
+    quota.reserve("pro@example.com", "deepresearch")
+
+    quota.refund(first)
+    quota.refund(first)
+    assert used(get_db, "pro@example.com") == 1
+    assert first["used"] == 0
+
+    # L'unità restituita si può riservare di nuovo, ma una sola volta
+    quota.reserve("pro@example.com", "deepresearch")
+    with pytest.raises(QuotaExceeded):
+        quota.reserve("pro@example.com", "deepresearch")
+
+
+def test_refund_without_reservation_is_a_no_op(quota):
+    quota.refund(None)
+    assert QuotaEngine.remaining(None) is None
@@ -0,0 +1,27 @@
+import risk
+import roi
+
+
+def test_simulation_is_reproducible_per_property():
+    first = risk.simulate(200000, 85, draws=2000)
+    assert first == risk.simulate(200000, 85, draws=2000)
+    assert first != risk.simulate(210000, 85, draws=2000)
+    assert [s["level"] for s in first] == roi.LEVELS
+
+
+def test_percentiles_are_ordered():
+    for scenario in risk.simulate(200000, 85, draws=2000):
+        for metric in ("roi_sell", "roi_rent"):
+            p = scenario[metric]
+            assert p["p10"] <= p["p50"] <= p["p90"]
+        assert 0 <= scenario["prob_loss"] <= 1
+        assert scenario["cost_p50"] <= scenario["cost_p90"]
+
+
+def test_simulation_starts_from_the_given_scenarios():
+    cost = [10000, 50000, 200000]
+    months = [1, 6, 12]
+    for scenario, base_cost, base_months in zip(risk.simulate(200000, 85, draws=2000, cost=cost, months=months), cost, months):
+        # Sforamenti e ritardi sono sempre ≥ 0: la simulazione parte dalla stima e sale
+        assert base_cost <= scenario["cost_p50"] < base_cost * 1.5
+        assert base_months <= scenario["months_p50"] < base_months + 4
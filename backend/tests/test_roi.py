@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import roi
+
+
+def test_evaluate_shapes_and_scenario_order():
+    results = roi.evaluate([200000, 150000], [85, 60], ["da ristrutturare", "buono"])
+    for metric in roi.METRICS:
+        assert results[metric].shape == (2, 3)
+    # Più lavori, più costo e più tempo
+    assert np.all(np.diff(results["cost"], axis=1) > 0)
+    assert np.all(np.diff(results["months"], axis=1) > 0)
+
+
+def test_scenarios_for_matches_evaluate():
+    scenarios = roi.scenarios_for(200000, 85)
+    results = roi.evaluate([200000], [85])
+    assert [s["level"] for s in scenarios] == roi.LEVELS
+    assert [s["roi_sell"] for s in scenarios] == [round(float(v), 2) for v in results["roi_sell"][0]]
+
+
+@pytest.mark.parametrize("interest_rate", [0.0, 0.04])
+def test_zero_length_loan_has_no_installment(interest_rate):
+    with np.errstate(all="raise"):
+        results = roi.evaluate(
+            [200000], [85], loan_to_value=0.8, loan_years=0, interest_rate=interest_rate
+        )
+    assert np.all(np.isfinite(results["roi_rent"]))
+    assert np.all(np.isfinite(results["roi_sell"]))
+
+    # Senza rate il rendimento da affitto è quello di un acquisto senza mutuo sullo stesso capitale
+    no_loan = roi.evaluate([200000], [85], loan_to_value=0.8, loan_years=0, interest_rate=0.0)
+    assert np.allclose(results["net_rent"], no_loan["net_rent"])
+
+
+def test_zero_interest_loan_is_repaid_linearly():
+    results = roi.evaluate([200000], [85], loan_to_value=0.5, loan_years=10, interest_rate=0.0)
+    without = roi.evaluate([200000], [85], loan_to_value=0.5, loan_years=10, interest_rate=0.0, rent_yield=0.0)
+    # Rata annua = 100000 / 10 anni, tolta dal netto dell'affitto
+    assert np.all(np.isfinite(results["roi_rent"]))
+    assert np.allclose(
+        results["net_rent"] - without["net_rent"],
+        results["monthly_rent"] * 12 * 0.92 * (1 - 0.21)
+    )
+    assert np.allclose(without["net_rent"], -without["value_after"] * 0.01 - 10000)
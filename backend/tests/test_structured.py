@@ -0,0 +1,112 @@
+import json
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+from structured import WHOLE_OBJECT, ArrayScanner, field_errors, parse_object, repair, schema_for
+
+
+class Scenario(BaseModel):
+    level: Literal["bassa", "media", "alta"]
+    cost: float = Field(ge=0)
+    months: int = Field(ge=0)
+    risks: List[str]
+
+
+SCENARIOS = [
+    {"level": "bassa", "cost": 25000, "months": 2, "risks": ["Costi nascosti {5-10%}"]},
+    {"level": "media", "cost": 60000, "months": 4, "risks": ["Ritardi \"permessi\" [comune]"]},
+    {"level": "alta", "cost": 110000, "months": 8, "risks": []},
+]
+
+
+def scan(chunks):
+    scanner = ArrayScanner()
+    items = []
+    for chunk in chunks:
+        items.extend(scanner.feed(chunk))
+    return scanner, items
+
+
+def test_objects_arrive_one_by_one_on_split_tokens():
+    text = json.dumps(SCENARIOS, ensure_ascii=False)
+    scanner = ArrayScanner()
+    completed_at = []
+    for position, char in enumerate(text):
+        for item in scanner.feed(char):
+            completed_at.append(position)
+            assert item[1] == SCENARIOS[item[0]]
+
+    assert len(completed_at) == 3
+    # Il primo oggetto è disponibile prima della fine della risposta
+    assert completed_at[0] < len(text) // 2
+    assert scanner.done
+
+
+def test_brackets_inside_strings_and_surrounding_text():
+    text = (
+        "Ecco gli scenari [in formato JSON]:\n"
+        + json.dumps(SCENARIOS, ensure_ascii=False, indent=2)
+        + "\nNota: [altro testo] {non è un oggetto}"
+    )
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    scanner, items = scan(chunks)
+
+    assert [value for _, value, _ in items] == SCENARIOS
+    assert scanner.done
+
+
+def test_escaped_quotes_and_invalid_objects():
+    scanner, items = scan(['[{"level": "bassa", "note": "un \\"quoted\\" }"}, ', '{"level": bassa}]'])
+    assert items[0][1] == {"level": "bassa", "note": 'un "quoted" }'}
+    assert items[1][1] is None
+    assert items[1][2] == '{"level": bassa}'
+
+
+def test_parse_object_skips_text_and_non_objects():
+    assert parse_object('Risposta: {"cost": 100} e altro') == {"cost": 100}
+    assert parse_object("{non json} poi {\"months\": 3}") == {"months": 3}
+    assert parse_object("nessun oggetto") is None
+
+
+def test_field_errors_per_field():
+    errors = field_errors(Scenario, {"level": "enorme", "cost": -1, "months": 2, "risks": []})
+    assert set(errors) == {"level", "cost"}
+    assert field_errors(Scenario, SCENARIOS[0]) == {}
+    assert set(field_errors(Scenario, "testo")) == {WHOLE_OBJECT}
+
+
+def test_schema_for_selected_fields():
+    schema = json.loads(schema_for(Scenario, ["cost"]))
+    assert list(schema["properties"]) == ["cost"]
+    assert schema["required"] == ["cost"]
+
+
+def test_repair_asks_only_for_invalid_fields():
+    asked = []
+
+    def ask(value, errors):
+        asked.append(set(errors))
+        # L'LLM corregge il costo e prova (inutilmente) a cambiare anche il livello
+        return 'Correzione: {"cost": 30000, "level": "alta"}'
+
+    broken = {**SCENARIOS[0], "cost": -5}
+    scenario, errors = repair(Scenario, broken, ask)
+
+    assert errors == {}
+    assert asked == [{"cost"}]
+    assert scenario.cost == 30000
+    assert scenario.level == "bassa"
+
+
+def test_repair_gives_up_after_the_attempts():
+    calls = []
+
+    def ask(value, errors):
+        calls.append(1)
+        return "non so"
+
+    scenario, errors = repair(Scenario, {**SCENARIOS[0], "months": -1}, ask, attempts=2)
+    assert scenario is None
+    assert set(errors) == {"months"}
+    assert len(calls) == 2
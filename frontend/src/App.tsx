@@ -447,7 +447,7 @@ export default function App() {
     setDeepLoading(true);
     setDeepResult("");
     try {
-      const res = await fetch(`${API_BASE}/features/deep-research`, {
+      const res = await fetch(`${API_BASE}/features/deep-research/stream`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -455,9 +455,38 @@ export default function App() {
         },
         body: JSON.stringify({ query: dq })
       });
-      if (res.ok) {
-        const data = await res.json();
-        setDeepResult(data.result);
+      if (res.ok && res.body) {
+        // Server-Sent Events: mostra i risultati parziali man mano che arrivano
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let partial = "";
+        let finished = false;
+        while (!finished) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const frames = buffer.split("\n\n");
+          buffer = frames.pop() || "";
+          for (const frame of frames) {
+            const event = frame.match(/^event: (.*)$/m)?.[1];
+            const raw = frame.match(/^data: (.*)$/m)?.[1];
+            if (!event || !raw) continue;
+            const data = JSON.parse(raw);
+            if (event === "task_started") {
+              setDeepResult(partial || `${t.loading} ${data.agent}`);
+            } else if (event === "token") {
+              partial += data.text;
+              setDeepResult(partial);
+            } else if (event === "done") {
+              setDeepResult(data.result);
+              finished = true;
+            } else if (event === "error") {
+              setDeepResult(`${t.error}: ${data.detail}`);
+              finished = true;
+            }
+          }
+        }
         await fetchUser();
       } else if (res.status === 403) {
         setShowUpg(true);